@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+批量生成剪映草稿：一次读取多份 Coze JSON 数据，在进程池中并行构建
+
+- 输入：JSONL 文件（每行一份数据）、单个 JSON 文件、或包含 *.json / *.jsonl 的目录（如 dataSource/）
+- 进程池：每个进程只导入一次 pyJianYingDraft，进程内再并发下载素材；所有进程共享同一个素材缓存
+- 每份数据的输出写入单独的日志文件，单份失败不会中断整批，最后汇总成功 / 失败报告
+
+用法: python batch_draft.py <JSONL文件|目录> [--workers N] [--fetch-workers N] [--report report.json]
+"""
+import contextlib
+import json
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import coze_draft
+
+# ================= 配置 =================
+
+# 构建进程数（默认 = CPU 核数，可通过环境变量 COZE_BATCH_WORKERS 覆盖）
+BATCH_WORKERS = int(os.environ.get("COZE_BATCH_WORKERS", "0")) or (os.cpu_count() or 1)
+# 所有进程合计的素材并发下载数，按进程数均分（每个进程至少 2 个）
+BATCH_FETCH_BUDGET = int(os.environ.get("COZE_BATCH_FETCH_BUDGET", "16"))
+# 每份数据的构建日志目录
+BATCH_LOG_DIR = coze_draft.SCRIPT_DIR / "logs" / "batch"
+
+
+def iter_payloads(source: Path):
+    """
+    逐份读出批量输入。
+
+    Yields:
+        (来源标签, 数据 dict 或 None, 解析错误信息或 None)
+        解析失败的条目也会产出（数据为 None），由调用方记为失败，不中断整批
+    """
+    if source.is_dir():
+        files = sorted(p for p in source.iterdir() if p.suffix in (".json", ".jsonl"))
+    else:
+        files = [source]
+
+    for path in files:
+        if path.suffix == ".jsonl":
+            with open(path, "r", encoding="utf-8") as f:
+                for lineno, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    label = f"{path.name}:{lineno}"
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield label, None, f"JSON 解析失败: {e}"
+                        continue
+                    yield label, data, None if isinstance(data, dict) else "数据不是 JSON 对象"
+        else:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                yield path.name, None, f"读取失败: {e}"
+                continue
+            yield path.name, data, None if isinstance(data, dict) else "数据不是 JSON 对象"
+
+
+def _unique_names(payloads) -> list[str]:
+    """预先生成草稿名；同一秒内同主题的数据会重名，追加序号避免互相覆盖"""
+    names = []
+    seen = {}
+    for _, data, _ in payloads:
+        if data is None:
+            names.append(None)
+            continue
+        name = coze_draft.generate_draft_title(data)
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}~{seen[name]}")
+    return names
+
+
+def _build_one(data: dict, project_name: str, fetch_workers: int, log_path: str) -> dict:
+    """子进程入口：构建一份草稿，输出重定向到日志文件"""
+    start = time.time()
+    with open(log_path, "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            result = coze_draft.build_draft(data, fetch_workers=fetch_workers, project_name=project_name)
+            result["ok"] = True
+        except Exception as e:
+            traceback.print_exc()
+            result = {"ok": False, "name": project_name, "error": f"{type(e).__name__}: {e}"}
+            # 清理本进程失败构建留下的临时目录（每个进程同一时间只构建一份草稿）
+            for staging in (coze_draft.SCRIPT_DIR / "temp").glob(f"{os.getpid()}_*"):
+                shutil.rmtree(str(staging), ignore_errors=True)
+    result["seconds"] = round(time.time() - start, 2)
+    return result
+
+
+def run_batch(source: Path, workers: int = None, fetch_workers: int = None) -> list[dict]:
+    """
+    批量构建草稿。
+
+    Args:
+        source: JSONL 文件 / JSON 文件 / 目录
+        workers: 构建进程数（None 表示 min(BATCH_WORKERS, 数据份数)）
+        fetch_workers: 每个进程的素材并发数（None 表示按 BATCH_FETCH_BUDGET 均分）
+
+    Returns:
+        与输入顺序一致的结果列表，每项含 source / ok / name / error / log 等字段
+    """
+    payloads = list(iter_payloads(source))
+    names = _unique_names(payloads)
+    results = [None] * len(payloads)
+    valid = [i for i, (_, data, _) in enumerate(payloads) if data is not None]
+
+    for i, (label, data, error) in enumerate(payloads):
+        if data is None:
+            results[i] = {"source": label, "ok": False, "name": None, "error": error}
+
+    if not valid:
+        return results
+
+    workers = max(1, min(workers or BATCH_WORKERS, len(valid)))
+    fetch_workers = fetch_workers or max(2, BATCH_FETCH_BUDGET // workers)
+    BATCH_LOG_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"批量构建 {len(valid)} 份草稿 (进程={workers}, 每进程并发下载={fetch_workers})")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for i in valid:
+            label, data, _ = payloads[i]
+            log_path = BATCH_LOG_DIR / f"{names[i]}.log"
+            futures[pool.submit(_build_one, data, names[i], fetch_workers, str(log_path))] = (i, log_path)
+
+        done = 0
+        for future in as_completed(futures):
+            i, log_path = futures[future]
+            label = payloads[i][0]
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # 子进程异常退出（如被 OOM kill），整个进程池不可用，剩余任务都会落到这里
+                result = {"ok": False, "name": names[i], "error": f"进程池异常: {e}"}
+            except Exception as e:
+                result = {"ok": False, "name": names[i], "error": f"{type(e).__name__}: {e}"}
+            result["source"] = label
+            result["log"] = str(log_path)
+            results[i] = result
+
+            done += 1
+            status = "OK  " if result["ok"] else "FAIL"
+            detail = result.get("path") if result["ok"] else result.get("error")
+            print(f"  [{done}/{len(valid)}] {status} {label} - {detail}")
+
+    return results
+
+
+def print_report(results: list[dict], elapsed: float):
+    ok = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    print(f"\n【批量结果】 {len(ok)} 成功 / {len(failed)} 失败, 用时 {elapsed:.1f}s")
+    for r in failed:
+        print(f"  FAIL {r['source']}: {r['error']}")
+        if r.get("log"):
+            print(f"       日志: {r['log']}")
+
+
+if __name__ == "__main__":
+    usage = f"用法: {sys.argv[0]} <JSONL文件|目录> [--workers N] [--fetch-workers N] [--report report.json]"
+    source = None
+    workers = None
+    fetch_workers = None
+    report_path = None
+
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--workers":
+                workers = int(args[i + 1])
+            elif arg == "--fetch-workers":
+                fetch_workers = int(args[i + 1])
+            elif arg == "--report":
+                report_path = Path(args[i + 1])
+            elif not arg.startswith("--") and (i == 0 or args[i - 1] not in ("--workers", "--fetch-workers", "--report")):
+                source = Path(arg)
+    except (ValueError, IndexError):
+        print(usage)
+        sys.exit(1)
+
+    if source is None or not source.exists():
+        print(usage)
+        sys.exit(1)
+    if not coze_draft.TEMPLATE_DIR.exists():
+        print(f"错误: 模板目录不存在: {coze_draft.TEMPLATE_DIR}")
+        sys.exit(1)
+    if not coze_draft.JIANYING_DRAFT_ROOT.exists():
+        print(f"错误: 剪映草稿目录不存在: {coze_draft.JIANYING_DRAFT_ROOT}")
+        sys.exit(1)
+
+    start = time.time()
+    results = run_batch(source, workers=workers, fetch_workers=fetch_workers)
+    print_report(results, time.time() - start)
+
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入: {report_path}")
+
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
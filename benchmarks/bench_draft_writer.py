@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+草稿写入基准：对比旧流程（save + copy2 + 移动后回读替换）与 draft_writer 的写入耗时和文件大小
+
+每个规模构建一个含 N 个图片段 + N 个音频段 + N 条字幕的草稿，各方案重复多次取最快值。
+
+用法: python benchmarks/bench_draft_writer.py [--sizes 10,100,1000] [--repeat 5]
+"""
+import copy
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pyJianYingDraft as draft
+from pyJianYingDraft import ScriptFile, TextSegment, TextStyle, trange
+
+import draft_writer
+from stub_media_server import make_audio, make_png
+
+SEGMENT_US = 2_000_000
+
+
+def build_script(n: int, media_dir: Path) -> ScriptFile:
+    """构建一个 n 段的草稿（素材只探测一次，其余复制后换 id）"""
+    png = media_dir / "image.png"
+    wav = media_dir / "audio.mp3"
+    png.write_bytes(make_png(1))
+    wav.write_bytes(make_audio(SEGMENT_US / 1_000_000))
+    video_proto = draft.VideoMaterial(str(png))
+    audio_proto = draft.AudioMaterial(str(wav))
+
+    script = ScriptFile(1080, 1920)
+    script.add_track(draft.TrackType.video, "images")
+    script.add_track(draft.TrackType.audio, "audios")
+    script.add_track(draft.TrackType.text, "subtitles")
+    style = TextStyle(size=8.0, align=1, auto_wrapping=True)
+    for i in range(n):
+        video = copy.copy(video_proto)
+        video.material_id = uuid.uuid4().hex
+        video.path = str(media_dir / f"image_{i}.png")
+        audio = copy.copy(audio_proto)
+        audio.material_id = uuid.uuid4().hex
+        audio.path = str(media_dir / f"audio_{i}.mp3")
+        span = trange(i * SEGMENT_US, SEGMENT_US)
+        script.add_segment(draft.VideoSegment(video, span), "images")
+        script.add_segment(draft.AudioSegment(audio, span), "audios")
+        script.add_segment(TextSegment(f"第 {i + 1} 条字幕 caption {i + 1}", span, style=style), "subtitles")
+    return script
+
+
+def legacy_write(script: ScriptFile, project: Path, final: Path):
+    """旧流程：save() → copy2 → 移动 → 回读两个文件做字符串替换 → 重写"""
+    content_file = project / "draft_content.json"
+    script.save_path = str(content_file)
+    script.save()
+    shutil.copy2(str(content_file), str(project / "draft_info.json"))
+    for name in ("draft_content.json", "draft_info.json"):
+        fp = project / name
+        text = fp.read_text(encoding="utf-8").replace(str(final), str(final))
+        fp.write_text(text, encoding="utf-8")
+
+
+def bench(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes, repeat):
+    variants = [
+        ("legacy save+copy+rewrite", None),
+        ("writer json indent", dict(compact=False, backend="json")),
+        ("writer json compact", dict(compact=True, backend="json")),
+    ]
+    if draft_writer.orjson is not None:
+        variants += [
+            ("writer orjson indent", dict(compact=False, backend="orjson")),
+            ("writer orjson compact", dict(compact=True, backend="orjson")),
+        ]
+    else:
+        print("（未安装 orjson，跳过 orjson 方案）")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for n in sizes:
+            media_dir = tmp / f"media_{n}"
+            media_dir.mkdir()
+            script = build_script(n, media_dir)
+            project = tmp / f"draft_{n}"
+            project.mkdir()
+            print(f"\n{n} 段 (图片 / 音频 / 字幕各 {n} 段)")
+            print(f"  {'方案':<28}{'耗时(ms)':>10}{'单文件(KB)':>12}")
+            for label, kwargs in variants:
+                if kwargs is None:
+                    seconds = bench(lambda: legacy_write(script, project, project), repeat)
+                else:
+                    seconds = bench(lambda: draft_writer.write_draft(script, project, **kwargs), repeat)
+                size = (project / "draft_content.json").stat().st_size
+                print(f"  {label:<28}{seconds * 1000:>10.2f}{size / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    sizes = [10, 100, 1000]
+    repeat = 5
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--sizes":
+                sizes = [int(x) for x in args[i + 1].split(",")]
+            elif arg == "--repeat":
+                repeat = int(args[i + 1])
+    except (ValueError, IndexError):
+        print(f"用法: {sys.argv[0]} [--sizes 10,100,1000] [--repeat 5]")
+        sys.exit(1)
+    main(sizes, repeat)
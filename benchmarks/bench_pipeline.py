@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+草稿生成全流程基准：合成 Coze 数据 + 本地桩素材服务器 + 临时剪映草稿目录
+
+场景:
+    cold     空缓存、新连接：全部素材从桩服务器下载
+    warm     沿用 cold 的缓存：素材全部命中缓存
+    partial  空缓存，桩服务器让一部分 URL 固定返回 500：走重试与兜底链
+
+每个场景报告总耗时、build_draft 各阶段耗时（取多次运行的中位数）、峰值内存（tracemalloc，单独一次运行测量）、
+缓存命中与连接复用。结果可保存为基线（benchmarks/baselines.json），之后用 --compare 对比，超过阈值视为回归。
+
+用法:
+    python benchmarks/bench_pipeline.py [--images 20] [--latency 0.05] [--fail-rate 0.2] [--retries 1]
+                                        [--repeat 3] [--json out.json] [--save-baseline] [--compare]
+                                        [--baseline benchmarks/baselines.json] [--threshold 0.25]
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import coze_draft
+import http_pool
+import media_cache
+from stub_media_server import make_payload, start_stub_server
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCH_DIR / "baselines.json"
+# 回归判定：比基线慢 threshold 以上，且绝对差值超过噪声下限（秒）
+REGRESSION_THRESHOLD = 0.25
+REGRESSION_NOISE_FLOOR = 0.05
+
+
+def run_scenario(payload: dict, draft_root: Path, cache_dir: Path, fresh_connections: bool,
+                 trace_memory: bool = False) -> dict:
+    """构建一次草稿，返回耗时 / 统计（构建输出不打印）"""
+    coze_draft.JIANYING_DRAFT_ROOT = draft_root
+    media_cache.CACHE_DIR = cache_dir
+    if fresh_connections:
+        http_pool.close_session()
+        http_pool.reset_circuits()
+
+    conn_before = http_pool.connection_stats()
+    cache_before = media_cache.cache_stats()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = coze_draft.build_draft(payload)
+    total = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    conn = http_pool.diff_stats(conn_before, http_pool.connection_stats())
+    cache = media_cache.diff_stats(cache_before, media_cache.cache_stats())
+    return {
+        "total": total,
+        "timings": result["timings"],
+        "peak_mem_mb": peak / 1024 / 1024 if peak is not None else None,
+        "cache_hits": cache["hits"],
+        "cache_misses": cache["misses"],
+        "requests": conn["requests"],
+        "new_connections": conn["new_connections"],
+        "retries": conn["retries"],
+        "images": result["images"],
+        "audios": result["audios"],
+    }
+
+
+def summarize(runs: list[dict], memory_run: dict) -> dict:
+    """多次运行取中位数，峰值内存来自单独的 tracemalloc 运行"""
+    phases = runs[0]["timings"].keys()
+    summary = {
+        "total": round(statistics.median(r["total"] for r in runs), 4),
+        "timings": {p: round(statistics.median(r["timings"][p] for r in runs), 4) for p in phases},
+        "peak_mem_mb": round(memory_run["peak_mem_mb"], 2),
+        "runs": len(runs),
+    }
+    for key in ("cache_hits", "cache_misses", "requests", "new_connections", "retries", "images", "audios"):
+        summary[key] = runs[-1][key]
+    return summary
+
+
+def run_benchmarks(images: int, latency: float, fail_rate: float, repeat: int) -> dict:
+    """依次运行 cold / warm / partial 场景"""
+    ok_server, ok_url = start_stub_server(latency=latency)
+    bad_server, bad_url = start_stub_server(latency=latency, fail_rate=fail_rate)
+    work = Path(tempfile.mkdtemp(prefix="coze_bench_"))
+    draft_root = work / "drafts"
+    draft_root.mkdir()
+    scenarios = {}
+    try:
+        cold_runs, warm_runs, partial_runs = [], [], []
+        for i in range(repeat + 1):
+            # 最后一轮只用于测量峰值内存（tracemalloc 会拖慢运行，不计入耗时）
+            trace = i == repeat
+            cache_dir = work / f"cache_{i}"
+            cold = run_scenario(make_payload(ok_url, images, topic="cold"), draft_root, cache_dir, True, trace)
+            warm = run_scenario(make_payload(ok_url, images, topic="warm"), draft_root, cache_dir, False, trace)
+            partial = run_scenario(make_payload(bad_url, images, topic="partial"), draft_root,
+                                   work / f"cache_partial_{i}", True, trace)
+            if trace:
+                scenarios["cold"] = summarize(cold_runs, cold)
+                scenarios["warm"] = summarize(warm_runs, warm)
+                scenarios["partial"] = summarize(partial_runs, partial)
+            else:
+                cold_runs.append(cold)
+                warm_runs.append(warm)
+                partial_runs.append(partial)
+            # 草稿按 主题~时间戳 命名，清空草稿目录避免同一秒内的运行互相覆盖
+            for d in draft_root.iterdir():
+                shutil.rmtree(d, ignore_errors=True)
+    finally:
+        ok_server.shutdown()
+        bad_server.shutdown()
+        http_pool.close_session()
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "orjson": coze_draft.draft_writer.orjson is not None,
+        },
+        "params": {
+            "images": images,
+            "latency": latency,
+            "fail_rate": fail_rate,
+            "retries": http_pool.HTTP_RETRIES,
+            "fetch_workers": coze_draft.FETCH_WORKERS,
+            "repeat": repeat,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def print_results(results: dict):
+    params = results["params"]
+    print(f"图片/音频各 {params['images']} 个, 延迟 {params['latency']}s, partial 失败率 {params['fail_rate']:.0%}, "
+          f"重试 {params['retries']} 次, 并发 {params['fetch_workers']}, 每场景 {params['repeat']} 次取中位数")
+    for name, s in results["scenarios"].items():
+        phases = " ".join(f"{p}={v * 1000:.0f}ms" for p, v in s["timings"].items())
+        print(f"\n[{name}] 总耗时 {s['total']:.3f}s, 峰值内存 {s['peak_mem_mb']:.1f} MB")
+        print(f"  阶段: {phases}")
+        print(f"  缓存: {s['cache_hits']} 命中 / {s['cache_misses']} 未命中; "
+              f"连接: {s['requests']} 请求 / {s['new_connections']} 新建 / {s['retries']} 重试")
+
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """与基线对比，返回回归描述列表（空列表表示无回归）"""
+    if baseline.get("params") != results["params"]:
+        print(f"警告: 基线参数不同 {baseline.get('params')}，对比结果仅供参考")
+    regressions = []
+    for name, s in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        pairs = [("total", s["total"], base["total"])]
+        pairs += [(f"timings.{p}", v, base["timings"].get(p)) for p, v in s["timings"].items()]
+        for key, now, before in pairs:
+            if before is None:
+                continue
+            if now > before * (1 + threshold) and now - before > REGRESSION_NOISE_FLOOR:
+                regressions.append(f"{name}.{key}: {before:.3f}s → {now:.3f}s (+{(now / before - 1):.0%})")
+        mem_now, mem_before = s["peak_mem_mb"], base.get("peak_mem_mb")
+        if mem_before and mem_now > mem_before * (1 + threshold) and mem_now - mem_before > 1:
+            regressions.append(f"{name}.peak_mem_mb: {mem_before:.1f} → {mem_now:.1f} MB")
+    return regressions
+
+
+if __name__ == "__main__":
+    usage = (f"用法: {sys.argv[0]} [--images 20] [--latency 0.05] [--fail-rate 0.2] [--retries 1] [--repeat 3] "
+             f"[--json out.json] [--save-baseline] [--compare] [--baseline path] [--threshold 0.25]")
+    images = 20
+    latency = 0.05
+    fail_rate = 0.2
+    repeat = 3
+    json_path = None
+    baseline_path = BASELINE_PATH
+    threshold = REGRESSION_THRESHOLD
+
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--images":
+                images = int(args[i + 1])
+            elif arg == "--latency":
+                latency = float(args[i + 1])
+            elif arg == "--fail-rate":
+                fail_rate = float(args[i + 1])
+            elif arg == "--retries":
+                http_pool.HTTP_RETRIES = int(args[i + 1])
+            elif arg == "--repeat":
+                repeat = max(1, int(args[i + 1]))
+            elif arg == "--json":
+                json_path = Path(args[i + 1])
+            elif arg == "--baseline":
+                baseline_path = Path(args[i + 1])
+            elif arg == "--threshold":
+                threshold = float(args[i + 1])
+    except (ValueError, IndexError):
+        print(usage)
+        sys.exit(1)
+
+    results = run_benchmarks(images, latency, fail_rate, repeat)
+    print_results(results)
+
+    if json_path:
+        json_path.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已写入: {json_path}")
+
+    if "--save-baseline" in args:
+        baseline_path.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n基线已保存: {baseline_path}")
+
+    if "--compare" in args:
+        if not baseline_path.exists():
+            print(f"\n基线不存在: {baseline_path}（先用 --save-baseline 生成）")
+            sys.exit(1)
+        regressions = compare(results, json.loads(baseline_path.read_text(encoding="utf-8")), threshold)
+        if regressions:
+            print(f"\n【性能回归】超过基线 {threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n与基线相比无回归（阈值 {threshold:.0%}）")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+时间轴基准：长草稿（数千段）的时间轴规范化，以及按时间顺序加入轨道的耗时
+
+- timeline：build_timeline 处理 N 张图 + N 段音频 + N 条字幕（整数时间 / 混有字符串与浮点的时间）
+- 轨道：N 条字幕逐段加入轨道，pyJianYingDraft 原始的逐段重叠检查（O(n²)）与 timeline.sorted_track
+
+用法: python benchmarks/bench_timeline.py [--sizes 100,1000,5000] [--repeat 3]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pyJianYingDraft import ScriptFile, TextSegment, TextStyle, TrackType, trange
+
+import timeline
+
+SEGMENT_US = 2_000_000
+
+
+def make_payload(n: int, mixed: bool) -> tuple[list, list, list, list]:
+    """N 段首尾相接的时间轴；mixed 时一部分时间是字符串 / 浮点（Coze 数据中两种都出现过）"""
+    def t(us, i):
+        if mixed and i % 3 == 1:
+            return str(us)
+        if mixed and i % 3 == 2:
+            return float(us)
+        return us
+
+    images = [{"start": t(i * SEGMENT_US, i), "end": t((i + 1) * SEGMENT_US, i)} for i in range(n)]
+    audios = [{"start": t(i * SEGMENT_US, i), "duration": SEGMENT_US, "end": t((i + 1) * SEGMENT_US, i)}
+              for i in range(n)]
+    timelines = [{"start": t(i * SEGMENT_US, i), "end": t((i + 1) * SEGMENT_US, i)} for i in range(n)]
+    return images, audios, [f"字幕 {i}" for i in range(n)], timelines
+
+
+def fill_track(intervals: list, sorted_appends: bool):
+    script = ScriptFile(1080, 1920)
+    script.add_track(TrackType.text, "subtitles")
+    if sorted_appends:
+        timeline.sorted_track(script.tracks["subtitles"])
+    style = TextStyle(size=8.0)
+    for i, start, duration in intervals:
+        script.add_segment(TextSegment(f"字幕 {i}", trange(start, duration), style=style), "subtitles")
+
+
+def bench(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes, repeat):
+    print(f"  {'段数':>6}{'timeline 整数(ms)':>20}{'timeline 混合(ms)':>20}{'轨道 原始(ms)':>16}{'轨道 sorted(ms)':>18}")
+    for n in sizes:
+        ints = make_payload(n, mixed=False)
+        mixed = make_payload(n, mixed=True)
+        intervals = timeline.build_timeline(*ints)["captions"]
+        row = [
+            bench(lambda: timeline.build_timeline(*ints), repeat),
+            bench(lambda: timeline.build_timeline(*mixed), repeat),
+            bench(lambda: fill_track(intervals, False), repeat),
+            bench(lambda: fill_track(intervals, True), repeat),
+        ]
+        print(f"  {n:>6}" + "".join(f"{s * 1000:>{w}.1f}" for s, w in zip(row, (20, 20, 16, 18))))
+
+
+if __name__ == "__main__":
+    sizes = [100, 1000, 5000]
+    repeat = 3
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--sizes":
+                sizes = [int(x) for x in args[i + 1].split(",")]
+            elif arg == "--repeat":
+                repeat = int(args[i + 1])
+    except (ValueError, IndexError):
+        print(f"用法: {sys.argv[0]} [--sizes 100,1000,5000] [--repeat 3]")
+        sys.exit(1)
+    main(sizes, repeat)
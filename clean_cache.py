@@ -1,96 +1,117 @@
 #!/usr/bin/env python3
 """
-清理缓存脚本：删除超过指定天数未使用的缓存文件
+清理缓存脚本：基于缓存索引（media_cache 的 SQLite 索引）淘汰缓存文件
+
+- 按天数：删除超过指定天数未访问的缓存文件（缓存命中会刷新访问时间，常用文件不会被误删）
+- 按容量：--max-size 淘汰到总大小不超过预算（--policy lru/lfu）
+- --reindex：扫描目录修复索引（手动删过缓存文件、或从旧版本升级时使用）
+- --clear-failures：清空负缓存（失败 URL 记录），让近期失败过的 URL 下次重新下载
 """
 import time
-from pathlib import Path
 
-SCRIPT_DIR = Path(__file__).parent.resolve()
-CACHE_DIR = SCRIPT_DIR / "coze_cache" / "media"
+import media_cache
+from media_cache import CACHE_DIR
+
+
+def parse_size(text: str) -> int:
+    """'500M' / '2G' / '1048576' → 字节数"""
+    text = text.strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
 
-def clean_cache(days: int = 30, dry_run: bool = False):
+
+def clean_cache(days: int = 30, dry_run: bool = False, max_bytes: int = None,
+                policy: str = None, assume_yes: bool = False):
     """
-    清理超过指定天数未访问的缓存文件
-    
+    清理超过指定天数未访问的缓存文件，或淘汰到指定容量以内
+
     Args:
-        days: 天数阈值（默认 30 天）
+        days: 天数阈值（默认 30 天，None 表示不按天数清理）
         dry_run: 模拟运行，不实际删除
+        max_bytes: 容量预算（字节），None 表示不按容量清理
+        policy: 按容量清理时的淘汰策略 "lru" / "lfu"
+        assume_yes: 不询问确认直接删除
     """
     if not CACHE_DIR.exists():
         print(f"缓存目录不存在: {CACHE_DIR}")
         return
-    
-    now = time.time()
-    threshold = days * 24 * 3600  # 天数 → 秒
-    
-    files = list(CACHE_DIR.glob("*"))
-    if not files:
-        print("缓存目录为空")
-        return
-    
+
+    total_size = media_cache.index_total_bytes()
     print(f"缓存目录: {CACHE_DIR}")
-    print(f"文件总数: {len(files)}")
-    print(f"清理阈值: 超过 {days} 天未使用")
+    print(f"缓存总大小: {total_size / 1024 / 1024:.2f} MB")
+    if days is not None:
+        print(f"清理阈值: 超过 {days} 天未使用")
+    if max_bytes is not None:
+        print(f"容量预算: {max_bytes / 1024 / 1024:.2f} MB ({policy or media_cache.CACHE_EVICTION_POLICY})")
     print()
-    
-    to_delete = []
-    total_size = 0
-    delete_size = 0
-    
-    for f in files:
-        if not f.is_file():
-            continue
-        
-        size = f.stat().st_size
-        mtime = f.stat().st_mtime
-        age = now - mtime
-        total_size += size
-        
-        if age > threshold:
-            to_delete.append((f, age, size))
-            delete_size += size
-    
+
+    older_than = time.time() - days * 24 * 3600 if days is not None else None
+    to_delete = media_cache.evict(max_bytes, policy=policy, older_than=older_than, dry_run=True)
+    delete_size = sum(size for _, size in to_delete)
+
     print(f"【分析结果】")
-    print(f"  缓存总大小: {total_size / 1024 / 1024:.2f} MB")
     print(f"  待删除文件: {len(to_delete)} 个")
     print(f"  待删除大小: {delete_size / 1024 / 1024:.2f} MB")
     print()
-    
+
     if not to_delete:
         print("无需清理")
         return
-    
+
     if dry_run:
         print("【模拟运行 - 不会实际删除】")
-        for f, age, size in to_delete[:5]:  # 只显示前 5 个
-            days_old = age / 86400
-            print(f"  会删除: {f.name} ({size / 1024:.1f} KB, {days_old:.1f} 天前)")
+        for name, size in to_delete[:5]:  # 只显示前 5 个
+            print(f"  会删除: {name} ({size / 1024:.1f} KB)")
         if len(to_delete) > 5:
             print(f"  ... 还有 {len(to_delete) - 5} 个文件")
-    else:
+        return
+
+    if not assume_yes:
         confirm = input(f"确认删除 {len(to_delete)} 个文件? (yes/n): ")
-        if confirm.lower() == 'yes':
-            for f, age, size in to_delete:
-                f.unlink()
-            print(f"✓ 已删除 {len(to_delete)} 个文件，释放 {delete_size / 1024 / 1024:.2f} MB")
-        else:
+        if confirm.lower() != 'yes':
             print("取消删除")
+            return
+    deleted = media_cache.evict(max_bytes, policy=policy, older_than=older_than)
+    freed = sum(size for _, size in deleted)
+    print(f"✓ 已删除 {len(deleted)} 个文件，释放 {freed / 1024 / 1024:.2f} MB")
 
 
 if __name__ == "__main__":
     import sys
-    
-    days = 30
-    dry_run = False
-    
-    if len(sys.argv) > 1:
-        try:
-            days = int(sys.argv[1])
-        except ValueError:
-            print(f"用法: {sys.argv[0]} [天数] [--dry-run]")
-            sys.exit(1)
-    
-    if "--dry-run" in sys.argv:
-        dry_run = True
-    
-    clean_cache(days, dry_run)
+
+    usage = f"用法: {sys.argv[0]} [天数] [--dry-run] [--max-size 2G] [--policy lru|lfu] [--yes] [--reindex] [--clear-failures]"
+    days = None
+    dry_run = "--dry-run" in sys.argv
+    assume_yes = "--yes" in sys.argv
+    max_bytes = None
+    policy = None
+
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--max-size":
+                max_bytes = parse_size(args[i + 1])
+            elif arg == "--policy":
+                policy = args[i + 1]
+            elif not arg.startswith("--") and (i == 0 or args[i - 1] not in ("--max-size", "--policy")):
+                days = int(arg)
+    except (ValueError, IndexError):
+        print(usage)
+        sys.exit(1)
+
+    if "--reindex" in sys.argv:
+        added = media_cache.reindex()
+        print(f"索引已修复: 补登记 {added} 个文件")
+
+    if "--clear-failures" in sys.argv:
+        cleared = media_cache.clear_failures()
+        print(f"负缓存已清空: {cleared} 条失败记录")
+        if days is None and max_bytes is None:
+            sys.exit(0)
+
+    if days is None and max_bytes is None:
+        days = 30
+
+    clean_cache(days, dry_run, max_bytes=max_bytes, policy=policy, assume_yes=assume_yes)
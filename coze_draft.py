@@ -3,35 +3,49 @@
 Coze → 剪映(JianYing) 草稿生成工具
 完全自包含: 所有模板文件保存在 ./template/ 目录中, 不依赖外部草稿
 """
+import copy
+import errno
+import hashlib
 import json
 import os
 import base64
+import contextvars
 import sys
 import time
 import shutil
+import threading
 import uuid
-import hashlib
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pyJianYingDraft as draft
 from pyJianYingDraft import trange
+from pyJianYingDraft.segment import ClipSettings
 from pyJianYingDraft.script_file import ScriptFile
 from pyJianYingDraft.text_segment import TextStyle, TextBorder, TextShadow, TextSegment
 
+import draft_metrics
+import draft_update
+import draft_writer
+import http_pool
+import image_normalize
+import media_cache
+import shared_cache
+import timeline
+
 # ================= 配置 =================
 HOME = Path.home()
 SCRIPT_DIR = Path(__file__).parent.resolve()
 TEMPLATE_DIR = SCRIPT_DIR / "template"
 
-# 全局媒体缓存目录（避免重复下载相同 URL 的资源）
-CACHE_DIR = SCRIPT_DIR / "coze_cache" / "media"
+# 全局媒体缓存目录 CACHE_DIR、下载超时与 URL 规范化规则见 media_cache.py
 
-# 剪映(中国内地版)草稿路径
-JIANYING_DRAFT_ROOT = HOME / "Movies/JianyingPro/User Data/Projects/com.lveditor.draft"
+# 剪映(中国内地版)草稿路径（可通过环境变量 COZE_DRAFT_ROOT 覆盖，便于在未安装剪映的机器上测试）
+JIANYING_DRAFT_ROOT = Path(os.environ.get("COZE_DRAFT_ROOT")
+                           or HOME / "Movies/JianyingPro/User Data/Projects/com.lveditor.draft")
 
-DOWNLOAD_TIMEOUT = 30
-USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"
+# 并发获取素材的线程数（可通过环境变量 COZE_FETCH_WORKERS 覆盖，1 = 逐个下载）
+FETCH_WORKERS = int(os.environ.get("COZE_FETCH_WORKERS", "8"))
 
 # 画布尺寸（手机竖屏 9:16）
 CANVAS_WIDTH = 1080
@@ -54,6 +68,32 @@ SUBTITLE_SHADOW_RGB = (0.00, 0.00, 0.00)
 SUBTITLE_SHADOW_DIFFUSE = 18.0
 SUBTITLE_SHADOW_DISTANCE = 6.0
 SUBTITLE_SHADOW_ANGLE = -45.0
+# 字幕垂直位置（-1 底部 ~ 1 顶部），与剪映导入字幕时的默认值一致
+SUBTITLE_TRANSFORM_Y = -0.8
+# 多比例输出的画布配置（--canvases 9x16,16x9,1x1）：尺寸、背景填充（'#RRGGBBAA' 颜色或 "blur" 模糊）、
+# 字幕字号与垂直位置。同一份数据按多个画布各生成一个草稿，素材的获取、探测只做一次
+CANVAS_PROFILES = {
+    "9x16": {"width": CANVAS_WIDTH, "height": CANVAS_HEIGHT, "background": BACKGROUND_COLOR,
+             "subtitle_size": SUBTITLE_FONT_SIZE, "subtitle_y": SUBTITLE_TRANSFORM_Y},
+    "16x9": {"width": 1920, "height": 1080, "background": "blur", "subtitle_size": 6.0, "subtitle_y": -0.85},
+    "1x1": {"width": 1080, "height": 1080, "background": BACKGROUND_COLOR, "subtitle_size": 7.0, "subtitle_y": -0.8},
+}
+# "blur" 背景的模糊程度（剪映中的四档：0.0625 / 0.375 / 0.75 / 1.0）
+BACKGROUND_BLUR = 0.375
+# 额外导出 captions.srt 到草稿目录（可通过环境变量 COZE_EXPORT_SRT=1 开启；草稿本身不需要）
+EXPORT_SRT = os.environ.get("COZE_EXPORT_SRT", "0") not in ("", "0")
+
+# 流水线：素材一下载完就探测媒体信息，与其余素材的下载重叠（可通过环境变量 COZE_STREAM_PREPARE=0 关闭）
+STREAM_PREPARE = os.environ.get("COZE_STREAM_PREPARE", "1") not in ("", "0")
+# libmediainfo 不是线程安全的：同一时刻只探测一个文件
+_probe_lock = threading.Lock()
+
+# 素材获取失败状态 → 日志中的兜底原因
+FAILURE_REASONS = {
+    "expired": "url expired",
+    "negative_cached": "failed recently",
+    "circuit_open": "host circuit open",
+}
 
 # 从 template/ 复制到新草稿的文件
 TEMPLATE_FILES = [
@@ -78,37 +118,14 @@ EMPTY_DIRS = [
     "subdraft",
     "Resources",
 ]
+# 编译后的草稿骨架（按 template/ 指纹命名）：macOS APFS 上新草稿由整个骨架目录一次克隆而成
+TEMPLATE_BUNDLE_DIR = SCRIPT_DIR / "temp" / "template_bundle"
+# 检查 template/ 是否被修改的最短间隔（秒，可通过环境变量 COZE_TEMPLATE_CHECK_INTERVAL 覆盖；0 = 每次构建都检查）
+TEMPLATE_CHECK_INTERVAL = float(os.environ.get("COZE_TEMPLATE_CHECK_INTERVAL", "1"))
 
 
 # ================= 工具函数 =================
 
-def to_int_us(value, default: int = 0) -> int:
-    """将可能为 int/float/数字字符串(含小数) 的时间统一转为微秒整数。"""
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return int(value)
-    if isinstance(value, int):
-        return value
-    if isinstance(value, float):
-        return int(round(value))
-    if isinstance(value, str):
-        s = value.strip()
-        if not s:
-            return default
-        try:
-            return int(s)
-        except ValueError:
-            try:
-                return int(round(float(s)))
-            except ValueError:
-                return default
-    try:
-        return int(round(float(value)))
-    except Exception:
-        return default
-
-
 def safe_parse(data):
     """处理可能被字符串化的 JSON 字段"""
     if isinstance(data, (list, dict)):
@@ -121,98 +138,71 @@ def safe_parse(data):
     return []
 
 
-def url_to_cache_key(url: str) -> str:
-    """
-    URL → 缓存文件名（使用 MD5 hash 避免文件名冲突和非法字符）
-    """
-    return hashlib.md5(url.encode('utf-8')).hexdigest()
+def download(url, save_path):
+    """下载文件, 返回是否成功（保留兼容性，内部调用缓存机制）"""
+    save_path = Path(save_path)
+    
+    # 从文件扩展名推断类型
+    ext = save_path.suffix.lstrip('.')
+    success, status = media_cache.get_cached_or_download(url, save_path, file_type=ext)
+    return success
 
 
-def get_cached_or_download(url: str, target_path: Path, file_type: str = "media") -> tuple[bool, str]:
+def fetch_media(jobs, workers: int = FETCH_WORKERS, events: list = None,
+                on_done=None) -> list[tuple[bool, str]]:
     """
-    智能下载：先检查全局缓存，存在则复制，不存在则下载并缓存。
-    
+    并发获取一批素材（有界线程池），结果顺序与 jobs 一致。
+
     Args:
-        url: 资源 URL
-        target_path: 目标保存路径（草稿 materials/ 目录下）
-        file_type: 文件类型（用于确定扩展名，如 "png", "mp3"）
-    
+        jobs: [(url, target_path, file_type), ...]
+        workers: 最大并发数（<= 1 时退化为逐个下载）
+        events: 传入列表时，按 jobs 顺序追加每个 URL 的记录 {"url", "status", "ok", "seconds", "bytes"}
+                （url 为去掉签名参数后的规范化 URL）
+        on_done: 每个素材获取完成后在工作线程中调用 on_done(序号, 是否成功, 状态)，
+                 用于在其余素材仍在下载时处理已就绪的素材（流水线）
+
     Returns:
-        (是否成功, 状态信息: "cached"/"downloaded"/"failed")
+        [(是否成功, 状态信息), ...]，与 get_cached_or_download 的返回值相同
     """
-    target_path = Path(target_path)
-    
-    # 如果目标已存在且有效，直接返回
-    if target_path.exists() and target_path.stat().st_size > 0:
-        return True, "exists"
-    
-    if not url:
-        return False, "empty_url"
-    
-    # 确保缓存目录存在
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    
-    # 推断扩展名
-    if not file_type or file_type == "media":
-        # 从 URL 或目标路径推断
-        if target_path.suffix:
-            ext = target_path.suffix
-        else:
-            ext = ".dat"
+    def fetch(index, job):
+        start = time.perf_counter()
+        ok, status = media_cache.get_cached_or_download(*job)
+        target = Path(job[1])
+        event = {
+            "url": media_cache.canonicalize_url(job[0]),
+            "status": status,
+            "ok": ok,
+            "seconds": round(time.perf_counter() - start, 4),
+            "bytes": target.stat().st_size if ok and target.exists() else 0,
+        }
+        if on_done is not None:
+            on_done(index, ok, status)
+        return ok, status, event
+
+    jobs = list(jobs)
+    workers = max(1, min(int(workers or 1), len(jobs)))
+    if workers == 1:
+        results = [fetch(i, job) for i, job in enumerate(jobs)]
     else:
-        ext = f".{file_type.lstrip('.')}"
-    
-    # 缓存文件路径
-    cache_key = url_to_cache_key(url)
-    cache_path = CACHE_DIR / f"{cache_key}{ext}"
-    
-    # 步骤 1: 检查缓存是否存在
-    if cache_path.exists() and cache_path.stat().st_size > 0:
-        # 从缓存复制到目标
-        try:
-            target_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(str(cache_path), str(target_path))
-            if target_path.exists() and target_path.stat().st_size > 0:
-                return True, "cached"
-            return False, "copy_failed"
-        except Exception as e:
-            print(f"  缓存复制失败: {e}")
-            return False, "copy_failed"
-    
-    # 步骤 2: 缓存不存在，下载到缓存
-    try:
-        r = requests.get(url, headers={"User-Agent": USER_AGENT},
-                         stream=True, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True)
-        if r.status_code == 200:
-            with open(cache_path, "wb") as f:
-                for chunk in r.iter_content(8192):
-                    f.write(chunk)
-            
-            # 验证下载成功
-            if not (cache_path.exists() and cache_path.stat().st_size > 0):
-                return False, "download_failed"
-            
-            # 步骤 3: 从缓存复制到目标
-            target_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(str(cache_path), str(target_path))
-            if target_path.exists() and target_path.stat().st_size > 0:
-                return True, "downloaded"
-            return False, "copy_failed"
-    except Exception as e:
-        print(f"  下载失败: {e}")
-        return False, "download_failed"
-    
-    return False, "unknown_error"
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+            # 每个任务带上提交时的上下文，工作线程的计数归入本次构建（media_cache / http_pool.run_stats）
+            futures = [pool.submit(contextvars.copy_context().run, fetch, i, job) for i, job in enumerate(jobs)]
+            results = [f.result() for f in futures]
+    if events is not None:
+        events.extend(event for _, _, event in results)
+    return [(ok, status) for ok, status, _ in results]
 
 
-def download(url, save_path):
-    """下载文件, 返回是否成功（保留兼容性，内部调用缓存机制）"""
-    save_path = Path(save_path)
-    
-    # 从文件扩展名推断类型
-    ext = save_path.suffix.lstrip('.')
-    success, status = get_cached_or_download(url, save_path, file_type=ext)
-    return success
+def _job_status(fetch_results: dict, job_for: dict, key: tuple) -> tuple[bool, str]:
+    """
+    第 key 个素材（如 ("image", 3)）的获取结果。
+    重复出现的 URL 共用首次出现时的任务：首次已下载时其余位置计为缓存命中，统计与逐个下载时一致。
+    """
+    job = job_for[key]
+    ok, status = fetch_results[job]
+    if job != key and status == "downloaded":
+        status = "cached"
+    return ok, status
 
 
 _WHITE_1X1_PNG_B64 = (
@@ -232,17 +222,58 @@ def ensure_white_png(path: Path) -> Path:
     return path
 
 
-def ensure_copy(src: Path, dst: Path) -> bool:
-    """将 src 复制到 dst（dst 不存在/为空时），返回是否成功。"""
-    src = Path(src)
-    dst = Path(dst)
-    if dst.exists() and dst.stat().st_size > 0:
-        return True
-    if not src.exists() or src.stat().st_size <= 0:
-        return False
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(str(src), str(dst))
-    return dst.exists() and dst.stat().st_size > 0
+def shared_material(materials: dict, path: Path, factory):
+    """
+    按文件身份（设备号 + inode）复用素材对象：兜底引用、重复 URL、内容去重后硬链接的文件
+    都只在 draft_content.json 中出现一次，也只探测一次媒体信息。
+    可在多个线程中调用：libmediainfo 并发解析会返回错误结果，探测按 _probe_lock 串行
+    （仍与其它线程的下载重叠）。
+
+    Args:
+        materials: 本次构建的素材表（调用方持有）
+        path: 素材文件
+        factory: draft.VideoMaterial / draft.AudioMaterial
+    """
+    st = os.stat(path)
+    key = (factory.__name__, st.st_dev, st.st_ino)
+    with _probe_lock:
+        material = materials.get(key)
+        if material is None:
+            material = materials[key] = factory(str(path))
+    return material
+
+
+def preprobe(cache: dict, path: Path, factory):
+    """
+    流水线预探测（在下载线程中调用）：按文件身份探测一次，结果只放入 cache，不登记为素材。
+    素材仍由主线程按时间轴顺序登记（shared_material），同一份数据的多个文件中记录哪个路径与下载完成的先后无关。
+    """
+    st = os.stat(path)
+    key = (factory.__name__, st.st_dev, st.st_ino)
+    with _probe_lock:
+        if key not in cache:
+            cache[key] = factory(str(path))
+
+
+def probed_factory(cache: dict, factory):
+    """
+    包装 draft.VideoMaterial / AudioMaterial：文件（或硬链接到同一份数据的文件）已预探测过时，
+    复制探测结果并改为本路径、新的素材 id，不再调用 pymediainfo；否则照常探测
+    """
+    def make(path):
+        st = os.stat(path)
+        path = os.path.abspath(path)
+        pre = cache.get((factory.__name__, st.st_dev, st.st_ino))
+        # 扩展名不同时探测方式可能不同（如 .gif），重新探测
+        if pre is None or os.path.splitext(pre.path)[1].lower() != os.path.splitext(path)[1].lower():
+            return factory(path)
+        material = copy.copy(pre)
+        material.path, material.material_name = path, os.path.basename(path)
+        material.material_id = uuid.uuid4().hex
+        return material
+
+    make.__name__ = factory.__name__
+    return make
 
 
 def _srt_time(us):
@@ -254,6 +285,96 @@ def _srt_time(us):
     return f"{h:02}:{m:02}:{s:02},{ms:03}"
 
 
+def canvas_profile(name: str = None) -> dict:
+    """
+    画布配置 {"name", "width", "height", "background", "subtitle_size", "subtitle_y"}。
+
+    Args:
+        name: CANVAS_PROFILES 中的配置名；None 表示单草稿的默认画布（CANVAS_* / BACKGROUND_COLOR / SUBTITLE_* 配置）
+
+    Raises:
+        ValueError: 未知的配置名
+    """
+    if name is None:
+        return {"name": None, "width": CANVAS_WIDTH, "height": CANVAS_HEIGHT, "background": BACKGROUND_COLOR,
+                "subtitle_size": SUBTITLE_FONT_SIZE, "subtitle_y": SUBTITLE_TRANSFORM_Y}
+    if name not in CANVAS_PROFILES:
+        raise ValueError(f"未知的画布配置: {name}（可选: {', '.join(CANVAS_PROFILES)}）")
+    return {"name": name, **CANVAS_PROFILES[name]}
+
+
+def relocate_material(material, path: Path, clones: dict):
+    """
+    多画布输出：复制第一个草稿中已探测的素材对象，指向另一个草稿中的同名文件（不再调用 pymediainfo）。
+
+    Args:
+        material: 第一个草稿中的素材对象
+        path: 当前草稿中的素材文件
+        clones: 当前草稿的副本表（调用方持有），共享素材的多个片段仍共享同一个副本
+    """
+    clone = clones.get(material.material_id)
+    if clone is None:
+        clone = clones[material.material_id] = copy.copy(material)
+        clone.path = os.path.abspath(path)
+        clone.material_id = uuid.uuid4().hex
+    return clone
+
+
+def subtitle_style(profile: dict = None) -> dict:
+    """字幕样式（所有字幕段共享同一组样式对象；字号与位置取自画布配置）"""
+    profile = profile or canvas_profile()
+    return {
+        "style": TextStyle(
+            size=profile["subtitle_size"],
+            align=1,  # 居中
+            auto_wrapping=True,
+            color=SUBTITLE_FILL_RGB,
+        ),
+        "border": TextBorder(
+            alpha=1.0,
+            color=SUBTITLE_BORDER_RGB,
+            width=SUBTITLE_BORDER_WIDTH,
+        ),
+        "shadow": TextShadow(
+            alpha=SUBTITLE_SHADOW_ALPHA,
+            color=SUBTITLE_SHADOW_RGB,
+            diffuse=SUBTITLE_SHADOW_DIFFUSE,
+            distance=SUBTITLE_SHADOW_DISTANCE,
+            angle=SUBTITLE_SHADOW_ANGLE,
+        ) if SUBTITLE_SHADOW_ALPHA > 0 else None,
+        # 与剪映导入字幕时的默认位置一致（画面下方）
+        "clip_settings": ClipSettings(transform_y=profile["subtitle_y"]),
+    }
+
+
+def add_subtitles(script: ScriptFile, captions: list, intervals: list,
+                  track_name: str = "subtitles", profile: dict = None) -> int:
+    """
+    直接由 text_cap 与规范化后的字幕时间生成字幕轨道（微秒精度，不经过 SRT 文件）。
+    intervals 为 timeline.build_timeline 的 "captions"（按开始时间排序，无效项已剔除）；
+    profile 为画布配置（None 表示默认画布）。
+
+    Returns:
+        添加的字幕段数
+    """
+    if track_name not in script.tracks:
+        script.add_track(draft.TrackType.text, track_name, relative_index=999)  # 在所有文本轨道的最上层
+    timeline.sorted_track(script.tracks[track_name])
+    shared = subtitle_style(profile)
+    for i, start, duration in intervals:
+        script.add_segment(TextSegment(str(captions[i]).strip(), trange(start, duration), **shared), track_name)
+    return len(intervals)
+
+
+def write_srt(srt_path: Path, captions: list, intervals: list):
+    """导出 SRT 字幕文件（仅供外部使用，草稿本身不依赖它；intervals 同 add_subtitles）"""
+    with open(srt_path, "w", encoding="utf-8") as f:
+        for n, (i, start, duration) in enumerate(intervals, 1):
+            f.write(f"{n}\n")
+            f.write(f"{_srt_time(start)} --> {_srt_time(start + duration)}\n")
+            f.write(f"{captions[i]}\n\n")
+
+
 def sanitize_filename(name: str, max_length: int = 200) -> str:
     """
     清理文件名/目录名中的非法字符，确保符合 macOS 和剪映要求。
@@ -299,79 +420,296 @@ def sanitize_filename(name: str, max_length: int = 200) -> str:
     return name or "untitled"
 
 
-def generate_draft_title(data: dict) -> str:
+def draft_identity(data: dict) -> str:
     """
-    从 Coze JSON 数据生成草稿标题。
-    格式: [topic~hook_type~output_language~时间戳]
+    草稿的稳定身份（增量更新模式下的草稿名）。
+    格式: [topic~hook_type~output_language]
     """
     topic = data.get("topic", "").strip()
     hook_type = data.get("hook_type", "").strip()
     output_language = data.get("output_language", "").strip()
-    timestamp = int(time.time())
-    
+
     # 清理每个字段
     topic_clean = sanitize_filename(topic, max_length=80) if topic else "untitled"
     hook_type_clean = sanitize_filename(hook_type, max_length=30) if hook_type else "unknown"
     lang_clean = sanitize_filename(output_language, max_length=10) if output_language else "unknown"
+
+    return f"{topic_clean}~{hook_type_clean}~{lang_clean}"
+
+
+def generate_draft_title(data: dict) -> str:
+    """
+    从 Coze JSON 数据生成草稿标题。
+    格式: [topic~hook_type~output_language~时间戳]
+    """
+    timestamp = int(time.time())
     
     # 拼接标题
-    title = f"{topic_clean}~{hook_type_clean}~{lang_clean}~{timestamp}"
+    title = f"{draft_identity(data)}~{timestamp}"
     
     # 最终保险：再次清理并限制总长度
     return sanitize_filename(title, max_length=200)
 
 
-def setup_project(project_path):
-    """从本地 template/ 目录初始化新草稿项目"""
-    project_path.mkdir(parents=True, exist_ok=True)
+# 编译后的模板（进程内常驻）：模板文件内容、新草稿中要创建的目录、平台配置与 template/ 的指纹。
+# 指纹变化（模板被修改）时自动重新编译；守护进程 / 批量模式下每个新草稿只需 mkdir + 写入内存中的内容
+_template_bundle = None
+_template_checked = 0.0
+_template_lock = threading.Lock()
 
-    # 复制模板文件
-    for fn in TEMPLATE_FILES:
-        src = TEMPLATE_DIR / fn
-        if src.exists():
-            shutil.copy2(str(src), str(project_path / fn))
 
-    # 复制模板目录
+def _template_sources() -> list[Path]:
+    """参与编译的文件：TEMPLATE_FILES、TEMPLATE_DIRS 中的文件与 platform_config.json"""
+    paths = [TEMPLATE_DIR / fn for fn in TEMPLATE_FILES]
     for dn in TEMPLATE_DIRS:
         src = TEMPLATE_DIR / dn
-        if src.exists():
-            dst = project_path / dn
-            if src.is_dir():
-                shutil.copytree(str(src), str(dst))
-            else:
-                shutil.copy2(str(src), str(dst))
+        paths.extend(sorted(p for p in src.rglob("*") if p.is_file()) if src.is_dir() else [src])
+    paths.append(TEMPLATE_DIR / "platform_config.json")
+    return paths
 
-    # 创建空目录
-    for dn in EMPTY_DIRS:
-        (project_path / dn).mkdir(parents=True, exist_ok=True)
 
+def template_fingerprint() -> str:
+    """template/ 的指纹：各文件的相对路径、大小与修改时间（缺失的文件同样记入，补上后指纹变化）"""
+    h = hashlib.md5()
+    for path in _template_sources():
+        rel = path.relative_to(TEMPLATE_DIR).as_posix()
+        try:
+            st = path.stat()
+            h.update(f"{rel}:{st.st_size}:{st.st_mtime_ns}\n".encode("utf-8"))
+        except FileNotFoundError:
+            h.update(f"{rel}:-\n".encode("utf-8"))
+    h.update("\n".join(EMPTY_DIRS).encode("utf-8"))
+    return h.hexdigest()
 
-def load_platform_config():
-    """从 template/platform_config.json 加载平台格式字段"""
+
+def compile_template_bundle() -> dict:
+    """
+    编译 template/：读入模板文件、解析平台配置，并算出新草稿中的全部目录（父目录在前）。
+
+    Returns:
+        {"fingerprint", "files": [(相对路径, 内容), ...], "dirs": [相对路径, ...],
+         "platform_config": dict（文件不存在时为 None）, "skeleton": 磁盘骨架目录（未生成时为 None，不可用时为 False）}
+    """
+    # 先取指纹再读文件：读取期间模板被修改时，下次检查会重新编译
+    fingerprint = template_fingerprint()
+    files = []
+    for path in _template_sources()[:-1]:
+        if path.is_file():
+            files.append((path.relative_to(TEMPLATE_DIR).as_posix(), path.read_bytes()))
+    dirs = set(EMPTY_DIRS)
+    for rel, _ in files:
+        dirs.update(parent.as_posix() for parent in list(Path(rel).parents)[:-1])
     config_path = TEMPLATE_DIR / "platform_config.json"
-    if not config_path.exists():
-        raise FileNotFoundError(f"缺少配置文件: {config_path}")
-    with open(config_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    platform_config = json.loads(config_path.read_text(encoding="utf-8")) if config_path.is_file() else None
+    return {"fingerprint": fingerprint, "files": files, "dirs": sorted(dirs, key=lambda d: (d.count("/"), d)),
+            "platform_config": platform_config, "skeleton": None}
+
+
+def load_template_bundle() -> dict:
+    """取编译后的模板；距上次检查超过 TEMPLATE_CHECK_INTERVAL 秒时比对指纹，template/ 被修改则重新编译"""
+    global _template_bundle, _template_checked
+    with _template_lock:
+        now = time.monotonic()
+        if _template_bundle is None or now - _template_checked >= TEMPLATE_CHECK_INTERVAL:
+            if _template_bundle is None or template_fingerprint() != _template_bundle["fingerprint"]:
+                _template_bundle = compile_template_bundle()
+            _template_checked = now
+        return _template_bundle
+
+
+def reload_templates():
+    """丢弃编译好的模板，下次构建时立即重新从 template/ 编译"""
+    global _template_bundle
+    with _template_lock:
+        _template_bundle = None
+
+
+def _stamp_template(bundle: dict, project_path: Path):
+    """按编译结果写出草稿骨架：目录与文件列表已预先算好，每个目录一次 mkdir，每个文件一次 open + write"""
+    project_path.mkdir(parents=True, exist_ok=True)
+    root = str(project_path)
+    for rel in bundle["dirs"]:
+        try:
+            os.mkdir(os.path.join(root, rel))
+        except FileExistsError:
+            pass
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    for rel, content in bundle["files"]:
+        fd = os.open(os.path.join(root, rel), flags, 0o644)
+        try:
+            view = memoryview(content)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+
+def _template_skeleton(bundle: dict) -> Path:
+    """磁盘上的草稿骨架（按指纹命名，多个进程共用；先写临时目录再改名，其它进程不会看到一半的骨架）"""
+    path = TEMPLATE_BUNDLE_DIR / bundle["fingerprint"]
+    if not path.is_dir():
+        tmp = TEMPLATE_BUNDLE_DIR / f".{bundle['fingerprint']}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        _stamp_template(bundle, tmp)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # 其它进程已生成同一骨架
+            shutil.rmtree(tmp, ignore_errors=True)
+    bundle["skeleton"] = path
+    return path
+
+
+def setup_project(project_path):
+    """从编译后的模板初始化新草稿项目（project_path 为尚不存在的新目录）"""
+    bundle = load_template_bundle()
+    project_path = Path(project_path)
+
+    # macOS APFS：整个骨架目录一次 clonefile（写时复制，剪映改写草稿文件不影响骨架）；
+    # 不用硬链接——剪映打开草稿时会改写这些 JSON，硬链接会把改动带进骨架和其它草稿
+    if sys.platform == "darwin" and bundle["skeleton"] is not False and not project_path.exists():
+        skeleton = bundle["skeleton"] or _template_skeleton(bundle)
+        project_path.parent.mkdir(parents=True, exist_ok=True)
+        if media_cache.clone_tree(skeleton, project_path):
+            return
+        bundle["skeleton"] = False
+
+    _stamp_template(bundle, project_path)
+
+
+def load_platform_config():
+    """平台格式字段（来自编译后的模板，template/ 修改后自动更新；每次返回副本）"""
+    config = load_template_bundle()["platform_config"]
+    if config is None:
+        raise FileNotFoundError(f"缺少配置文件: {TEMPLATE_DIR / 'platform_config.json'}")
+    return copy.deepcopy(config)
+
+
+def retarget_material_paths(script: ScriptFile, staging_path: Path, final_path: Path) -> int:
+    """
+    把位于临时目录中的素材路径改为草稿最终位置下的对应路径（只改内存中的素材对象）。
+
+    Returns:
+        改写的素材数
+    """
+    count = 0
+    for material in script.materials.videos + script.materials.audios:
+        try:
+            rel = Path(material.path).relative_to(staging_path)
+        except ValueError:
+            continue
+        material.path = str(final_path / rel)
+        count += 1
+    return count
+
+
+def install_draft(staging_path: Path, final_path: Path):
+    """
+    将临时目录中构建好的草稿整体换入剪映草稿目录。
+
+    先移到最终位置旁的隐藏目录（同一文件系统上是一次 rename，跨文件系统时才复制），
+    再用 rename 原子就位；已存在的同名草稿先改名让位，新草稿就位后再删除。
+    """
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    nearby = final_path.parent / f".{final_path.name}.{os.getpid()}.staging"
+    try:
+        os.rename(staging_path, nearby)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(staging_path), str(nearby))
+
+    old = None
+    if final_path.exists():
+        old = final_path.parent / f".{final_path.name}.{os.getpid()}.old"
+        os.rename(final_path, old)
+    os.rename(nearby, final_path)
+    if old is not None:
+        shutil.rmtree(str(old), ignore_errors=True)
+
+
+def _phase_done(timings: dict, name: str, since: float) -> float:
+    """记录一个阶段的耗时（秒），返回当前时刻作为下一阶段的起点"""
+    now = time.perf_counter()
+    timings[name] = round(now - since, 4)
+    return now
 
 
 # ================= 主逻辑 =================
 
-def main():
-    # ─── 1. 检查 template/ 目录 ───
+def build_draft(data: dict, fetch_workers: int = None, project_name: str = None,
+                metrics_file: str = None, update: bool = False) -> dict:
+    """
+    由一份 Coze JSON 数据构建一个剪映草稿（单条 / 批量模式共用）。
+
+    Args:
+        data: Coze 输出的 JSON 数据
+        fetch_workers: 素材并发获取数（None 表示使用 FETCH_WORKERS）
+        project_name: 草稿名（None 表示由 generate_draft_title 生成；更新模式下由 draft_identity 生成）
+        metrics_file: 指标记录追加到的 JSONL 文件（None 表示使用 draft_metrics.METRICS_FILE）
+        update: 增量更新模式：同名草稿已存在时原地更新，只获取 / 探测变化的素材（见 draft_update.py）
+
+    Returns:
+        {"name", "path", "images", "audios", "captions", "duration", "timings"}
+        timings 为各阶段耗时（秒）：setup / fetch / [normalize] / tracks / subtitles / write / move / verify
+        metrics 为本次运行的结构化指标（见 draft_metrics.py）
+
+    Raises:
+        FileNotFoundError: 模板目录或剪映草稿目录不存在
+    """
+    return build_drafts(data, None, fetch_workers, project_name, metrics_file, update)[0]
+
+
+def build_drafts(data: dict, profiles: list[str] = None, fetch_workers: int = None, project_name: str = None,
+                 metrics_file: str = None, update: bool = False) -> list[dict]:
+    """
+    多比例输出：由一份 Coze 数据按多个画布配置各构建一个草稿（草稿名加上配置名，如 xxx_16x9）。
+    数据解析、素材获取与媒体探测只做一次；其余草稿的素材文件从第一个草稿链接过去，素材对象复制后改指向。
+
+    Args:
+        profiles: CANVAS_PROFILES 中的配置名列表（命令行 --canvases 9x16,16x9,1x1）；
+            None 表示单个草稿、默认画布（草稿名不加后缀）
+        其余参数同 build_draft
+
+    Returns:
+        [build_draft 的返回值（另含 "profile": 配置名）, ...]，顺序与 profiles 一致
+
+    Raises:
+        FileNotFoundError: 模板目录或剪映草稿目录不存在
+        ValueError: 未知的画布配置名，或增量更新模式下指定了多个画布
+    """
     if not TEMPLATE_DIR.exists():
-        print(f"错误: 模板目录不存在: {TEMPLATE_DIR}")
-        print("请确保 template/ 目录包含必要的模板文件")
-        return
+        raise FileNotFoundError(f"模板目录不存在: {TEMPLATE_DIR}")
+    profiles = [canvas_profile(name) for name in dict.fromkeys(profiles)] if profiles else [canvas_profile()]
+    if update and len(profiles) > 1:
+        raise ValueError("增量更新模式一次只能更新一个画布的草稿")
+    if not update:
+        return _build_draft(data, fetch_workers, project_name, metrics_file, False, profiles)
+    project_name = project_name or draft_identity(data)
+    with draft_update.update_lock(project_name):
+        return _build_draft(data, fetch_workers, project_name, metrics_file, True, profiles)
+
+
+def _build_draft(data: dict, fetch_workers: int, project_name: str, metrics_file: str, update: bool,
+                 profiles: list[dict]) -> list[dict]:
+    # 本次构建在 temp/ 下创建的临时目录：成功时草稿已移走、只剩空目录；
+    # 构建中途失败（下载、探测、写盘出错）时连同未完成的草稿一起删除，不留在 temp/ 中
+    stagings = []
+    try:
+        # 指标只统计本次构建：draft_server 在同一进程中并发构建时互不串数
+        with media_cache.run_stats(), http_pool.run_stats():
+            return _build_staged(data, fetch_workers, project_name, metrics_file, update, profiles, stagings)
+    finally:
+        for staging in stagings:
+            shutil.rmtree(staging, ignore_errors=True)
 
-    # ─── 2. 读取输入 ───
-    print("请粘贴 Coze JSON 数据, 按 Ctrl+D (macOS) 结束:")
-    raw = sys.stdin.read().strip()
-    if not raw:
-        print("错误: 没有输入数据")
-        return
 
-    data = json.loads(raw)
+def _build_staged(data: dict, fetch_workers: int, project_name: str, metrics_file: str, update: bool,
+                  profiles: list[dict], stagings: list) -> list[dict]:
+    if fetch_workers is None:
+        fetch_workers = FETCH_WORKERS
+    timings = {}
+    phase_t = time.perf_counter()
 
     # ─── 3. 解析字段 ───
     images = safe_parse(data.get("image_list", []))
@@ -379,59 +717,187 @@ def main():
     captions = data.get("text_cap", [])
     text_timelines = data.get("text_timelines", [])
 
-    print(f"解析完成: {len(images)} 图片, {len(audios)} 音频, {len(captions)} 字幕")
+    # 时间轴规范化与校验：总时长先算出；有无法构建的重叠时在下载素材之前失败
+    # audio_url 为空的音频构建时跳过，不参与校验（它们之间的重叠不影响构建）
+    tl = timeline.build_timeline(images, audios, captions, text_timelines,
+                                 skipped_audios=timeline.audios_to_skip(audios))
+    print(f"解析完成: {len(images)} 图片, {len(audios)} 音频, {len(captions)} 字幕, "
+          f"总时长 {tl['duration'] / 1_000_000:.1f}s")
+    for line in timeline.report_lines(tl):
+        print(line)
+    if tl["counts"]["overlap"] and not tl["fixed"]:
+        raise ValueError(f"时间轴有 {tl['counts']['overlap']} 处重叠，剪映轨道不允许重叠"
+                         f"（设置 COZE_TIMELINE_FIX=1 自动修正）")
 
     # ─── 4. 检查剪映草稿目录 ───
     if not JIANYING_DRAFT_ROOT.exists():
-        print(f"错误: 剪映草稿目录不存在: {JIANYING_DRAFT_ROOT}")
-        return
+        raise FileNotFoundError(f"剪映草稿目录不存在: {JIANYING_DRAFT_ROOT}")
 
     # ─── 5. 在临时目录中准备草稿 (避免剪映监控到不完整的草稿而删除) ───
-    project_name = generate_draft_title(data)
-    # 先在项目目录下的 temp/ 中构建, 最后整体移入剪映草稿目录
-    project_path = SCRIPT_DIR / "temp" / project_name
+    project_name = project_name or generate_draft_title(data)
+    # 多画布输出时草稿名加上配置名；素材获取在第一个草稿中进行
+    drafts = [(profile, f"{project_name}_{profile['name']}" if profile["name"] else project_name)
+              for profile in profiles]
+    profile, project_name = drafts[0]
+    # 草稿最终位置：素材路径从一开始就指向这里，移动后无需再改写 JSON
+    final_path = JIANYING_DRAFT_ROOT / project_name
+
+    # 增量更新：已有草稿（带状态文件）时原地更新，不复制模板、不移动目录
+    state = draft_update.load_state(final_path, (profile["width"], profile["height"])) if update else None
+    changes = None
+    if state is not None:
+        staging_dir = None
+        project_path = final_path
+        changes = draft_update.diff_payload(state["payload"], data, safe_parse)
+        print(f"增量更新草稿: {project_name}")
+        print("  变化: " + ", ".join(f"{k} {v['changed']}/{v['total']}" + (f" (删除 {v['removed']})" if v["removed"] else "")
+                                     for k, v in changes.items()))
+    else:
+        # 先在项目目录下的 temp/ 中构建, 最后整体移入剪映草稿目录
+        # 每次构建使用独立的子目录, 多个进程同时构建时互不干扰
+        staging_dir = SCRIPT_DIR / "temp" / f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        stagings.append(staging_dir)
+        project_path = staging_dir / project_name
 
-    print(f"创建草稿: {project_name}")
-    setup_project(project_path)
+        print(f"创建草稿: {project_name}")
+        setup_project(project_path)
+    phase_t = _phase_done(timings, "setup", phase_t)
 
     # ─── 6. 下载素材 ───
     materials_dir = project_path / "materials"
     materials_dir.mkdir(parents=True, exist_ok=True)
 
+    # 图片、音频、bg_image 兜底图一起并发获取；结果按原顺序消费，保证输出与兜底链不变
+    bg_url = ""
+    if images:
+        bg_list = safe_parse(data.get("bg_image", []))
+        if isinstance(bg_list, list) and bg_list:
+            bg_url = (bg_list[0] or {}).get("image_url", "")
+    image_urls = [img.get("image_url", "") for img in images]
+    audio_urls = [aud.get("audio_url", "") for aud in audios]
+
+    # 同一个 URL 只获取、落地一次：重复出现的位置指向首次出现的任务（job_for）
+    fetch_jobs = {}
+    job_for = {}
+    # 原地更新 + 图片规范化：上次规范化时改了扩展名的图片（image_{key}.png → .jpg），派生文件仍在时
+    # 任务直接指向它（状态 "exists"），不再重新落地、规范化。多画布输出时其余画布需要原图，不沿用
+    prenormalized = {}
+    if state and image_normalize.NORMALIZE_IMAGES and len(drafts) == 1:
+        saved = state.get("normalized") or {}
+        if saved.get("format") == image_normalize.NORMALIZE_FORMAT:
+            prenormalized = {orig: derived for orig, derived in saved.get("files", {}).items()
+                             if (materials_dir / derived).is_file()}
+    # 更新模式下文件名取自规范化 URL：URL 不变的素材在草稿中已存在，直接沿用（状态 "exists"）
+    if bg_url:
+        bg_name = draft_update.keyed_name("bg", bg_url, "png") if update else "bg_fallback.png"
+        fetch_jobs["bg"] = (bg_url, materials_dir / bg_name, "png")
+    for kind, urls, ext in (("image", image_urls, "png"), ("audio", audio_urls, "mp3")):
+        first = {}
+        for i, url in enumerate(urls):
+            if url:
+                key = first.setdefault(url, (kind, i))
+                job_for[(kind, i)] = key
+                if key == (kind, i):
+                    name = draft_update.keyed_name(kind, url, ext) if update else f"{kind}_{i}.{ext}"
+                    if kind == "image":
+                        name = prenormalized.get(name, name)
+                    fetch_jobs[key] = (url, materials_dir / name, ext)
+    if fetch_jobs:
+        print(f"并发获取 {len(fetch_jobs)} 个素材 (workers={fetch_workers})...")
+    # 相同文件（同一路径，或硬链接到同一份缓存数据）只创建一个素材，多个片段共享
+    materials = {}
+    # 原地更新：文件未变的素材沿用上次的探测结果（不再调用 pymediainfo）
+    probe_stats = {"reused": 0, "probed": 0}
+    # 流水线预探测的结果（按文件身份），登记素材时先查这里
+    probed = {}
+    video_factory = probed_factory(probed, draft.VideoMaterial)
+    audio_factory = probed_factory(probed, draft.AudioMaterial)
+    if state:
+        video_factory = draft_update.material_factory(draft.VideoMaterial, state["materials"], probe_stats,
+                                                      probe=video_factory)
+        audio_factory = draft_update.material_factory(draft.AudioMaterial, state["materials"], probe_stats,
+                                                      probe=audio_factory)
+
+    # 流水线：每个素材一就绪就在下载线程中探测媒体信息（pymediainfo），与其余素材的下载重叠；
+    # 素材登记与片段仍在下面按时间轴顺序进行，输出与逐步构建完全相同。
+    # 开启图片规范化时图片会被改写，只预先探测音频
+    job_keys = list(fetch_jobs)
+    probe_images = not image_normalize.NORMALIZE_IMAGES
+
+    def prepare_material(index, ok, status):
+        key = job_keys[index]
+        if not ok or key == "bg":
+            return  # bg_image 只在兜底时使用，用到时再探测
+        is_audio = key[0] == "audio"
+        if not (is_audio or probe_images):
+            return
+        cls = draft.AudioMaterial if is_audio else draft.VideoMaterial
+        path = fetch_jobs[key][1]
+        # 原地更新时文件未变的素材沿用上次的探测结果，不必预探测
+        if state and draft_update.restore_material(cls, path, state["materials"]) is not None:
+            return
+        try:
+            preprobe(probed, path, cls)
+        except Exception:
+            pass  # 探测失败的文件在创建片段时再次探测并照常报错
+
+    conn_before = http_pool.connection_stats()
+    cache_before = media_cache.cache_stats()
+    url_events = []
+    fetch_results = dict(zip(fetch_jobs, fetch_media(fetch_jobs.values(), workers=fetch_workers,
+                                                     events=url_events,
+                                                     on_done=prepare_material if STREAM_PREPARE else None)))
+    for key, event in zip(fetch_jobs, url_events):
+        event["kind"], event["index"] = (key, 0) if key == "bg" else key
+    conn = http_pool.diff_stats(conn_before, http_pool.connection_stats())
+    cache = media_cache.diff_stats(cache_before, media_cache.cache_stats())
+    if cache["hits"] + cache["shared_hits"] + cache["misses"]:
+        print(f"  缓存命中率: {media_cache.hit_rate(cache):.0%} "
+              f"({cache['hits']} 命中 / {cache['misses']} 未命中 / {cache['dedup']} 内容去重)")
+    if shared_cache.enabled():
+        rates = media_cache.tier_hit_rates(cache)
+        print("  分级命中率: " + " / ".join(f"{label} {rates[tier]:.0%}" for tier, label in
+                                       (("local", "本地"), ("shared", "共享")) if rates[tier] is not None)
+              + f" (共享 {cache['shared_hits']} 命中 / {cache['shared_stores']} 写回"
+              + (f" / {cache['shared_errors']} 出错" if cache["shared_errors"] else "") + ")")
+    if conn["requests"]:
+        print(f"  连接: {conn['requests']} 请求 / {conn['new_connections']} 新建 / "
+              f"{conn['reused_connections']} 复用 / {conn['retries']} 重试")
+
+    image_stats = {"total": len(images), "cached": 0, "downloaded": 0, "reused": 0, "fallback": 0}
     downloaded_images = []
     if images:
         print(f"获取 {len(images)} 张图片...")
         # bg_image 作为首张兜底（如果第一张图失败/缺失）
-        bg_list = safe_parse(data.get("bg_image", []))
         bg_local = None
-        if isinstance(bg_list, list) and bg_list:
-            bg_url = (bg_list[0] or {}).get("image_url", "")
-            if bg_url:
-                candidate = materials_dir / "bg_fallback.png"
-                ok, status = get_cached_or_download(bg_url, candidate, "png")
-                if ok:
-                    bg_local = candidate
+        if bg_url and fetch_results["bg"][0]:
+            bg_local = fetch_jobs["bg"][1]
 
         placeholder_local = ensure_white_png(materials_dir / "placeholder.png")
         prev_ok_local = None
         
         cached_count = 0
         downloaded_count = 0
+        reused_count = 0
 
         for i, img in enumerate(images):
-            url = img.get("image_url", "")
-            local = materials_dir / f"image_{i}.png"
+            url = image_urls[i]
+            local = None
             ok = False
             status_msg = ""
             
             if url:
-                ok, status = get_cached_or_download(url, local, "png")
+                local = fetch_jobs[job_for[("image", i)]][1]
+                ok, status = _job_status(fetch_results, job_for, ("image", i))
                 if status == "cached":
                     cached_count += 1
                     status_msg = "CACHED"
                 elif status == "downloaded":
                     downloaded_count += 1
                     status_msg = "OK"
+                elif status == "exists":
+                    reused_count += 1
+                    status_msg = "REUSED"
                 else:
                     status_msg = "FAIL"
 
@@ -443,7 +909,7 @@ def main():
                 if not url:
                     reason = "empty image_url"
                 else:
-                    reason = "download failed"
+                    reason = FAILURE_REASONS.get(status, "download failed")
 
                 fallback_src = prev_ok_local or bg_local or placeholder_local
                 fallback_label = (
@@ -451,32 +917,40 @@ def main():
                     ("bg_image" if bg_local else "placeholder")
                 )
 
-                if ensure_copy(fallback_src, local):
+                # 兜底图不再复制成 image_{i}.png，而是直接引用兜底源文件（同一个素材被多个片段共享）
+                if fallback_src.exists() and fallback_src.stat().st_size > 0:
+                    local = fallback_src
                     print(f"  [{i+1}/{len(images)}] FALLBACK ({reason}) -> {fallback_label}")
                 else:
-                    # 极端情况：兜底源也不可用，则强制写占位图到 local
-                    ensure_white_png(local)
+                    # 极端情况：兜底源也不可用，则强制重写占位图
+                    local = ensure_white_png(placeholder_local)
                     print(f"  [{i+1}/{len(images)}] FALLBACK ({reason}) -> placeholder (forced)")
 
             # 不管是否成功下载，都保持时间轴段数一致
             downloaded_images.append((i, img, local))
         
-        print(f"  统计: {cached_count} 缓存 / {downloaded_count} 下载 / {len(images) - cached_count - downloaded_count} 兜底")
+        fallback_count = len(images) - cached_count - downloaded_count - reused_count
+        print(f"  统计: {cached_count} 缓存 / {downloaded_count} 下载 / "
+              + (f"{reused_count} 沿用 / " if reused_count else "") + f"{fallback_count} 兜底")
+        image_stats.update(cached=cached_count, downloaded=downloaded_count, reused=reused_count,
+                           fallback=fallback_count)
 
+    audio_stats = {"total": len(audios), "cached": 0, "downloaded": 0, "reused": 0, "skipped": 0}
     downloaded_audios = []
     if audios:
         print(f"获取 {len(audios)} 段音频...")
         
         cached_count = 0
         downloaded_count = 0
+        reused_count = 0
         
         for i, aud in enumerate(audios):
-            url = aud.get("audio_url", "")
+            url = audio_urls[i]
             if not url:
                 print(f"  [{i+1}/{len(audios)}] SKIP - empty audio_url")
                 continue
-            local = materials_dir / f"audio_{i}.mp3"
-            ok, status = get_cached_or_download(url, local, "mp3")
+            local = fetch_jobs[job_for[("audio", i)]][1]
+            ok, status = _job_status(fetch_results, job_for, ("audio", i))
             
             if ok:
                 if status == "cached":
@@ -485,156 +959,356 @@ def main():
                 elif status == "downloaded":
                     downloaded_count += 1
                     print(f"  [{i+1}/{len(audios)}] OK")
+                elif status == "exists":
+                    reused_count += 1
+                    print(f"  [{i+1}/{len(audios)}] REUSED")
                 else:
                     print(f"  [{i+1}/{len(audios)}] OK")
                 downloaded_audios.append((i, aud, local))
             else:
-                print(f"  [{i+1}/{len(audios)}] FAIL - 跳过")
+                print(f"  [{i+1}/{len(audios)}] FAIL ({FAILURE_REASONS.get(status, 'download failed')}) - 跳过")
         
         if audios:
-            print(f"  统计: {cached_count} 缓存 / {downloaded_count} 下载")
-
-    # ─── 7. 构建 draft_content.json ───
-    script = ScriptFile(CANVAS_WIDTH, CANVAS_HEIGHT)
-
-    # 加载平台格式配置
-    platform_config = load_platform_config()
-    for key, value in platform_config.items():
-        script.content[key] = value
-
-    # 设置新的 ID 和时间戳
-    new_content_id = str(uuid.uuid4())
-    script.content["id"] = new_content_id
-    script.content["create_time"] = int(time.time())
-    script.content["update_time"] = int(time.time())
-
-    # 设置保存路径
-    draft_content_file = project_path / "draft_content.json"
-    script.save_path = str(draft_content_file)
-    script.duration = 0
-
-    # ─── 8. 添加视频轨道 ───
-    if downloaded_images:
-        script.add_track(draft.TrackType.video, "images")
-        for i, img, local in downloaded_images:
-            start = to_int_us(img.get("start", 0))
-            end = to_int_us(img.get("end", 0))
-            duration = end - start if end > start else 3000000
-            seg = draft.VideoSegment(str(local), trange(start, duration))
-            # 白色背景填充：竖屏画布下更自然（避免黑边）
-            try:
-                seg.add_background_filling("color", blur=0.0, color=BACKGROUND_COLOR)
-            except Exception:
-                pass
-            script.add_segment(seg, "images")
-
-    # ─── 9. 添加音频轨道 ───
-    if downloaded_audios:
-        script.add_track(draft.TrackType.audio, "audios")
-        for i, aud, local in downloaded_audios:
-            start = to_int_us(aud.get("start", 0))
-            duration = to_int_us(aud.get("duration", 0))
-            if duration <= 0:
-                end = to_int_us(aud.get("end", 0))
-                duration = end - start if end > start else 3000000
-            seg = draft.AudioSegment(str(local), trange(start, duration))
-            script.add_segment(seg, "audios")
-
-    # ─── 10. 生成字幕并导入 ───
-    if captions and text_timelines:
-        srt_path = project_path / "captions.srt"
-        with open(srt_path, "w", encoding="utf-8") as f:
-            for i, text in enumerate(captions):
-                if i < len(text_timelines):
-                    t = text_timelines[i]
-                    s = to_int_us(t.get("start", 0))
-                    e = to_int_us(t.get("end", 0))
-                    f.write(f"{i+1}\n")
-                    f.write(f"{_srt_time(s)} --> {_srt_time(e)}\n")
-                    f.write(f"{text}\n\n")
-        print(f"字幕: {len(captions)} 条")
-        # 构造一个“样式模板”，让导入的每条字幕继承该样式
-        style_ref = TextSegment(
-            "template",
-            trange(0, 1_000_000),
-            style=TextStyle(
-                size=SUBTITLE_FONT_SIZE,
-                align=1,  # 居中
-                auto_wrapping=True,
-                color=SUBTITLE_FILL_RGB,
-            ),
-            border=TextBorder(
-                alpha=1.0,
-                color=SUBTITLE_BORDER_RGB,
-                width=SUBTITLE_BORDER_WIDTH,
-            ),
-            shadow=TextShadow(
-                alpha=SUBTITLE_SHADOW_ALPHA,
-                color=SUBTITLE_SHADOW_RGB,
-                diffuse=SUBTITLE_SHADOW_DIFFUSE,
-                distance=SUBTITLE_SHADOW_DISTANCE,
-                angle=SUBTITLE_SHADOW_ANGLE,
-            ) if SUBTITLE_SHADOW_ALPHA > 0 else None,
-        )
-        script.import_srt(str(srt_path), "subtitles", style_reference=style_ref)
-
-    # ─── 11. 保存 draft_content.json ───
-    script.save()
-
-    # ─── 12. 生成 draft_info.json (剪映必需) ───
-    shutil.copy2(str(draft_content_file), str(project_path / "draft_info.json"))
-
-    # ─── 13. 写 timeline_layout.json ───
-    timeline_layout = {
-        "dockItems": [{
-            "dockIndex": 0,
-            "ratio": 1,
-            "timelineIds": [new_content_id],
-            "timelineNames": ["时间线01"]
-        }],
-        "layoutOrientation": 1
-    }
-    with open(project_path / "timeline_layout.json", "w", encoding="utf-8") as f:
-        json.dump(timeline_layout, f, ensure_ascii=False, indent=2)
+            print(f"  统计: {cached_count} 缓存 / {downloaded_count} 下载"
+                  + (f" / {reused_count} 沿用" if reused_count else ""))
+        audio_stats.update(cached=cached_count, downloaded=downloaded_count, reused=reused_count,
+                           skipped=len(audios) - len(downloaded_audios))
+
+    placed = media_cache.diff_stats(cache_before, media_cache.cache_stats())
+    if placed["bytes_copied"] + placed["bytes_linked"]:
+        print(f"素材落地 ({media_cache.MATERIALIZE_MODE}): "
+              f"{placed['bytes_copied'] / 1024 / 1024:.2f} MB 复制 / "
+              f"{placed['bytes_linked'] / 1024 / 1024:.2f} MB 链接")
+    if placed["expired"]:
+        print(f"未发请求: {placed['expired']} 个 URL 签名已过期")
+    if placed["negative_hits"]:
+        print(f"未发请求: {placed['negative_hits']} 个 URL 近期失败过（负缓存，清除: python clean_cache.py --clear-failures）")
+    for host, failures in http_pool.circuit_state().items():
+        print(f"熔断: {host} 连续失败 {failures} 次")
+
+    phase_t = _phase_done(timings, "fetch", phase_t)
+
+    # 多画布输出：其余草稿各自在临时目录中初始化，素材文件从第一个草稿链接过去
+    # （reflink / 硬链接，不支持时复制；不用符号链接，第一个草稿移动后会失效）。
+    # 在图片规范化之前链接原图：每个画布再按自己的尺寸规范化
+    builds = [(profile, project_name, project_path, final_path, staging_dir, timings)]
+    for extra_profile, extra_name in drafts[1:]:
+        extra_t = time.perf_counter()
+        extra_staging = SCRIPT_DIR / "temp" / f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        stagings.append(extra_staging)
+        print(f"创建草稿: {extra_name}（共享素材）")
+        setup_project(extra_staging / extra_name)
+        for src in materials_dir.iterdir():
+            media_cache.materialize(src, extra_staging / extra_name / "materials" / src.name, mode="auto")
+        extra_timings = {}
+        _phase_done(extra_timings, "setup", extra_t)
+        builds.append((extra_profile, extra_name, extra_staging / extra_name,
+                       JIANYING_DRAFT_ROOT / extra_name, extra_staging, extra_timings))
+
+    results = []
+    # 第一个草稿中各素材文件对应的素材对象（其余草稿复制后改指向，第一个草稿此时可能已移走）
+    first_materials = {}
+    for index, (profile, project_name, project_path, final_path, staging_dir, timings) in enumerate(builds):
+        phase_t = time.perf_counter()
+        materials_dir = project_path / "materials"
+        clones = {}
+        build_images = downloaded_images if not index else \
+            [(i, img, materials_dir / Path(local).name) for i, img, local in downloaded_images]
+
+        # 可选：图片缩小到本画布尺寸、按真实格式落地（派生图按 (内容, 尺寸, 格式) 缓存，多画布输出时各画布各处理一次）
+        normalize_stats = None
+        mapping = {}
+        derived_names = set(prenormalized.values()) if not index else set()
+        if image_normalize.NORMALIZE_IMAGES and build_images:
+            mapping, normalize_stats = image_normalize.normalize_images(
+                [local for _, _, local in build_images if Path(local).name not in derived_names],
+                profile["width"], profile["height"])
+            build_images = [(i, img, mapping.get(str(local), local)) for i, img, local in build_images]
+            n = normalize_stats
+            label = f" [{profile['name']}]" if profile["name"] else ""
+            print(f"图片规范化{label}: {n['resized']} 缩小 / {n['transcoded']} 转码 / {n['cached']} 派生缓存 / "
+                  f"{n['unchanged']} 无需处理, {n['bytes_in'] / 1024 / 1024:.2f} MB → {n['bytes_out'] / 1024 / 1024:.2f} MB")
+            phase_t = _phase_done(timings, "normalize", phase_t)
+        # 规范化后各画布的图片不同：其余草稿的图片各自探测，不沿用第一个草稿的素材对象
+        own_images = not index or image_normalize.NORMALIZE_IMAGES
+        image_materials = materials if not index else {}
+
+        # ─── 7. 构建 draft_content.json ───
+        script = ScriptFile(profile["width"], profile["height"])
+
+        # 加载平台格式配置
+        platform_config = load_platform_config()
+        for key, value in platform_config.items():
+            script.content[key] = value
+
+        # 设置新的 ID 和时间戳（原地更新时沿用草稿 id 与创建时间）
+        new_content_id = state["content_id"] if state else str(uuid.uuid4())
+        script.content["id"] = new_content_id
+        script.content["create_time"] = state["create_time"] if state else int(time.time())
+        script.content["update_time"] = int(time.time())
+
+        script.duration = 0
+
+        # ─── 8. 添加视频轨道（片段按规范化后的时间顺序加入） ───
+        if build_images:
+            script.add_track(draft.TrackType.video, "images")
+            timeline.sorted_track(script.tracks["images"])
+            image_locals = {i: local for i, _, local in build_images}
+            first_locals = {i: local for i, _, local in downloaded_images}
+            for i, start, duration in tl["images"]:
+                local = image_locals[i]
+                if own_images:
+                    material = shared_material(image_materials, local, video_factory)
+                    if not index:
+                        first_materials[str(local)] = material
+                else:
+                    material = relocate_material(first_materials[str(first_locals[i])], local, clones)
+                seg = draft.VideoSegment(material, trange(start, duration))
+                # 背景填充（默认白色）：画布比例与图片不一致时更自然（避免黑边）
+                try:
+                    if profile["background"] == "blur":
+                        seg.add_background_filling("blur", blur=BACKGROUND_BLUR)
+                    else:
+                        seg.add_background_filling("color", blur=0.0, color=profile["background"])
+                except Exception:
+                    pass
+                script.add_segment(seg, "images")
+
+        # ─── 9. 添加音频轨道 ───
+        if downloaded_audios:
+            script.add_track(draft.TrackType.audio, "audios")
+            timeline.sorted_track(script.tracks["audios"])
+            audio_locals = {i: local for i, _, local in downloaded_audios}
+            for i, start, duration in tl["audios"]:
+                local = audio_locals.get(i)
+                if local is None:
+                    continue
+                if index:
+                    material = relocate_material(first_materials[str(local)], materials_dir / Path(local).name, clones)
+                else:
+                    material = first_materials[str(local)] = shared_material(materials, local, audio_factory)
+                if tl["fixed"] and duration > material.duration:
+                    # 音频文件比时间轴上的区间短：截到文件结尾
+                    duration = material.duration
+                seg = draft.AudioSegment(material, trange(start, duration))
+                script.add_segment(seg, "audios")
+
+        phase_t = _phase_done(timings, "tracks", phase_t)
+
+        # ─── 10. 生成字幕轨道 ───
+        subtitle_count = 0
+        if tl["captions"]:
+            subtitle_count = add_subtitles(script, captions, tl["captions"], profile=profile)
+            print(f"字幕: {subtitle_count} 条")
+            if EXPORT_SRT:
+                write_srt(project_path / "captions.srt", captions, tl["captions"])
+
+        phase_t = _phase_done(timings, "subtitles", phase_t)
+
+        # 素材在临时目录中落地（构建素材时需要探测文件），写盘前把路径指向最终位置
+        retarget_material_paths(script, project_path, final_path)
+
+        # ─── 11. 保存 draft_content.json ───
+        # ─── 12. 生成 draft_info.json (剪映必需, 内容与 draft_content.json 相同) ───
+        # 草稿内容只序列化一次，两个文件由同一份缓冲写出
+        draft_bytes = draft_writer.write_draft(script, project_path)
+
+        # ─── 13. 写 timeline_layout.json（原地更新时草稿 id 不变，无需重写） ───
+        if not state:
+            timeline_layout = {
+                "dockItems": [{
+                    "dockIndex": 0,
+                    "ratio": 1,
+                    "timelineIds": [new_content_id],
+                    "timelineNames": ["时间线01"]
+                }],
+                "layoutOrientation": 1
+            }
+            with open(project_path / "timeline_layout.json", "w", encoding="utf-8") as f:
+                json.dump(timeline_layout, f, ensure_ascii=False, indent=2)
+
+        # 更新模式：删除不再被引用的素材文件，保存状态供下次对比
+        removed_files = []
+        if update:
+            # 片段用到的文件（内容相同的文件共享一个素材，但各自保留，下次更新时仍可直接沿用）
+            referenced = {Path(m.path).name for m in script.materials.videos + script.materials.audios}
+            referenced |= {Path(local).name for _, _, local in build_images + downloaded_audios}
+            ours = set(state["files"] if state else ()) | {Path(job[1]).name for job in fetch_jobs.values()}
+            # 兜底用的占位图与 bg_image 即使本次没被引用也保留
+            keep = {"placeholder.png"} | ({Path(fetch_jobs["bg"][1]).name} if "bg" in fetch_jobs else set())
+            for name in sorted(ours - referenced - keep):
+                if (materials_dir / name).exists():
+                    (materials_dir / name).unlink()
+                    removed_files.append(name)
+            draft_update.save_state(project_path, {
+                "canvas": [profile["width"], profile["height"]],
+                "content_id": new_content_id,
+                "create_time": script.content["create_time"],
+                "payload": data,
+                "files": sorted(n for n in ours | referenced | keep if (materials_dir / n).exists()),
+                # 规范化后改名的图片：原文件名 → 派生文件名（下次更新时派生文件仍在即沿用）
+                "normalized": {
+                    "format": image_normalize.NORMALIZE_FORMAT,
+                    "files": {orig: derived for orig, derived in
+                              [*(prenormalized.items() if not index else ()),
+                               *((Path(src).name, Path(dst).name) for src, dst in mapping.items())]
+                              if derived in referenced},
+                } if image_normalize.NORMALIZE_IMAGES else None,
+                # 素材路径已指向最终位置，按草稿当前目录中的文件记录探测结果
+                "materials": {Path(m.path).name: draft_update.material_info(m, materials_dir / Path(m.path).name)
+                              for m in script.materials.videos + script.materials.audios},
+            })
+            if removed_files:
+                print(f"删除不再引用的素材: {len(removed_files)} 个")
+
+        phase_t = _phase_done(timings, "write", phase_t)
+
+        # ─── 14. 将完整草稿移入剪映草稿目录（原地更新时已就位） ───
+        if not state:
+            install_draft(project_path, final_path)
+            project_path = final_path
+            print(f"已移入剪映草稿目录")
+        phase_t = _phase_done(timings, "move", phase_t)
+
+        # ─── 15. 验证 ───
+        # 统计来自内存中的草稿内容（写盘时已填充），不再重新解析文件
+        dc = script.content
+        print(f"\n验证:")
+        print(f"  platform.os: {dc['platform']['os']}")
+        print(f"  duration: {dc['duration']}")
+        print(f"  tracks: {len(dc['tracks'])}")
+        for t in dc['tracks']:
+            print(f"    {t['type']}: {len(t['segments'])} segments")
+        print(f"  videos: {len(dc['materials']['videos'])}")
+        print(f"  audios: {len(dc['materials']['audios'])}")
+        print(f"  texts: {len(dc['materials']['texts'])}")
+
+        print(f"\n草稿已保存到: {project_path}")
+        print(f"请打开【剪映】查找草稿: {project_name}")
+        _phase_done(timings, "verify", phase_t)
+
+        metrics = {
+            "name": project_name,
+            "profile": profile["name"],
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "total_seconds": round(sum(timings.values()), 4),
+            "timings": timings,
+            "images": image_stats,
+            "audios": audio_stats,
+            "subtitles": subtitle_count,
+            "timeline": {"duration": tl["duration"], "issues": tl["counts"], "fixed": tl["fixed"]},
+            "normalize": normalize_stats,
+            "materials": {"videos": len(script.materials.videos), "audios": len(script.materials.audios)},
+            "bytes": {
+                "downloaded": placed["bytes_downloaded"],
+                "from_cache": sum(e["bytes"] for e in url_events if e["status"] == "cached"),
+                "copied": placed["bytes_copied"],
+                "linked": placed["bytes_linked"],
+                "draft": draft_bytes,
+            },
+            "cache": cache,
+            "cache_tiers": media_cache.tier_hit_rates(cache),
+            "connections": conn,
+            "update": None if not update else {
+                "mode": "in_place" if state else "full",
+                "changes": changes,
+                "materials_reused": probe_stats["reused"],
+                "materials_probed": probe_stats["probed"],
+                "files_removed": len(removed_files),
+            },
+            "urls": url_events,
+        }
+        if index:
+            # 素材获取由第一个草稿完成并计入其记录，其余草稿不重复计入（图片规范化各画布各自计入）
+            metrics.update(cache=None, cache_tiers=None, connections=None, urls=[])
+            metrics["bytes"].update(downloaded=0, from_cache=0, copied=0, linked=0)
+        draft_metrics.append_metrics(metrics, metrics_file)
+
+        results.append({
+            "name": project_name,
+            "profile": profile["name"],
+            "path": str(project_path),
+            "images": len(downloaded_images),
+            "audios": len(downloaded_audios),
+            "captions": len(captions),
+            "duration": dc["duration"],
+            "draft_bytes": draft_bytes,
+            "timings": timings,
+            "metrics": metrics,
+        })
+    return results
+
+
+def main(metrics_file: str = None, profile_path: str = None, trace_memory: bool = False, update: bool = False,
+         profiles: list[str] = None, export_dir: str = None):
+    # ─── 1. 检查 template/ 目录 ───
+    if not TEMPLATE_DIR.exists():
+        print(f"错误: 模板目录不存在: {TEMPLATE_DIR}")
+        print("请确保 template/ 目录包含必要的模板文件")
+        return
 
-    # ─── 14. 将完整草稿移入剪映草稿目录 ───
-    final_path = JIANYING_DRAFT_ROOT / project_name
-    if final_path.exists():
-        shutil.rmtree(str(final_path))
-    shutil.move(str(project_path), str(final_path))
-
-    # 修复路径: 将 draft_content.json 和 draft_info.json 中的临时路径替换为最终路径
-    temp_prefix = str(project_path)
-    final_prefix = str(final_path)
-    for json_file in ["draft_content.json", "draft_info.json"]:
-        fp = final_path / json_file
-        if fp.exists():
-            with open(fp, "r", encoding="utf-8") as f:
-                text = f.read()
-            text = text.replace(temp_prefix, final_prefix)
-            with open(fp, "w", encoding="utf-8") as f:
-                f.write(text)
-
-    project_path = final_path
-    draft_content_file = project_path / "draft_content.json"
-    print(f"已移入剪映草稿目录")
-
-    # ─── 15. 验证 ───
-    print(f"\n验证:")
-    with open(draft_content_file, "r") as f:
-        dc = json.load(f)
-    print(f"  platform.os: {dc['platform']['os']}")
-    print(f"  duration: {dc['duration']}")
-    print(f"  tracks: {len(dc['tracks'])}")
-    for t in dc['tracks']:
-        print(f"    {t['type']}: {len(t['segments'])} segments")
-    print(f"  videos: {len(dc['materials']['videos'])}")
-    print(f"  audios: {len(dc['materials']['audios'])}")
-    print(f"  texts: {len(dc['materials']['texts'])}")
-
-    print(f"\n草稿已保存到: {project_path}")
-    print(f"请打开【剪映】查找草稿: {project_name}")
+    # ─── 2. 读取输入 ───
+    print("请粘贴 Coze JSON 数据, 按 Ctrl+D (macOS) 结束:")
+    raw = sys.stdin.read().strip()
+    if not raw:
+        print("错误: 没有输入数据")
+        return
+
+    data = json.loads(raw)
+
+    try:
+        with draft_metrics.profiled(profile_path, trace_memory):
+            results = build_drafts(data, profiles, metrics_file=metrics_file, update=update)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"错误: {e}")
+        return
+
+    for result in results:
+        m = result["metrics"]
+        label = f"[{result['profile']}] " if result["profile"] else ""
+        print(f"\n{label}耗时: {m['total_seconds']:.2f}s ("
+              + ", ".join(f"{k} {v:.2f}s" for k, v in m["timings"].items()) + ")")
+    if metrics_file or draft_metrics.METRICS_FILE:
+        print(f"指标已追加到: {metrics_file or draft_metrics.METRICS_FILE}")
+
+    if export_dir:
+        # draft_package 依赖本模块，在这里导入避免循环导入
+        import draft_package
+        for result in results:
+            out = Path(export_dir) / f"{result['name']}.zip"
+            stats = draft_package.export_draft(Path(result["path"]), out)
+            print(f"已导出草稿包: {out} ({stats['files']} 个文件, 耗时 {stats['seconds']:.2f}s)")
 
 
 if __name__ == "__main__":
-    main()
+    usage = (f"用法: {sys.argv[0]} [--update] [--canvases 9x16,16x9,1x1] [--export 目录] [--metrics metrics.jsonl]"
+             f" [--profile out.prof] [--tracemalloc] < data.json")
+    metrics_file = None
+    profile_path = None
+    canvases = None
+    export_dir = None
+
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--metrics":
+                metrics_file = args[i + 1]
+            elif arg == "--profile":
+                profile_path = args[i + 1]
+            elif arg == "--export":
+                export_dir = args[i + 1]
+            elif arg == "--canvases":
+                canvases = [name.strip() for name in args[i + 1].split(",") if name.strip()]
+                for name in canvases:
+                    canvas_profile(name)
+    except IndexError:
+        print(usage)
+        sys.exit(1)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    if canvases and len(canvases) > 1 and "--update" in args:
+        print("错误: 增量更新模式一次只能更新一个画布的草稿（--canvases 只能指定一个）")
+        sys.exit(1)
+
+    main(metrics_file, profile_path, "--tracemalloc" in args, "--update" in args, canvases, export_dir)
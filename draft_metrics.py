@@ -0,0 +1,75 @@
+"""
+运行指标：每次生成草稿输出一条结构化记录，并可选地开启 cProfile / tracemalloc 定位热点
+
+- 指标记录（build_draft 返回值中的 metrics）：各阶段耗时、图片/音频的缓存/下载/兜底计数、
+  下载字节数与缓存字节数、连接统计，以及每个 URL 的耗时 / 大小 / 状态
+- 设置 COZE_METRICS_FILE（或 coze_draft.py --metrics FILE）后，每条记录以一行 JSON 追加到该文件
+- coze_draft.py --profile out.prof / --tracemalloc：对整次运行做 CPU / 内存剖析
+"""
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import tracemalloc
+from pathlib import Path
+
+# ================= 配置 =================
+
+# 指标文件（JSONL，每次运行追加一行；为空表示不写文件）
+METRICS_FILE = os.environ.get("COZE_METRICS_FILE", "")
+# 剖析报告打印的条目数
+PROFILE_TOP = 20
+
+_write_lock = threading.Lock()
+
+
+def append_metrics(record: dict, path=None):
+    """把一条指标记录以一行 JSON 追加到指标文件（path 为 None 时使用 METRICS_FILE）"""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with _write_lock:
+        # 整行一次 write，多个进程同时追加也不会交错
+        fd = os.open(str(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+@contextlib.contextmanager
+def profiled(profile_path=None, trace_memory: bool = False):
+    """
+    在 with 块内开启 cProfile / tracemalloc，结束时打印热点。
+
+    Args:
+        profile_path: cProfile 结果保存路径（None 表示不做 CPU 剖析；可用 snakeviz 等工具查看）
+        trace_memory: 是否用 tracemalloc 统计内存分配
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(str(profile_path))
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            print(f"\n【CPU 剖析】已保存到 {profile_path}")
+            print(out.getvalue())
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"\n【内存剖析】峰值 {peak / 1024 / 1024:.2f} MB, 结束时 {current / 1024 / 1024:.2f} MB")
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP]:
+                print(f"  {stat}")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+草稿打包：把生成好的草稿导出为一个 zip，在另一台机器（剪映所在的 Mac / Windows）上导入
+
+- 导出：草稿目录中的文件逐个流式写入 zip，不另外复制一份草稿；可直接写到 stdout，经 ssh 传给编辑机
+- 已压缩的媒体（png / jpg / mp3 / mp4 ...）原样存储（ZIP_STORED），只压缩 JSON 等文本文件
+- draft_content.json / draft_info.json 中的素材绝对路径改写为占位符 {{COZE_DRAFT_DIR}}/materials/...，
+  与构建机的目录结构无关
+- 导入：解压到剪映草稿目录下的隐藏临时目录，只改写这两个 JSON 中的占位符，再原子就位（同名草稿被替换）
+- 包根目录的 coze_package.json 记录草稿名、占位符与文件数
+
+用法:
+    python draft_package.py export 草稿目录 [输出.zip | -]
+    python draft_package.py import 包.zip|- [--root 剪映草稿目录] [--name 新草稿名]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import coze_draft
+
+# ================= 配置 =================
+
+# 包中代替草稿目录绝对路径的占位符
+PATH_TOKEN = "{{COZE_DRAFT_DIR}}"
+# 包描述文件
+MANIFEST_NAME = "coze_package.json"
+PACKAGE_VERSION = 1
+# 含素材路径、需要改写的文件
+PATH_FILES = ("draft_content.json", "draft_info.json")
+# 原样存储的扩展名（已压缩，再压缩只费 CPU）
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".mp3", ".m4a", ".aac", ".mp4", ".mov", ".zip"}
+# 文本文件的压缩级别（1 最快 ~ 9 最小）
+COMPRESS_LEVEL = 6
+
+
+def _json_prefixes(path: str) -> list[bytes]:
+    """路径在 JSON 中可能出现的写法（标准库 ensure_ascii 开 / 关，orjson 与后者相同），带开头的引号"""
+    forms = {json.dumps(path, ensure_ascii=False)[:-1], json.dumps(path)[:-1]}
+    return [f.encode("utf-8") for f in forms]
+
+
+def tokenize_paths(data: bytes, draft_paths: list) -> tuple[bytes, int]:
+    """
+    把 JSON 中以草稿目录开头的路径改为占位符。
+
+    Args:
+        data: JSON 文件内容
+        draft_paths: 草稿目录可能的写法（如原路径与 resolve 后的路径）
+
+    Returns:
+        (改写后的内容, 改写的路径数)
+    """
+    count = 0
+    for path in dict.fromkeys(str(p) for p in draft_paths):
+        for sep in dict.fromkeys(("/", os.sep)):
+            for prefix in _json_prefixes(path + sep):
+                count += data.count(prefix)
+                data = data.replace(prefix, json.dumps(PATH_TOKEN + "/")[:-1].encode("utf-8"))
+    return data, count
+
+
+def resolve_paths(data: bytes, draft_path: Path) -> tuple[bytes, int]:
+    """把占位符改回目标草稿目录的绝对路径，返回 (改写后的内容, 改写的路径数)"""
+    token = json.dumps(PATH_TOKEN + "/")[:-1].encode("utf-8")
+    target = json.dumps(str(draft_path) + os.sep, ensure_ascii=False)[:-1].encode("utf-8")
+    return data.replace(token, target), data.count(token)
+
+
+def export_draft(draft_path: Path, out) -> dict:
+    """
+    把草稿导出为 zip。
+
+    Args:
+        draft_path: 草稿目录
+        out: 输出文件路径，或可写的二进制流（如 sys.stdout.buffer，不需要可 seek）
+
+    Returns:
+        {"name", "files", "stored", "deflated", "paths", "bytes_in", "seconds"}
+        paths 为改写成占位符的素材路径处数（两个 JSON 合计）
+
+    Raises:
+        FileNotFoundError: 草稿目录或 draft_content.json 不存在
+    """
+    start = time.perf_counter()
+    draft_path = Path(draft_path)
+    if not (draft_path / "draft_content.json").is_file():
+        raise FileNotFoundError(f"不是草稿目录（缺少 draft_content.json）: {draft_path}")
+    name = draft_path.name
+    stats = {"name": name, "files": 0, "stored": 0, "deflated": 0, "paths": 0, "bytes_in": 0}
+
+    if isinstance(out, (str, Path)):
+        Path(out).parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(out).with_name(f"{Path(out).name}.{os.getpid()}.tmp")
+        target = open(tmp, "wb")
+    else:
+        tmp, target = None, out
+    try:
+        with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+            for path in sorted(draft_path.rglob("*")):
+                if not path.is_file():
+                    continue
+                rel = path.relative_to(draft_path).as_posix()
+                arcname = f"{name}/{rel}"
+                if rel in PATH_FILES:
+                    data, count = tokenize_paths(path.read_bytes(), [draft_path.absolute(), draft_path.resolve()])
+                    stats["paths"] += count
+                    zf.writestr(arcname, data)
+                    stats["deflated"] += 1
+                elif path.suffix.lower() in STORED_EXTENSIONS:
+                    zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+                    stats["stored"] += 1
+                else:
+                    zf.write(path, arcname)
+                    stats["deflated"] += 1
+                stats["files"] += 1
+                stats["bytes_in"] += path.stat().st_size
+            zf.writestr(MANIFEST_NAME, json.dumps({
+                "version": PACKAGE_VERSION,
+                "name": name,
+                "token": PATH_TOKEN,
+                "files": stats["files"],
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }, ensure_ascii=False, indent=2))
+    except BaseException:
+        if tmp is not None:
+            target.close()
+            tmp.unlink(missing_ok=True)
+        raise
+    if tmp is not None:
+        target.close()
+        os.replace(tmp, out)
+    stats["seconds"] = round(time.perf_counter() - start, 4)
+    return stats
+
+
+def import_draft(archive, draft_root: Path = None, name: str = None) -> dict:
+    """
+    导入草稿包：解压到剪映草稿目录下的临时目录，改写占位符后原子就位。
+
+    Args:
+        archive: zip 文件路径，或可 seek 的二进制流
+        draft_root: 剪映草稿目录（None 表示 coze_draft.JIANYING_DRAFT_ROOT）
+        name: 导入后的草稿名（None 表示沿用包中的草稿名）
+
+    Returns:
+        {"name", "path", "files", "paths", "seconds"}
+
+    Raises:
+        FileNotFoundError: 剪映草稿目录不存在
+        ValueError: 不是草稿包、包中没有 draft_content.json，或包中有不安全的路径
+    """
+    start = time.perf_counter()
+    draft_root = Path(draft_root or coze_draft.JIANYING_DRAFT_ROOT)
+    if not draft_root.exists():
+        raise FileNotFoundError(f"剪映草稿目录不存在: {draft_root}")
+
+    with zipfile.ZipFile(archive) as zf:
+        try:
+            manifest = json.loads(zf.read(MANIFEST_NAME))
+        except KeyError:
+            raise ValueError(f"不是草稿包（缺少 {MANIFEST_NAME}）")
+        if manifest.get("version") != PACKAGE_VERSION or manifest.get("token") != PATH_TOKEN:
+            raise ValueError(f"不支持的草稿包版本: {manifest.get('version')}")
+        src_name = manifest["name"]
+        name = coze_draft.sanitize_filename(name) if name else src_name
+        final_path = draft_root / name
+
+        members = [m for m in zf.infolist() if m.filename != MANIFEST_NAME and not m.is_dir()]
+        for m in members:
+            parts = Path(m.filename).parts
+            if parts[0] != src_name or ".." in parts or Path(m.filename).is_absolute():
+                raise ValueError(f"草稿包中有不安全的路径: {m.filename}")
+        # 没有草稿内容的包（导出中断、手工打包出错）导入后剪映打不开，在创建临时目录之前拒绝
+        if f"{src_name}/{PATH_FILES[0]}" not in {m.filename for m in members}:
+            raise ValueError(f"草稿包不完整: 缺少 {src_name}/{PATH_FILES[0]}")
+
+        # 临时目录与最终位置在同一目录下，就位是一次 rename
+        staging = draft_root / f".{name}.{os.getpid()}.importing"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            paths = 0
+            for m in members:
+                rel = Path(m.filename).relative_to(src_name)
+                dst = staging / rel
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                if rel.as_posix() in PATH_FILES:
+                    data, count = resolve_paths(zf.read(m), final_path)
+                    paths += count
+                    dst.write_bytes(data)
+                else:
+                    with zf.open(m) as src, open(dst, "wb") as f:
+                        shutil.copyfileobj(src, f, 1024 * 1024)
+            coze_draft.install_draft(staging, final_path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    return {"name": name, "path": str(final_path), "files": len(members), "paths": paths,
+            "seconds": round(time.perf_counter() - start, 4)}
+
+
+if __name__ == "__main__":
+    usage = (f"用法: {sys.argv[0]} export 草稿目录 [输出.zip | -]\n"
+             f"      {sys.argv[0]} import 包.zip|- [--root 剪映草稿目录] [--name 新草稿名]")
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] not in ("export", "import"):
+        print(usage)
+        sys.exit(1)
+
+    if args[0] == "export":
+        draft_path = Path(args[1])
+        if len(args) > 2 and args[2] == "-":
+            out = sys.stdout.buffer
+        elif len(args) > 2:
+            out = Path(args[2])
+        else:
+            out = Path.cwd() / f"{draft_path.name}.zip"
+        try:
+            stats = export_draft(draft_path, out)
+        except FileNotFoundError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            sys.exit(1)
+        # 写到 stdout 时提示信息走 stderr
+        log = sys.stderr if out is sys.stdout.buffer else sys.stdout
+        print(f"已导出: {stats['name']} → {'stdout' if out is sys.stdout.buffer else out}", file=log)
+        print(f"  {stats['files']} 个文件（{stats['stored']} 原样存储 / {stats['deflated']} 压缩）, "
+              f"{stats['bytes_in'] / 1024 / 1024:.2f} MB, {stats['paths']} 处素材路径改为占位符, "
+              f"耗时 {stats['seconds']:.2f}s", file=log)
+        sys.exit(0)
+
+    root = None
+    name = None
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--root":
+                root = Path(args[i + 1])
+            elif arg == "--name":
+                name = args[i + 1]
+    except IndexError:
+        print(usage)
+        sys.exit(1)
+
+    try:
+        if args[1] == "-":
+            # zip 需要随机读取：stdin 先落到临时文件
+            with tempfile.TemporaryFile() as buf:
+                shutil.copyfileobj(sys.stdin.buffer, buf, 1024 * 1024)
+                buf.seek(0)
+                result = import_draft(buf, root, name)
+        else:
+            result = import_draft(Path(args[1]), root, name)
+    except (FileNotFoundError, ValueError, zipfile.BadZipFile) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print(f"已导入: {result['path']}")
+    print(f"  {result['files']} 个文件, {result['paths']} 处素材路径指向新位置, 耗时 {result['seconds']:.2f}s")
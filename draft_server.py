@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+草稿生成守护进程：在本机常驻，通过 HTTP 接收 Coze JSON 数据并生成剪映草稿
+
+- 常驻进程只在启动时付一次 Python 启动 / pyJianYingDraft 导入 / 模板与平台配置读取的成本
+- 任务排队：最多 SERVER_WORKERS 个草稿同时构建，排队任务超过 SERVER_QUEUE_MAX 时返回 503
+- 只监听 127.0.0.1
+
+接口:
+    POST /drafts            请求体与 coze_draft.py 从 stdin 读取的 JSON 相同；等待构建完成后返回
+                            {"job_id", "status", "name", "path", "timings", ...}
+    POST /drafts?async=1    立即返回 202 和 job_id，之后用 GET /jobs/{job_id} 查询
+    POST /drafts?update=1   增量更新模式：同一 topic~hook_type~output_language 的草稿原地更新（可与 async 组合）
+    GET  /jobs/{job_id}     查询任务状态与结果
+    GET  /health            队列深度、连接与缓存统计
+    POST /reload            立即重新编译 template/（模板修改后也会在 1 秒内自动发现）
+
+用法: python draft_server.py [--port 8765] [--workers 2]
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import coze_draft
+import http_pool
+import media_cache
+
+# ================= 配置 =================
+
+SERVER_HOST = "127.0.0.1"
+# 监听端口（可通过环境变量 COZE_SERVER_PORT 覆盖）
+SERVER_PORT = int(os.environ.get("COZE_SERVER_PORT", "8765"))
+# 同时构建的草稿数（可通过环境变量 COZE_SERVER_WORKERS 覆盖）
+SERVER_WORKERS = int(os.environ.get("COZE_SERVER_WORKERS", "2"))
+# 排队（含构建中）的任务上限，超过后拒绝新任务
+SERVER_QUEUE_MAX = int(os.environ.get("COZE_SERVER_QUEUE_MAX", "32"))
+# 保留的已完成任务数（供 GET /jobs 查询）
+SERVER_JOB_HISTORY = 200
+# 请求体大小上限
+SERVER_MAX_BODY = 32 * 1024 * 1024
+
+
+class DraftService:
+    """任务队列：有界线程池 + 任务表"""
+
+    def __init__(self, workers: int = SERVER_WORKERS, queue_max: int = SERVER_QUEUE_MAX):
+        self.workers = max(1, workers)
+        self.queue_max = queue_max
+        # 每个构建的素材下载并发按构建数均分，避免同时构建时连接数翻倍
+        self.fetch_workers = max(2, coze_draft.FETCH_WORKERS // self.workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="draft")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def warm_up(self):
+        """预编译模板（含平台配置），并建立共享 HTTP 会话"""
+        coze_draft.load_template_bundle()
+        http_pool.get_session()
+
+    def submit(self, data: dict, update: bool = False) -> dict:
+        """提交一份数据（update: 增量更新模式）；队列已满时返回 None"""
+        with self._lock:
+            if self._pending >= self.queue_max:
+                return None
+            self._pending += 1
+            job = {
+                "job_id": uuid.uuid4().hex[:12],
+                "status": "queued",
+                "submitted": time.time(),
+                "done": threading.Event(),
+            }
+            self._jobs[job["job_id"]] = job
+            while len(self._jobs) > SERVER_JOB_HISTORY + self.queue_max:
+                self._jobs.popitem(last=False)
+        self._pool.submit(self._run, job, data, update)
+        return job
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: dict, data: dict, update: bool = False):
+        job["status"] = "running"
+        job["started"] = time.time()
+        try:
+            job["result"] = coze_draft.build_draft(data, fetch_workers=self.fetch_workers, update=update)
+            job["status"] = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job["status"] = "failed"
+            job["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            job["finished"] = time.time()
+            with self._lock:
+                self._pending -= 1
+            job["done"].set()
+
+    def describe(self, job: dict) -> dict:
+        """任务的 JSON 表示"""
+        info = {"job_id": job["job_id"], "status": job["status"]}
+        if "started" in job:
+            info["queued_seconds"] = round(job["started"] - job["submitted"], 4)
+        if "finished" in job:
+            info["total_seconds"] = round(job["finished"] - job["submitted"], 4)
+        if "result" in job:
+            info.update(job["result"])
+        if "error" in job:
+            info["error"] = job["error"]
+        return info
+
+    def health(self) -> dict:
+        with self._lock:
+            pending = self._pending
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "pending": pending,
+            "queue_max": self.queue_max,
+            "draft_root": str(coze_draft.JIANYING_DRAFT_ROOT),
+            "connections": http_pool.connection_stats(),
+            "cache": media_cache.cache_stats(),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+class DraftRequestHandler(BaseHTTPRequestHandler):
+    service: DraftService = None
+
+    def log_message(self, fmt, *args):
+        sys.stderr.write(f"[server] {self.address_string()} {fmt % args}\n")
+
+    def _send_json(self, code: int, obj: dict):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, self.service.health())
+        elif path.startswith("/jobs/"):
+            job = self.service.get(path[len("/jobs/"):])
+            if job is None:
+                self._send_json(404, {"error": "任务不存在"})
+            else:
+                self._send_json(200, self.service.describe(job))
+        else:
+            self._send_json(404, {"error": "未知接口"})
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/reload":
+            coze_draft.reload_templates()
+            self.service.warm_up()
+            self._send_json(200, {"status": "reloaded"})
+            return
+        if parts.path != "/drafts":
+            self._send_json(404, {"error": "未知接口"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > SERVER_MAX_BODY:
+            self._send_json(400, {"error": "请求体为空或过大"})
+            return
+        try:
+            data = json.loads(self.rfile.read(length))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self._send_json(400, {"error": f"JSON 解析失败: {e}"})
+            return
+        if not isinstance(data, dict):
+            self._send_json(400, {"error": "数据不是 JSON 对象"})
+            return
+
+        query = parse_qs(parts.query)
+        job = self.service.submit(data, update=query.get("update", ["0"])[0] not in ("", "0"))
+        if job is None:
+            self._send_json(503, {"error": "任务队列已满，请稍后重试"})
+            return
+
+        if query.get("async", ["0"])[0] not in ("", "0"):
+            self._send_json(202, self.service.describe(job))
+            return
+        job["done"].wait()
+        self._send_json(200 if job["status"] == "done" else 500, self.service.describe(job))
+
+
+def serve(port: int = SERVER_PORT, workers: int = SERVER_WORKERS) -> tuple:
+    """
+    在后台线程启动守护服务（测试与嵌入使用）。
+
+    Returns:
+        (server, service)，结束时调用 server.shutdown() 和 service.shutdown()
+    """
+    if not coze_draft.TEMPLATE_DIR.exists():
+        raise FileNotFoundError(f"模板目录不存在: {coze_draft.TEMPLATE_DIR}")
+    service = DraftService(workers)
+    service.warm_up()
+    handler = type("Handler", (DraftRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((SERVER_HOST, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, service
+
+
+if __name__ == "__main__":
+    usage = f"用法: {sys.argv[0]} [--port 8765] [--workers 2]"
+    port = SERVER_PORT
+    workers = SERVER_WORKERS
+
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--port":
+                port = int(args[i + 1])
+            elif arg == "--workers":
+                workers = int(args[i + 1])
+    except (ValueError, IndexError):
+        print(usage)
+        sys.exit(1)
+
+    try:
+        server, service = serve(port, workers)
+    except (FileNotFoundError, OSError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    if not coze_draft.JIANYING_DRAFT_ROOT.exists():
+        print(f"警告: 剪映草稿目录不存在: {coze_draft.JIANYING_DRAFT_ROOT}（可用 COZE_DRAFT_ROOT 指定）")
+    print(f"草稿服务已启动: http://{SERVER_HOST}:{port} (workers={service.workers}), Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("正在停止...")
+        server.shutdown()
+        service.shutdown()
@@ -0,0 +1,186 @@
+"""
+增量更新：按稳定的草稿身份（topic~hook_type~output_language）原地更新已有草稿
+
+- 草稿目录中保存一份状态文件 .coze_state.json：上次的 Coze 数据、草稿 id、各素材文件的探测结果
+- 更新模式下素材文件按规范化 URL 命名（image_{key}.png），URL 不变的素材直接沿用草稿中已有的文件，
+  不下载、不落地；文件未变（大小 + 修改时间）的素材沿用上次的探测结果，不再调用 pymediainfo
+- 草稿 id / 素材 id 保持不变，draft_content.json 与 draft_info.json 原子替换；不再被引用的素材文件随后删除
+- 同一草稿的更新按文件锁串行，守护进程 / 批量模式并发更新同一草稿时不会互相覆盖
+"""
+import contextlib
+import json
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from pyJianYingDraft import AudioMaterial, VideoMaterial
+from pyJianYingDraft.local_materials import CropSettings
+
+import media_cache
+
+# ================= 配置 =================
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+
+# 草稿目录中的状态文件名
+STATE_FILE = ".coze_state.json"
+# 状态文件格式版本（不一致时整体重建）
+STATE_VERSION = 1
+# 更新锁目录（不放在剪映草稿目录中）
+UPDATE_LOCK_DIR = SCRIPT_DIR / "temp" / "locks"
+# 素材文件名中规范化 URL 哈希的位数
+KEY_CHARS = 12
+
+
+def keyed_name(kind: str, url: str, ext: str) -> str:
+    """更新模式下的素材文件名：同一资源（含重新签发的 URL）在多次更新之间文件名不变"""
+    return f"{kind}_{media_cache.url_to_cache_key(url)[:KEY_CHARS]}.{ext}"
+
+
+def load_state(draft_path: Path, canvas: tuple) -> dict:
+    """
+    读取草稿的状态文件。
+
+    Returns:
+        状态 dict；草稿或状态文件不存在、版本或画布尺寸不一致时返回 None（需要整体重建）
+    """
+    path = Path(draft_path) / STATE_FILE
+    if not path.is_file() or not (Path(draft_path) / "draft_content.json").is_file():
+        return None
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if state.get("version") != STATE_VERSION or tuple(state.get("canvas", ())) != tuple(canvas):
+        return None
+    return state
+
+
+def save_state(draft_path: Path, state: dict):
+    """原子写入状态文件"""
+    path = Path(draft_path) / STATE_FILE
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"version": STATE_VERSION, **state}, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+@contextlib.contextmanager
+def update_lock(name: str):
+    """同一草稿的更新互斥（跨进程）"""
+    if fcntl is None:
+        yield
+        return
+    UPDATE_LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    with open(UPDATE_LOCK_DIR / f"{name}.lock", "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# ================= 数据对比 =================
+
+def _slots(data: dict, field: str, url_key: str, parse) -> list[str]:
+    """把列表字段的每一项归一成可比较的字符串（URL 取规范化形式，签名轮换不算变化）"""
+    items = parse(data.get(field, []))
+    slots = []
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get(url_key):
+            item = {**item, url_key: media_cache.canonicalize_url(item[url_key])}
+        slots.append(json.dumps(item, ensure_ascii=False, sort_keys=True))
+    return slots
+
+
+def diff_payload(old: dict, new: dict, parse) -> dict:
+    """
+    逐项对比两份 Coze 数据。
+
+    Args:
+        old, new: 上次与本次的数据
+        parse: 字段解析函数（coze_draft.safe_parse）
+
+    Returns:
+        {"images" / "audios" / "captions" / "bg_image": {"changed": 变化（含新增）的项数, "removed": 删除的项数, "total"}}
+    """
+    def compare(a: list, b: list) -> dict:
+        changed = sum(1 for i, item in enumerate(b) if i >= len(a) or a[i] != item)
+        return {"changed": changed, "removed": max(0, len(a) - len(b)), "total": len(b)}
+
+    def captions(data):
+        caps = data.get("text_cap", []) or []
+        timelines = data.get("text_timelines", []) or []
+        return [json.dumps([c, timelines[i] if i < len(timelines) else None], ensure_ascii=False, sort_keys=True)
+                for i, c in enumerate(caps)]
+
+    return {
+        "images": compare(_slots(old, "image_list", "image_url", parse), _slots(new, "image_list", "image_url", parse)),
+        "audios": compare(_slots(old, "audio_list", "audio_url", parse), _slots(new, "audio_list", "audio_url", parse)),
+        "captions": compare(captions(old), captions(new)),
+        "bg_image": compare(_slots(old, "bg_image", "image_url", parse), _slots(new, "bg_image", "image_url", parse)),
+    }
+
+
+# ================= 素材探测结果复用 =================
+
+def material_info(material, path: Path) -> dict:
+    """素材对象 → 可保存的探测结果（path 为素材文件当前位置；按文件大小与修改时间判断文件是否变化）"""
+    st = os.stat(path)
+    info = {"material_id": material.material_id, "duration": material.duration,
+            "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if isinstance(material, VideoMaterial):
+        info.update(material_type=material.material_type, width=material.width, height=material.height)
+    return info
+
+
+def restore_material(factory, path: Path, known: dict):
+    """
+    用保存的探测结果重建素材对象（不调用 pymediainfo，素材 id 保持不变）。
+
+    Returns:
+        素材对象；没有记录或文件已变化时返回 None
+    """
+    path = os.path.abspath(path)
+    info = known.get(os.path.basename(path))
+    if info is None:
+        return None
+    st = os.stat(path)
+    if st.st_size != info["size"] or st.st_mtime_ns != info["mtime_ns"]:
+        return None
+    if (factory is VideoMaterial) != ("material_type" in info):
+        return None
+    material = factory.__new__(factory)
+    material.material_name = os.path.basename(path)
+    material.material_id = info["material_id"]
+    material.path = path
+    material.duration = info["duration"]
+    if factory is VideoMaterial:
+        material.crop_settings = CropSettings()
+        material.local_material_id = ""
+        material.material_type = info["material_type"]
+        material.width, material.height = info["width"], info["height"]
+    return material
+
+
+def material_factory(factory, known: dict, stats: dict, probe=None):
+    """
+    包装 VideoMaterial / AudioMaterial：有可用的探测结果时直接重建，否则照常探测。
+    stats["reused"] / stats["probed"] 分别累加。
+
+    Args:
+        probe: 没有可用结果时调用的探测函数（默认 factory 本身；流水线模式下为先查预探测结果的包装）
+    """
+    def make(path):
+        material = restore_material(factory, path, known)
+        if material is None:
+            stats["probed"] += 1
+            return (probe or factory)(path)
+        stats["reused"] += 1
+        return material
+
+    make.__name__ = factory.__name__
+    return make
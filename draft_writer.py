@@ -0,0 +1,152 @@
+"""
+草稿文件写入：draft_content.json 与 draft_info.json 只序列化一次
+
+- 草稿内容序列化成一份 bytes，两个文件都由这份缓冲写出（可选硬链接第二个文件）
+- 先写临时文件再原子替换：原地更新已有草稿时，剪映不会读到写了一半的文件
+- 默认缩进 4 格，与 pyJianYingDraft 的 ScriptFile.dumps() 逐字节相同；
+  紧凑模式（只由 COZE_DRAFT_COMPACT 开启）不缩进，文件更小、写得更快（剪映读取不受影响）
+- 安装了 orjson 时自动使用，否则退回标准库 json；两个后端输出的格式相同
+- fill_content 对照 pyJianYingDraft 0.2.5 的 ScriptFile.dumps()；安装的版本不同时改为调用 dumps() 填充
+"""
+import json
+import os
+import re
+from importlib import metadata
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from pyJianYingDraft import ScriptFile
+
+# ================= 配置 =================
+
+# 紧凑模式（可通过环境变量 COZE_DRAFT_COMPACT=1 开启）：不缩进输出
+DRAFT_COMPACT = os.environ.get("COZE_DRAFT_COMPACT", "0") not in ("", "0")
+# 非紧凑输出的缩进（与 ScriptFile.dumps() 相同；orjson 只支持 2 格，输出后把行首缩进加倍）
+DRAFT_INDENT = 4
+# JSON 后端："auto"（有 orjson 用 orjson）/ "orjson" / "json"
+DRAFT_JSON_BACKEND = os.environ.get("COZE_DRAFT_JSON_BACKEND", "auto")
+# draft_info.json 用硬链接指向 draft_content.json（默认关闭：两个文件内容相同，但剪映可能分别改写）
+DRAFT_INFO_HARDLINK = False
+# 与草稿内容完全相同的文件
+DRAFT_CONTENT_FILES = ("draft_content.json", "draft_info.json")
+# fill_content 照搬的 ScriptFile.dumps() 所在的 pyJianYingDraft 版本
+PYJIANYINGDRAFT_VERSION = "0.2.5"
+
+try:
+    _INSTALLED_VERSION = metadata.version("pyJianYingDraft")
+except metadata.PackageNotFoundError:
+    _INSTALLED_VERSION = None
+
+# orjson 的 2 格缩进 → 4 格：JSON 字符串里不会有裸换行，行首空格只可能是缩进
+_LEADING_SPACES = re.compile(rb"(?m)^( +)")
+
+
+def fill_content(script: ScriptFile) -> dict:
+    """
+    把轨道与素材导出到 script.content（与 ScriptFile.dumps() 的填充步骤相同，但不做序列化）。
+
+    Returns:
+        script.content
+    """
+    if _INSTALLED_VERSION != PYJIANYINGDRAFT_VERSION:
+        # 其它版本的填充步骤可能不同，交给 dumps() 本身（多一次序列化）
+        script.dumps()
+        return script.content
+    content = script.content
+    content["fps"] = script.fps
+    content["duration"] = script.duration
+    content["canvas_config"] = {"width": script.width, "height": script.height, "ratio": "original"}
+    content["materials"] = script.materials.export_json()
+
+    # 合并导入的素材
+    for material_type, material_list in script.imported_materials.items():
+        if material_type not in content["materials"]:
+            content["materials"][material_type] = material_list
+        else:
+            content["materials"][material_type].extend(material_list)
+
+    # 对轨道排序并导出（新加入的轨道在列表末尾，即上层）
+    track_list = list(script.imported_tracks) + list(script.tracks.values())
+    track_list.sort(key=lambda track: track.render_index)
+    content["tracks"] = [track.export_json() for track in track_list]
+    return content
+
+
+def _use_orjson(backend: str) -> bool:
+    backend = backend or DRAFT_JSON_BACKEND
+    if backend == "orjson" and orjson is None:
+        raise ImportError("未安装 orjson（pip install orjson）")
+    return orjson is not None and backend in ("auto", "orjson")
+
+
+def serialize_content(content: dict, compact: bool = None, backend: str = None) -> bytes:
+    """
+    序列化草稿内容为 UTF-8 bytes。
+
+    Args:
+        content: 草稿内容（fill_content 的返回值）
+        compact: 是否紧凑输出（None 表示使用 DRAFT_COMPACT）
+        backend: JSON 后端（None 表示使用 DRAFT_JSON_BACKEND）
+    """
+    if compact is None:
+        compact = DRAFT_COMPACT
+    if _use_orjson(backend):
+        try:
+            if compact:
+                return orjson.dumps(content)
+            data = orjson.dumps(content, option=orjson.OPT_INDENT_2)
+            return _LEADING_SPACES.sub(lambda m: m.group(1) * (DRAFT_INDENT // 2), data)
+        except TypeError:
+            pass  # orjson 不支持的类型（如超出 64 位的整数），退回标准库
+    if compact:
+        text = json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(content, ensure_ascii=False, indent=DRAFT_INDENT)
+    return text.encode("utf-8")
+
+
+def write_draft(script: ScriptFile, project_path: Path, compact: bool = None,
+                backend: str = None, hardlink: bool = None) -> int:
+    """
+    序列化一次草稿内容，写出 draft_content.json 与 draft_info.json。
+
+    Args:
+        script: 草稿
+        project_path: 草稿目录
+        compact: 是否紧凑输出（None 表示使用 DRAFT_COMPACT）
+        backend: JSON 后端（None 表示使用 DRAFT_JSON_BACKEND）
+        hardlink: draft_info.json 是否硬链接到 draft_content.json（None 表示使用 DRAFT_INFO_HARDLINK）
+
+    Returns:
+        单个文件的字节数
+    """
+    if hardlink is None:
+        hardlink = DRAFT_INFO_HARDLINK
+    data = serialize_content(fill_content(script), compact=compact, backend=backend)
+
+    first = Path(project_path) / DRAFT_CONTENT_FILES[0]
+    _replace_bytes(first, data)
+    for name in DRAFT_CONTENT_FILES[1:]:
+        path = Path(project_path) / name
+        if hardlink:
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            try:
+                tmp.unlink(missing_ok=True)
+                os.link(first, tmp)
+                os.replace(tmp, path)
+                continue
+            except OSError:
+                tmp.unlink(missing_ok=True)  # 不支持硬链接的文件系统，照常写入
+        _replace_bytes(path, data)
+    return len(data)
+
+
+def _replace_bytes(path: Path, data: bytes):
+    """写入同目录下的临时文件后原子替换 path"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
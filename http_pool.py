@@ -0,0 +1,254 @@
+"""
+共享 HTTP 连接池：所有素材下载复用同一个 requests.Session
+
+- keep-alive：同一主机（oceancloudapi / CDN）的连接在请求之间复用，省去重复的 TCP+TLS 握手
+- 每主机连接数上限：超过上限的线程排队等待空闲连接（pool_block）
+- 重试：连接错误 / 读超时 / 5xx 按指数退避 + 随机抖动自动重试
+- 熔断：同一主机连续失败（连接错误 / 超时 / 5xx）达到阈值后，冷却期内的请求直接失败，不再等待超时
+- 计数器：请求数 / 新建连接数 / 复用连接数 / 重试次数 / 熔断拦截数，用于观察握手节省
+"""
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# ================= 配置 =================
+
+# 缓存连接池的主机数（不同 CDN 节点各占一个）
+HTTP_POOL_HOSTS = 32
+# 每个主机最多保持的连接数（可通过环境变量 COZE_HTTP_POOL_MAXSIZE 覆盖）
+HTTP_POOL_MAXSIZE = int(os.environ.get("COZE_HTTP_POOL_MAXSIZE", "8"))
+# 失败重试次数（可通过环境变量 COZE_HTTP_RETRIES 覆盖，0 = 不重试）
+HTTP_RETRIES = int(os.environ.get("COZE_HTTP_RETRIES", "3"))
+# 指数退避：第 n 次重试前等待 backoff_factor * 2^(n-1) 秒，再叠加 [0, jitter) 的随机抖动
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_BACKOFF_JITTER = 0.3
+HTTP_BACKOFF_MAX = 10.0
+# 触发重试的状态码
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+# 熔断阈值：同一主机连续失败这么多次后熔断（可通过环境变量 COZE_CIRCUIT_FAILURES 覆盖，0 = 关闭熔断）
+CIRCUIT_FAILURES = int(os.environ.get("COZE_CIRCUIT_FAILURES", "5"))
+# 熔断冷却时间（秒）：冷却结束后放行一个探测请求，成功则恢复，失败则继续熔断
+CIRCUIT_COOLDOWN = float(os.environ.get("COZE_CIRCUIT_COOLDOWN", "30"))
+
+
+# ================= 计数器 =================
+
+_stats = {"requests": 0, "new_connections": 0, "retries": 0, "circuits_opened": 0, "short_circuited": 0}
+_stats_lock = threading.Lock()
+# 当前运行自己的计数器，由 run_stats() 设置（与 media_cache.run_stats 相同）
+_run_stats: contextvars.ContextVar = contextvars.ContextVar("http_pool_run_stats", default=None)
+
+
+def _incr(name: str, n: int = 1):
+    with _stats_lock:
+        _stats[name] += n
+        run = _run_stats.get()
+        if run is not None:
+            run[name] += n
+
+
+@contextmanager
+def run_stats():
+    """在此上下文内单独计数：期间 connection_stats() 只返回本次运行的统计"""
+    token = _run_stats.set(dict.fromkeys(_stats, 0))
+    try:
+        yield
+    finally:
+        _run_stats.reset(token)
+
+
+def connection_stats() -> dict:
+    """
+    返回连接统计：run_stats() 内为本次运行的累计，否则为进程内累计（调用方可前后取两次做差得到其间的数据）。
+
+    Returns:
+        {"requests", "new_connections", "reused_connections", "retries", "circuits_opened", "short_circuited"}
+    """
+    with _stats_lock:
+        run = _run_stats.get()
+        stats = dict(_stats if run is None else run)
+    stats["reused_connections"] = max(0, stats["requests"] - stats["new_connections"])
+    return stats
+
+
+def diff_stats(before: dict, after: dict) -> dict:
+    """两次 connection_stats() 之差"""
+    return {k: after[k] - before.get(k, 0) for k in after}
+
+
+# ================= 熔断 =================
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """主机处于熔断状态，请求未发出"""
+
+
+# 主机 → {"failures": 连续失败次数, "open_until": 熔断结束时间（monotonic）}
+_circuits: dict[str, dict] = {}
+_circuits_lock = threading.Lock()
+
+
+def _circuit_check(host: str):
+    """主机处于熔断冷却期时抛出 CircuitOpenError；冷却结束后放行一个探测请求"""
+    if CIRCUIT_FAILURES <= 0:
+        return
+    with _circuits_lock:
+        state = _circuits.get(host)
+        if state is None or state["failures"] < CIRCUIT_FAILURES:
+            return
+        now = time.monotonic()
+        if now < state["open_until"]:
+            _incr("short_circuited")
+            raise CircuitOpenError(f"{host} 连续失败 {state['failures']} 次，已熔断"
+                                   f"（{state['open_until'] - now:.0f}s 后重试）")
+        # 探测请求的结果出来之前，其余请求继续熔断
+        state["open_until"] = now + CIRCUIT_COOLDOWN
+
+
+def _circuit_record(host: str, ok: bool):
+    with _circuits_lock:
+        if ok:
+            _circuits.pop(host, None)
+            return
+        state = _circuits.setdefault(host, {"failures": 0, "open_until": 0.0})
+        state["failures"] += 1
+        if CIRCUIT_FAILURES > 0 and state["failures"] >= CIRCUIT_FAILURES:
+            if state["failures"] == CIRCUIT_FAILURES:
+                _incr("circuits_opened")
+            state["open_until"] = time.monotonic() + CIRCUIT_COOLDOWN
+
+
+def circuit_state() -> dict:
+    """返回处于熔断状态的主机 {host: 连续失败次数}"""
+    with _circuits_lock:
+        return {host: s["failures"] for host, s in _circuits.items()
+                if CIRCUIT_FAILURES > 0 and s["failures"] >= CIRCUIT_FAILURES}
+
+
+def reset_circuits():
+    """清除所有主机的熔断状态"""
+    with _circuits_lock:
+        _circuits.clear()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _incr("new_connections")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _incr("requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _incr("new_connections")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _incr("requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class _CountingRetry(Retry):
+    def increment(self, *args, **kwargs):
+        new_retry = super().increment(*args, **kwargs)
+        _incr("retries")
+        return new_retry
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        # 一次 send 包含 urllib3 的全部重试，重试用尽仍失败才计为该主机的一次失败
+        host = urlsplit(request.url).netloc
+        _circuit_check(host)
+        try:
+            response = super().send(request, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            _circuit_record(host, False)
+            raise
+        _circuit_record(host, response.status_code not in HTTP_RETRY_STATUS)
+        return response
+
+
+def _build_retry(retries: int) -> Retry:
+    params = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        status_forcelist=HTTP_RETRY_STATUS,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        raise_on_status=False,  # 重试用尽后返回最后一次响应，由调用方按状态码处理
+        respect_retry_after_header=True,
+    )
+    try:
+        return _CountingRetry(backoff_jitter=HTTP_BACKOFF_JITTER, backoff_max=HTTP_BACKOFF_MAX, **params)
+    except TypeError:
+        # urllib3 < 2 不支持 backoff_jitter / backoff_max
+        return _CountingRetry(**params)
+
+
+def new_session(retries: int = None, pool_maxsize: int = None) -> requests.Session:
+    """创建一个带连接池与重试策略的 Session（参数为 None 时使用模块配置的当前值）"""
+    if retries is None:
+        retries = HTTP_RETRIES
+    if pool_maxsize is None:
+        pool_maxsize = HTTP_POOL_MAXSIZE
+    session = requests.Session()
+    adapter = _PooledAdapter(
+        pool_connections=HTTP_POOL_HOSTS,
+        pool_maxsize=max(1, pool_maxsize),
+        pool_block=True,
+        max_retries=_build_retry(retries),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    获取进程内共享的 Session（懒加载，线程安全）。
+    fork 出的子进程会重新创建，避免与父进程共用 socket。
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = new_session()
+            _session_pid = pid
+        return _session
+
+
+def close_session():
+    """关闭共享 Session，释放所有保持的连接"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
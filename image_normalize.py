@@ -0,0 +1,182 @@
+"""
+图片规范化（可选）：把 AI 生成的大图缩小到画布尺寸，并按真实格式落地
+
+- 按文件头（magic bytes）识别真实格式：下载的图片一律存为 image_{i}.png，实际可能是 JPEG / WebP
+- 超过画布的图片等比缩小到画布以内（不放大）；没有透明通道的图片转为 JPEG，有透明通道的保留 PNG
+- 在进程池中并行处理（缩放是 CPU 密集型，线程受 GIL 限制）
+- 派生图缓存：key = (源文件 sha256, 目标尺寸, 格式)，重复构建、不同画布比例都不会重复计算
+- 依赖 Pillow（pip install Pillow）；未安装时跳过规范化，草稿照常生成
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import media_cache
+
+# ================= 配置 =================
+
+# 是否启用图片规范化（可通过环境变量 COZE_NORMALIZE_IMAGES=1 开启）
+NORMALIZE_IMAGES = os.environ.get("COZE_NORMALIZE_IMAGES", "0") not in ("", "0")
+# 并行进程数（默认 = CPU 核数，1 = 在当前进程内逐个处理）
+NORMALIZE_WORKERS = int(os.environ.get("COZE_NORMALIZE_WORKERS", "0")) or (os.cpu_count() or 1)
+# 输出格式："auto"（无透明通道转 JPEG，否则 PNG）/ "png" / "jpeg"
+NORMALIZE_FORMAT = os.environ.get("COZE_NORMALIZE_FORMAT", "auto")
+NORMALIZE_JPEG_QUALITY = 90
+# 派生图缓存目录（默认与素材缓存目录并列：coze_cache/derived；可随时整体删除，下次构建时重新生成）
+DERIVED_DIR = os.environ.get("COZE_DERIVED_DIR", "")
+
+# 文件头 → 格式
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+)
+_EXT = {"png": ".png", "jpeg": ".jpg", "gif": ".gif", "webp": ".webp", "bmp": ".bmp"}
+
+
+def detect_format(path: Path) -> str:
+    """按文件头识别图片格式，返回 "png" / "jpeg" / "webp" / "gif" / "bmp"，无法识别时返回 ""。"""
+    with open(path, "rb") as f:
+        head = f.read(16)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return ""
+
+
+def derived_dir() -> Path:
+    return Path(DERIVED_DIR) if DERIVED_DIR else media_cache.CACHE_DIR.parent / "derived"
+
+
+def _sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _has_alpha(img) -> bool:
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def _normalize_one(src: str, width: int, height: int, fmt: str, derived_dir: str) -> dict:
+    """
+    规范化一张图片（在工作进程中执行）。
+
+    Returns:
+        {"src", "derived"（派生图路径，无需处理时为 None）, "status", "format", "bytes_in", "bytes_out"}
+        status: "cached"（派生图已存在）/ "resized" / "transcoded" / "unchanged" / "unknown"（无法识别）
+    """
+    src_path = Path(src)
+    bytes_in = src_path.stat().st_size
+    result = {"src": src, "derived": None, "status": "unchanged", "format": detect_format(src_path),
+              "bytes_in": bytes_in, "bytes_out": bytes_in}
+    if not result["format"]:
+        result["status"] = "unknown"
+        return result
+
+    digest = _sha256(src_path)
+    shard = Path(derived_dir) / digest[:2]
+    stem = f"{digest}_{width}x{height}_{fmt}"
+    # 无需处理的图片也留一个标记，下次不必再打开解码
+    marker = shard / f"{stem}.same"
+    if marker.exists():
+        return result
+    for ext in (".jpg", ".png"):
+        cached = shard / f"{stem}{ext}"
+        if cached.exists():
+            result.update(derived=str(cached), status="cached", bytes_out=cached.stat().st_size)
+            return result
+
+    with Image.open(src_path) as img:
+        img.load()
+        alpha = _has_alpha(img)
+        target_fmt = fmt if fmt != "auto" else ("png" if alpha else "jpeg")
+        too_big = img.width > width or img.height > height
+        same_format = target_fmt == result["format"]
+        if not too_big and same_format:
+            shard.mkdir(parents=True, exist_ok=True)
+            marker.touch()
+            return result
+
+        out = img
+        if too_big:
+            out = img.copy()
+            out.thumbnail((width, height), Image.LANCZOS)
+        shard.mkdir(parents=True, exist_ok=True)
+        dst = shard / f"{stem}{_EXT[target_fmt]}"
+        tmp = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+        if target_fmt == "jpeg":
+            if out.mode != "RGB":
+                out = out.convert("RGB")
+            out.save(tmp, "JPEG", quality=NORMALIZE_JPEG_QUALITY, optimize=True)
+        else:
+            out.save(tmp, "PNG", optimize=True)
+        os.replace(tmp, dst)
+
+    result.update(derived=str(dst), status="resized" if too_big else "transcoded",
+                  bytes_out=dst.stat().st_size)
+    return result
+
+
+def normalize_images(paths: list, width: int, height: int, workers: int = None,
+                     fmt: str = None) -> tuple[dict, dict]:
+    """
+    规范化一批草稿图片：派生图落地到草稿目录（与原文件同名、扩展名按真实格式），原文件删除。
+
+    Args:
+        paths: 草稿 materials/ 中的图片路径（可有重复，重复的只处理一次）
+        width, height: 画布尺寸
+        workers: 进程数（None 表示 NORMALIZE_WORKERS）
+        fmt: 输出格式（None 表示 NORMALIZE_FORMAT）
+
+    Returns:
+        ({原路径: 新路径}, 统计 {"resized", "transcoded", "cached", "unchanged", "unknown", "bytes_in", "bytes_out"})
+    """
+    stats = {"resized": 0, "transcoded": 0, "cached": 0, "unchanged": 0, "unknown": 0,
+             "bytes_in": 0, "bytes_out": 0}
+    if Image is None:
+        print("  图片规范化已跳过: 未安装 Pillow (pip install Pillow)")
+        return {}, stats
+
+    fmt = fmt or NORMALIZE_FORMAT
+    unique = list(dict.fromkeys(str(p) for p in paths))
+    workers = max(1, min(workers or NORMALIZE_WORKERS, len(unique)))
+    args = [(p, width, height, fmt, str(derived_dir())) for p in unique]
+    if workers == 1:
+        results = [_normalize_one(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_normalize_one, *zip(*args)))
+
+    mapping = {}
+    for r in results:
+        stats[r["status"]] += 1
+        stats["bytes_in"] += r["bytes_in"]
+        stats["bytes_out"] += r["bytes_out"]
+        src = Path(r["src"])
+        if r["derived"] is None:
+            # 无需重新编码，但扩展名与真实格式不符时改名（如 JPEG 存成了 .png）
+            ext = _EXT.get(r["format"])
+            if ext and src.suffix.lower() not in (ext, ".jpeg" if ext == ".jpg" else ext):
+                dst = src.with_suffix(ext)
+                os.replace(src, dst)
+                mapping[str(src)] = dst
+            continue
+        dst = src.with_suffix(Path(r["derived"]).suffix)
+        media_cache.materialize(Path(r["derived"]), dst)
+        if dst != src:
+            src.unlink(missing_ok=True)
+        mapping[str(src)] = dst
+    return mapping, stats
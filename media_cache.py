@@ -0,0 +1,1127 @@
+"""
+全局媒体缓存：URL → 规范化 URL → MD5 → coze_cache/media/{hash[:2]}/{hash}.{ext}
+
+- URL 规范化：按主机规则去掉轮换的签名/过期参数（x-expires / x-signature / lk3s ...），
+  同一个 TTS 文件被工作流重新签发后仍能命中缓存；未匹配规则的 URL 原样使用
+- 内容去重（可选）：下载后计算 sha256，内容相同的不同 URL 通过硬链接共享同一份数据
+- 缓存索引：SQLite 记录每个缓存文件的大小 / 最近访问 / 命中次数 / sha256，
+  超出容量预算时按 LRU/LFU 自动淘汰（代价与淘汰数量成正比，不扫描目录）
+- 原子下载：先写入 {name}.part，校验 Content-Length / Content-Type 后再原子改名；
+  中断的大文件下次用 HTTP Range 续传，不会留下被当作缓存命中的截断文件
+- 零拷贝落地：缓存文件以 reflink / 硬链接 / 符号链接 / 复制 之一放入草稿 materials/，
+  跨设备或文件系统不支持时自动降级为复制
+- 负缓存：下载失败的 URL 连同失败原因、有效期登记到索引，有效期内重放同一份数据不再发请求；
+  查询参数 x-expires 已过期的签名 URL 在请求前直接判定失败（已缓存的资源照常命中）
+- 跨进程单飞：同一缓存文件的下载受文件锁保护，多个 coze_draft 进程并发时只有一个真正下载，
+  其余等待后直接命中缓存；缓存文件按 hash 前缀分到 256 个子目录，避免单目录文件过多
+- 共享二级缓存（可选，见 shared_cache.py）：本地未命中时先查多台构建机共用的 blob 存储，再回源；
+  回源下载的文件写回共享缓存
+- 计数器：命中 / 未命中 / 内容去重 / 淘汰次数 / 复制与链接字节数 / 锁等待次数 / 过期与负缓存拦截数，用于统计每次运行的数据
+"""
+import contextvars
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+import http_pool
+import shared_cache
+
+# ================= 配置 =================
+SCRIPT_DIR = Path(__file__).parent.resolve()
+
+# 全局媒体缓存目录（避免重复下载相同 URL 的资源，可通过环境变量 COZE_CACHE_DIR 覆盖）
+CACHE_DIR = Path(os.environ.get("COZE_CACHE_DIR") or SCRIPT_DIR / "coze_cache" / "media")
+# 缓存索引文件名（位于 CACHE_DIR 下）
+CACHE_INDEX_NAME = "index.sqlite"
+# 分片子目录名取 hash 的前几位（2 位 = 256 个子目录）
+CACHE_SHARD_CHARS = 2
+
+# 缓存容量预算（字节，可通过环境变量 COZE_CACHE_MAX_BYTES 覆盖，0 = 不限制）
+CACHE_MAX_BYTES = int(os.environ.get("COZE_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+# 淘汰策略："lru"（最久未访问优先）或 "lfu"（命中次数最少优先）
+CACHE_EVICTION_POLICY = os.environ.get("COZE_CACHE_EVICTION_POLICY", "lru")
+# 自动淘汰不会删除最近这么多秒内访问过的文件（避免淘汰本次运行正在使用的素材）
+CACHE_EVICTION_GRACE = 300
+
+# 缓存 → 草稿 materials/ 的落地方式（可通过环境变量 COZE_MATERIALIZE_MODE 覆盖）：
+#   "auto"     reflink → hardlink → copy，依次尝试
+#   "reflink"  写时复制克隆（APFS / Btrfs / XFS），不支持时复制
+#   "hardlink" 硬链接，跨设备时复制
+#   "symlink"  符号链接（注意：缓存文件被淘汰后草稿中的链接会失效）
+#   "copy"     完整复制（旧行为）
+MATERIALIZE_MODE = os.environ.get("COZE_MATERIALIZE_MODE", "auto")
+
+DOWNLOAD_TIMEOUT = 30
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"
+# 下载中途断开时，在同一次调用内用 Range 续传的次数
+DOWNLOAD_RESUME_ATTEMPTS = 2
+# 小于该大小的残留 .part 直接重新下载（续传只对大文件有意义）
+DOWNLOAD_RESUME_MIN_BYTES = 256 * 1024
+# 校验响应的 Content-Type 与期望的文件类型一致（拦截过期链接返回的 HTML/JSON 错误页）
+CHECK_CONTENT_TYPE = True
+# 扩展名 → 可接受的 Content-Type 前缀；未列出的扩展名不校验
+EXPECTED_CONTENT_TYPES = {
+    ".png": ("image/",), ".jpg": ("image/",), ".jpeg": ("image/",), ".webp": ("image/",),
+    ".gif": ("image/",),
+    ".mp3": ("audio/",), ".wav": ("audio/",), ".m4a": ("audio/",), ".aac": ("audio/",),
+    ".mp4": ("video/",),
+}
+# 任何扩展名都接受的通用类型
+GENERIC_CONTENT_TYPES = ("", "application/octet-stream", "binary/octet-stream")
+# 共享缓存取回的 blob 没有可信的 Content-Type，按文件头检查：类型前缀 → 可接受的文件头
+# （下载的图片可能是 JPEG / WebP 存成 .png，只按大类检查；MP4 / M4A 另按 "ftyp" 识别）
+EXPECTED_MAGIC = {
+    "image/": (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"RIFF", b"BM"),
+    "audio/": (b"ID3", b"\xff", b"RIFF", b"OggS", b"fLaC"),
+    "video/": (),
+}
+
+# 内容去重：不同 URL 指向相同字节时共享一份缓存数据
+CONTENT_DEDUP = True
+
+# 签名过期检查：查询参数中的过期时间（Unix 时间戳）早于当前时间时，不发请求直接判定失败
+CHECK_URL_EXPIRES = True
+URL_EXPIRES_PARAMS = ("x-expires",)
+# 负缓存：失败的 URL 在有效期内再次请求时直接判定失败（0 = 不记录）
+#   资源不存在 / 无权限 / 返回了错误页：COZE_NEGATIVE_TTL（默认 1 天）
+#   5xx / 超时 / 连接错误等临时故障：COZE_NEGATIVE_TTL_TRANSIENT（默认 2 分钟）
+NEGATIVE_TTL = int(os.environ.get("COZE_NEGATIVE_TTL", str(24 * 3600)))
+NEGATIVE_TTL_TRANSIENT = int(os.environ.get("COZE_NEGATIVE_TTL_TRANSIENT", "120"))
+# 视为永久失败的状态码
+NEGATIVE_PERMANENT_STATUS = (400, 401, 403, 404, 410)
+
+# URL 规范化规则（按顺序匹配第一条）
+#   host:           主机名正则
+#   canonical_host: 归一后的主机名（同一对象会从不同 CDN 节点 lf3-/lf26-/p26- 签发）
+#   strip_params:   去掉的易变查询参数（签名、过期时间等）
+URL_CANON_RULES = [
+    {
+        "host": r"^lf\d+-appstore-sign\.oceancloudapi\.com$",
+        "canonical_host": "appstore-sign.oceancloudapi.com",
+        "strip_params": ("x-expires", "x-signature", "lk3s"),
+    },
+    {
+        "host": r"^p\d+-bot-workflow-sign\.byteimg\.com$",
+        "canonical_host": "bot-workflow-sign.byteimg.com",
+        "strip_params": ("x-expires", "x-signature", "rk3s"),
+    },
+]
+
+
+def register_url_rule(host: str, strip_params=(), canonical_host: str = None):
+    """
+    注册一条 URL 规范化规则（优先于内置规则）。
+
+    Args:
+        host: 主机名正则
+        strip_params: 计算缓存 key 时忽略的查询参数
+        canonical_host: 归一后的主机名（None 表示保留原主机名）
+    """
+    URL_CANON_RULES.insert(0, {
+        "host": host,
+        "canonical_host": canonical_host,
+        "strip_params": tuple(strip_params),
+    })
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    URL → 用于计算缓存 key 的规范形式。
+    只对匹配规则的主机做改写；其余 URL 原样返回（安全默认值，不会让不同资源误命中）。
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    for rule in URL_CANON_RULES:
+        if not re.match(rule["host"], host):
+            continue
+        strip = {p.lower() for p in rule.get("strip_params") or ()}
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                 if k.lower() not in strip]
+        netloc = rule.get("canonical_host") or host
+        if parts.port:
+            netloc = f"{netloc}:{parts.port}"
+        return urlunsplit((parts.scheme.lower(), netloc, parts.path, urlencode(query), ""))
+    return url
+
+
+def url_to_cache_key(url: str) -> str:
+    """
+    URL → 缓存文件名（对规范化后的 URL 做 MD5，避免文件名冲突和非法字符）
+    """
+    return hashlib.md5(canonicalize_url(url).encode('utf-8')).hexdigest()
+
+
+# ================= 计数器 =================
+
+_stats = {"hits": 0, "misses": 0, "dedup": 0, "evicted": 0,
+          "bytes_downloaded": 0, "bytes_copied": 0, "bytes_linked": 0, "lock_waits": 0,
+          "expired": 0, "negative_hits": 0,
+          "local_misses": 0, "shared_hits": 0, "shared_misses": 0, "shared_stores": 0, "shared_errors": 0,
+          "bytes_shared": 0}
+_stats_lock = threading.Lock()
+# 当前运行（如一次草稿构建）自己的计数器，由 run_stats() 设置；同一进程内并发的构建各计各的
+_run_stats: contextvars.ContextVar = contextvars.ContextVar("media_cache_run_stats", default=None)
+
+
+def _incr(name: str, n: int = 1):
+    with _stats_lock:
+        _stats[name] += n
+        run = _run_stats.get()
+        if run is not None:
+            run[name] += n
+
+
+@contextmanager
+def run_stats():
+    """
+    在此上下文内单独计数：期间 cache_stats() 只返回本次运行的统计，不受同进程其它线程的构建影响。
+    工作线程需用 contextvars.copy_context().run 启动才会计入（见 coze_draft.fetch_media）。
+    """
+    token = _run_stats.set(dict.fromkeys(_stats, 0))
+    try:
+        yield
+    finally:
+        _run_stats.reset(token)
+
+
+def cache_stats() -> dict:
+    """返回缓存统计：run_stats() 内为本次运行的累计，否则为进程内累计（前后两次做差即为其间的数据）"""
+    with _stats_lock:
+        run = _run_stats.get()
+        return dict(_stats if run is None else run)
+
+
+def diff_stats(before: dict, after: dict) -> dict:
+    """两次 cache_stats() 之差"""
+    return {k: after[k] - before.get(k, 0) for k in after}
+
+
+def hit_rate(stats: dict) -> float:
+    """命中率 = (本地命中 + 共享缓存命中) / (同上 + 回源下载)，无请求时为 0"""
+    hits = stats["hits"] + stats.get("shared_hits", 0)
+    total = hits + stats["misses"]
+    return hits / total if total else 0.0
+
+
+def tier_hit_rates(stats: dict) -> dict:
+    """
+    各级缓存的命中率。
+
+    Returns:
+        {"local": 本地命中 / 本地查找, "shared": 共享命中 / 共享查找（出错计为未命中）}，没有查找的一级为 None
+    """
+    local = stats["hits"] + stats["local_misses"]
+    shared = stats["shared_hits"] + stats["shared_misses"] + stats["shared_errors"]
+    return {"local": stats["hits"] / local if local else None,
+            "shared": stats["shared_hits"] / shared if shared else None}
+
+
+# ================= 缓存读写 =================
+
+# 同一缓存文件的下载互斥（并发获取时，重复 URL 只下载一次，其余线程命中缓存）。
+# 缓存文件名 → [线程锁, 使用数]；没有线程使用时即删除，字典大小以并发数为上限
+_cache_locks: dict[str, list] = {}
+_cache_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _cache_lock(name: str):
+    with _cache_locks_guard:
+        entry = _cache_locks.get(name)
+        if entry is None:
+            entry = _cache_locks[name] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _cache_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _cache_locks[name]
+
+
+try:
+    import fcntl
+except ImportError:  # Windows：只保留进程内的线程锁
+    fcntl = None
+
+
+# 跨进程文件锁每个缓存文件一个：CACHE_DIR/locks/{key[:2]}/{key}{ext}.lock，不同文件的下载互不等待。
+# 淘汰缓存文件时顺带删除其锁文件；加锁方拿到锁后会确认锁文件仍在原位，被删掉则重新打开，互斥不会失效
+LOCK_DIR_NAME = "locks"
+
+
+def _lock_path(cache_path: Path) -> Path:
+    return CACHE_DIR / LOCK_DIR_NAME / cache_path.name[:CACHE_SHARD_CHARS] / f"{cache_path.name}.lock"
+
+
+def _flock(lock_path: Path, blocking: bool = True):
+    """
+    打开 lock_path 并加排他 flock，返回打开的文件对象；blocking=False 时拿不到锁返回 None。
+
+    等锁期间锁文件可能被淘汰删除（或删除后又被别人重建），此时持有的是已脱离目录的旧 inode，关闭后重试
+    """
+    while True:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(lock_path, "a+b")
+        try:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if not blocking:
+                    f.close()
+                    return None
+                _incr("lock_waits")
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(f.fileno()).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+        except BaseException:
+            f.close()
+            raise
+        f.close()
+
+
+@contextmanager
+def _file_lock(cache_path: Path):
+    """
+    跨进程互斥：对 cache_path 的锁文件加排他 flock。
+    拿不到锁说明其他进程正在下载同一个文件，阻塞等待其完成（下载自带超时，等待有上限）。
+    进程内同一文件的线程已由 _cache_lock 串行化，这里不再需要进程内的共享与计数。
+    """
+    if fcntl is None:
+        yield
+        return
+    f = _flock(_lock_path(cache_path))
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+
+def _remove_lock_file(cache_path: Path):
+    """删除已淘汰缓存文件的锁文件；有人正持有（正在重新下载）时保留"""
+    if fcntl is None:
+        return
+    lock_path = _lock_path(cache_path)
+    if not lock_path.exists():
+        return
+    f = _flock(lock_path, blocking=False)
+    if f is None:
+        return
+    try:
+        lock_path.unlink(missing_ok=True)
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+
+def blob_path(cache_key: str, ext: str) -> Path:
+    """缓存 key + 扩展名 → 分片后的缓存文件路径 CACHE_DIR/{key[:2]}/{key}{ext}"""
+    return CACHE_DIR / cache_key[:CACHE_SHARD_CHARS] / f"{cache_key}{ext}"
+
+
+def _blob_name(path: Path) -> str:
+    """缓存文件在索引中的名字：相对 CACHE_DIR 的路径（如 "ab/ab12....png"）"""
+    return Path(path).relative_to(CACHE_DIR).as_posix()
+
+
+def _is_shard_dir(path: Path) -> bool:
+    return (path.is_dir() and len(path.name) == CACHE_SHARD_CHARS
+            and all(c in "0123456789abcdef" for c in path.name))
+
+
+# ================= 零拷贝落地 =================
+
+_FICLONE = 0x40049409  # Linux ioctl: 克隆整个文件（Btrfs / XFS / bcachefs）
+_clonefile = None      # macOS libc clonefile(2)（APFS）
+# 已确认不支持某种方式的 (方式, 源设备, 目标设备)，避免重复尝试失败的系统调用
+_unsupported: set[tuple[str, int, int]] = set()
+# 表示"这种方式在这对设备上不可用"的错误码，只有这些才记入 _unsupported；
+# 其它错误（ENOENT / EEXIST / EMLINK / ENOSPC、与清理并发等）是一次性的，只影响本次调用
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EPERM, errno.EINVAL, errno.ENOTTY}
+
+
+def _reflink(src: Path, dst: Path):
+    """写时复制克隆 src → dst，不支持时抛出 OSError"""
+    global _clonefile
+    if platform.system() == "Darwin":
+        if _clonefile is None:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            _clonefile = libc.clonefile
+            _clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+        if _clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return
+    import fcntl
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+        except OSError:
+            fd.close()
+            dst.unlink(missing_ok=True)
+            raise
+
+
+def clone_tree(src: Path, dst: Path) -> bool:
+    """
+    写时复制克隆整个目录 src → dst（dst 不能已存在）。
+
+    只有 macOS clonefile(2)（APFS）能一次克隆目录；其它系统、跨设备或文件系统不支持时返回 False（不留下 dst）
+    """
+    if platform.system() != "Darwin":
+        return False
+    src, dst = Path(src), Path(dst)
+    key = ("clone_tree", src.stat().st_dev, dst.parent.stat().st_dev)
+    if key in _unsupported or key[1] != key[2]:
+        return False
+    try:
+        _reflink(src, dst)
+    except AttributeError:
+        _unsupported.add(key)
+        return False
+    except OSError as e:
+        if e.errno in _UNSUPPORTED_ERRNOS:
+            _unsupported.add(key)
+        return False
+    return True
+
+
+def materialize(src: Path, dst: Path, mode: str = None, relative_symlink: bool = False) -> str:
+    """
+    把 src（通常是缓存文件）放到 dst，尽量避免复制数据。
+
+    Args:
+        src: 源文件
+        dst: 目标路径（已存在时会被替换）
+        mode: 落地方式，默认 MATERIALIZE_MODE
+        relative_symlink: symlink 方式下使用相对路径（src 与 dst 在同一草稿内时使用，草稿移动后仍有效）
+
+    Returns:
+        实际使用的方式："reflink" / "hardlink" / "symlink" / "copy"
+    """
+    src, dst = Path(src), Path(dst)
+    mode = (mode or MATERIALIZE_MODE).lower()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    size = src.stat().st_size
+    src_dev = src.stat().st_dev
+    dst_dev = dst.parent.stat().st_dev
+
+    candidates = {
+        "auto": ("reflink", "hardlink"),
+        "reflink": ("reflink",),
+        "hardlink": ("hardlink",),
+        "symlink": ("symlink",),
+    }.get(mode, ())
+    for method in candidates:
+        # 硬链接 / 克隆不能跨设备，直接降级
+        if method != "symlink" and src_dev != dst_dev:
+            continue
+        if (method, src_dev, dst_dev) in _unsupported:
+            continue
+        try:
+            if method == "reflink":
+                _reflink(src, dst)
+            elif method == "hardlink":
+                os.link(src, dst)
+            else:
+                target = os.path.relpath(src, dst.parent) if relative_symlink else os.path.abspath(src)
+                os.symlink(target, dst)
+        except AttributeError:  # 系统没有这个 API
+            _unsupported.add((method, src_dev, dst_dev))
+            continue
+        except OSError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                _unsupported.add((method, src_dev, dst_dev))
+            # 一次性的错误：本次换下一种方式（最后复制时，源文件缺失、磁盘已满等错误照常抛出）
+            continue
+        _incr("bytes_linked", size)
+        return method
+
+    shutil.copy2(str(src), str(dst))
+    _incr("bytes_copied", size)
+    return "copy"
+
+
+# ================= 缓存索引 =================
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    name        TEXT PRIMARY KEY,          -- 缓存文件名 {key}{ext}
+    url         TEXT,
+    size        INTEGER NOT NULL,
+    sha256      TEXT,
+    shared      INTEGER NOT NULL DEFAULT 0, -- 1 = 与另一条记录共享数据（硬链接），不计入容量
+    created     REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS blobs_lru ON blobs (last_access);
+CREATE INDEX IF NOT EXISTS blobs_lfu ON blobs (hits, last_access);
+CREATE INDEX IF NOT EXISTS blobs_sha ON blobs (sha256);
+CREATE TABLE IF NOT EXISTS failures (
+    key         TEXT PRIMARY KEY,          -- 原始 URL 的 MD5（重新签发的 URL 视为新的 URL）
+    url         TEXT,
+    reason      TEXT,
+    failed_at   REAL NOT NULL,
+    retry_after REAL NOT NULL,             -- 此时间之前再次请求直接判定失败
+    count       INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('total_bytes', 0);
+CREATE TRIGGER IF NOT EXISTS blobs_ins AFTER INSERT ON blobs BEGIN
+    UPDATE meta SET v = v + NEW.size * (1 - NEW.shared) WHERE k = 'total_bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS blobs_del AFTER DELETE ON blobs BEGIN
+    UPDATE meta SET v = v - OLD.size * (1 - OLD.shared) WHERE k = 'total_bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS blobs_upd AFTER UPDATE OF size, shared ON blobs BEGIN
+    UPDATE meta SET v = v - OLD.size * (1 - OLD.shared) + NEW.size * (1 - NEW.shared)
+    WHERE k = 'total_bytes';
+END;
+"""
+
+# 缓存目录中的临时文件后缀（不登记到索引）
+_TEMP_SUFFIXES = (".link", ".part", ".validator", ".lock")
+
+_index_conn = None
+_index_path = None
+_index_lock = threading.RLock()
+
+
+def _index() -> sqlite3.Connection:
+    """
+    打开（必要时创建）缓存索引。首次创建或布局升级时把目录中已有的缓存文件登记一次。
+    调用方需持有 _index_lock。
+    """
+    global _index_conn, _index_path
+    path = CACHE_DIR / CACHE_INDEX_NAME
+    if _index_conn is not None and _index_path == path:
+        return _index_conn
+    if _index_conn is not None:
+        _index_conn.close()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    is_new = not path.exists()
+    conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # INSERT OR REPLACE 覆盖旧记录时也要触发 blobs_del，保证 total_bytes 准确
+    conn.execute("PRAGMA recursive_triggers=ON")
+    conn.executescript(_INDEX_SCHEMA)
+    _index_conn, _index_path = conn, path
+    layout = conn.execute("SELECT v FROM meta WHERE k = 'layout'").fetchone()
+    if is_new or layout is None:
+        # 新索引或旧的平铺布局：登记 / 迁移已有文件
+        reindex()
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('layout', 2)")
+    return conn
+
+
+def reindex() -> int:
+    """
+    扫描缓存目录，把索引中缺失的文件补登记、把已不存在的文件从索引删除。
+    仅在索引首次创建或手动修复时调用（O(缓存大小)）。返回补登记的文件数。
+    """
+    with _index_lock:
+        conn = _index()
+        now = time.time()
+        added = 0
+        on_disk = set()
+        conn.execute("BEGIN")
+        try:
+            for f in list(CACHE_DIR.iterdir()):
+                if (f.name.startswith(CACHE_INDEX_NAME) or f.suffix in _TEMP_SUFFIXES
+                        or not f.is_file()):
+                    continue
+                # 旧版本的平铺文件：移入分片目录并沿用原索引记录
+                _migrate_flat(conn, f)
+            for shard in CACHE_DIR.iterdir():
+                if not _is_shard_dir(shard):
+                    continue
+                for f in shard.iterdir():
+                    if f.suffix in _TEMP_SUFFIXES or not f.is_file():
+                        continue
+                    name = _blob_name(f)
+                    on_disk.add(name)
+                    st = f.stat()
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO blobs (name, size, created, last_access) VALUES (?, ?, ?, ?)",
+                        (name, st.st_size, st.st_mtime, min(st.st_mtime, now)))
+                    added += cur.rowcount
+            for (name,) in conn.execute("SELECT name FROM blobs").fetchall():
+                if name not in on_disk:
+                    _delete_row(conn, name)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+
+def _migrate_flat(conn: sqlite3.Connection, flat: Path) -> Path:
+    """把平铺布局的缓存文件 CACHE_DIR/{key}{ext} 移到分片目录，并更新索引记录名"""
+    dst = blob_path(flat.stem, flat.suffix)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(flat, dst)
+    if conn.execute("SELECT 1 FROM blobs WHERE name = ?", (_blob_name(dst),)).fetchone():
+        conn.execute("DELETE FROM blobs WHERE name = ?", (flat.name,))
+    else:
+        conn.execute("UPDATE blobs SET name = ? WHERE name = ?", (_blob_name(dst), flat.name))
+    return dst
+
+
+def index_total_bytes() -> int:
+    """索引记录的缓存总大小（共享数据只计一次）"""
+    with _index_lock:
+        return _index().execute("SELECT v FROM meta WHERE k = 'total_bytes'").fetchone()[0]
+
+
+def _record_hit(cache_path: Path):
+    with _index_lock:
+        conn = _index()
+        now = time.time()
+        cur = conn.execute("UPDATE blobs SET last_access = ?, hits = hits + 1 WHERE name = ?",
+                           (now, _blob_name(cache_path)))
+        if cur.rowcount == 0:
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (name, size, created, last_access, hits) VALUES (?, ?, ?, ?, 1)",
+                (_blob_name(cache_path), cache_path.stat().st_size, now, now))
+
+
+def _record_download(cache_path: Path, url: str, digest: str) -> bool:
+    """
+    登记新下载的缓存文件。CONTENT_DEDUP 开启且已有相同 sha256 的数据时，
+    把 cache_path 替换为指向已有数据的硬链接。返回是否与已有内容共享。
+    """
+    shared = False
+    with _index_lock:
+        conn = _index()
+        if CONTENT_DEDUP:
+            row = conn.execute("SELECT name FROM blobs WHERE sha256 = ? AND shared = 0 AND name != ? LIMIT 1",
+                               (digest, _blob_name(cache_path))).fetchone()
+            if row is not None:
+                shared = _link_to(CACHE_DIR / row[0], cache_path)
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO blobs (name, url, size, sha256, shared, created, last_access, hits)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (_blob_name(cache_path), url, cache_path.stat().st_size, digest, int(shared), now, now))
+    return shared
+
+
+# ================= 负缓存 =================
+
+def url_expires_at(url: str):
+    """签名 URL 的过期时间（Unix 时间戳），没有过期参数时返回 None"""
+    for key, value in parse_qsl(urlsplit(url).query):
+        if key.lower() in URL_EXPIRES_PARAMS and value.isdigit():
+            return int(value)
+    return None
+
+
+def url_expired(url: str, now: float = None) -> bool:
+    """签名 URL 是否已过期（CHECK_URL_EXPIRES 关闭时总是 False）"""
+    if not CHECK_URL_EXPIRES:
+        return False
+    expires = url_expires_at(url)
+    return expires is not None and expires <= (now or time.time())
+
+
+def _failure_key(url: str) -> str:
+    return hashlib.md5(url.encode("utf-8")).hexdigest()
+
+
+def _failure_ttl(reason: str) -> int:
+    """按失败原因决定负缓存有效期：永久失败（4xx / 错误页）用 NEGATIVE_TTL，其余用 NEGATIVE_TTL_TRANSIENT"""
+    m = re.match(r"HTTP (\d+)$", reason)
+    if (m and int(m.group(1)) in NEGATIVE_PERMANENT_STATUS) or reason.startswith("Content-Type"):
+        return NEGATIVE_TTL
+    return NEGATIVE_TTL_TRANSIENT
+
+
+def lookup_failure(url: str):
+    """
+    查询负缓存。
+
+    Returns:
+        有效期内的失败记录 {"reason", "failed_at", "retry_after", "count"}，没有时返回 None
+    """
+    with _index_lock:
+        row = _index().execute(
+            "SELECT reason, failed_at, retry_after, count FROM failures WHERE key = ? AND retry_after > ?",
+            (_failure_key(url), time.time())).fetchone()
+    if row is None:
+        return None
+    return dict(zip(("reason", "failed_at", "retry_after", "count"), row))
+
+
+def _record_failure(url: str, reason: str):
+    ttl = _failure_ttl(reason)
+    if ttl <= 0:
+        return
+    now = time.time()
+    with _index_lock:
+        _index().execute(
+            "INSERT INTO failures (key, url, reason, failed_at, retry_after) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET reason = excluded.reason, failed_at = excluded.failed_at,"
+            " retry_after = excluded.retry_after, count = count + 1",
+            (_failure_key(url), url, reason, now, now + ttl))
+
+
+def _clear_failure(url: str):
+    with _index_lock:
+        _index().execute("DELETE FROM failures WHERE key = ?", (_failure_key(url),))
+
+
+def clear_failures(expired_only: bool = False) -> int:
+    """
+    清除负缓存记录，返回清除条数。
+
+    Args:
+        expired_only: 只清除已过有效期的记录
+    """
+    if not (CACHE_DIR / CACHE_INDEX_NAME).exists():
+        return 0
+    with _index_lock:
+        if expired_only:
+            cur = _index().execute("DELETE FROM failures WHERE retry_after <= ?", (time.time(),))
+        else:
+            cur = _index().execute("DELETE FROM failures")
+        return cur.rowcount
+
+
+def _link_to(src: Path, dst: Path) -> bool:
+    """用指向 src 的硬链接原子替换 dst；文件系统不支持时保留 dst 原样"""
+    try:
+        if not (src.exists() and src.stat().st_size > 0) or os.path.samefile(src, dst):
+            return False
+        tmp = dst.with_name(dst.name + ".link")
+        if tmp.exists():
+            tmp.unlink()
+        os.link(src, tmp)
+        os.replace(tmp, dst)
+        return True
+    except OSError:
+        return False
+
+
+def _delete_row(conn: sqlite3.Connection, name: str):
+    """删除一条索引记录；若它是共享数据的持有者，把持有权转给另一条同内容记录"""
+    row = conn.execute("SELECT sha256, shared FROM blobs WHERE name = ?", (name,)).fetchone()
+    conn.execute("DELETE FROM blobs WHERE name = ?", (name,))
+    if row is not None and row[0] and not row[1]:
+        conn.execute("UPDATE blobs SET shared = 0 WHERE name = "
+                     "(SELECT name FROM blobs WHERE sha256 = ? AND shared = 1 LIMIT 1)", (row[0],))
+
+
+def evict(max_bytes: int = None, policy: str = None, older_than: float = None,
+          grace: float = 0, dry_run: bool = False) -> list[tuple[str, int]]:
+    """
+    按索引淘汰缓存文件，非交互，可在下载流程中直接调用。
+
+    Args:
+        max_bytes: 容量预算，淘汰到总大小不超过该值（None = 不按容量淘汰）
+        policy: "lru" / "lfu"（默认 CACHE_EVICTION_POLICY）
+        older_than: 淘汰最近访问早于该时间戳的文件（None = 不按时间淘汰）
+        grace: 最近 grace 秒内访问过的文件不淘汰
+        dry_run: 只返回将被淘汰的文件，不实际删除
+
+    Returns:
+        [(文件名, 释放字节数), ...]
+        候选按 last_access / hits 索引顺序惰性读取，达到预算即停止，代价与淘汰数量成正比。
+    """
+    policy = (policy or CACHE_EVICTION_POLICY).lower()
+    order = "hits, last_access" if policy == "lfu" else "last_access"
+    protect_after = time.time() - grace
+    victims = []
+    picked = set()
+    with _index_lock:
+        conn = _index()
+        total = conn.execute("SELECT v FROM meta WHERE k = 'total_bytes'").fetchone()[0]
+
+        group_left = {}
+
+        def take(name, size, shared, sha):
+            # 共享数据（硬链接）只有在同一内容的所有记录都被淘汰后才真正释放空间
+            freed = 0 if shared else size
+            if sha:
+                if sha not in group_left:
+                    aliases = conn.execute("SELECT COUNT(*) FROM blobs WHERE sha256 = ? AND shared = 1",
+                                           (sha,)).fetchone()[0]
+                    group_left[sha] = aliases + 1 if aliases else None
+                if group_left[sha] is not None:
+                    group_left[sha] -= 1
+                    freed = size if group_left[sha] == 0 else 0
+            victims.append((name, freed))
+            picked.add(name)
+            return freed
+
+        if older_than is not None:
+            cur = conn.execute("SELECT name, size, shared, sha256 FROM blobs WHERE last_access < ?"
+                               " ORDER BY last_access", (min(older_than, protect_after),))
+            for row in cur.fetchall():
+                total -= take(*row)
+        if max_bytes is not None and total > max_bytes:
+            cur = conn.execute(f"SELECT name, size, shared, sha256 FROM blobs WHERE last_access < ?"
+                               f" ORDER BY {order}", (protect_after,))
+            while total > max_bytes:
+                row = cur.fetchone()
+                if row is None:
+                    break
+                if row[0] not in picked:
+                    total -= take(*row)
+            cur.close()
+
+        if not dry_run and victims:
+            conn.execute("BEGIN")
+            try:
+                for name, _ in victims:
+                    (CACHE_DIR / name).unlink(missing_ok=True)
+                    _delete_row(conn, name)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            _incr("evicted", len(victims))
+    if not dry_run:
+        for name, _ in victims:
+            _remove_lock_file(CACHE_DIR / name)
+    return victims
+
+
+def _content_type_ok(content_type: str, ext: str) -> bool:
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    expected = EXPECTED_CONTENT_TYPES.get(ext.lower())
+    if not CHECK_CONTENT_TYPE or expected is None or ctype in GENERIC_CONTENT_TYPES:
+        return True
+    return ctype.startswith(expected)
+
+
+def _magic_ok(path: Path, ext: str) -> bool:
+    """文件头与扩展名的大类相符（HTML / JSON 错误页等不会通过）；未列出的扩展名不检查"""
+    expected = EXPECTED_CONTENT_TYPES.get(ext.lower())
+    if not CHECK_CONTENT_TYPE or expected is None:
+        return True
+    with open(path, "rb") as f:
+        head = f.read(16)
+    for prefix in expected:
+        if prefix in ("audio/", "video/") and head[4:8] == b"ftyp":
+            return True
+        if any(head.startswith(magic) for magic in EXPECTED_MAGIC.get(prefix, ())):
+            return True
+    return False
+
+
+def _parse_content_range(value: str) -> tuple[int, int]:
+    """'bytes 100-199/1000' → (100, 1000)；总长度未知（'*'）时为 -1"""
+    unit, _, spec = (value or "").partition(" ")
+    span, _, total = spec.partition("/")
+    start = int(span.split("-")[0]) if unit == "bytes" and span[:1].isdigit() else -1
+    return start, int(total) if total.isdigit() else -1
+
+
+def _stream_to_part(url: str, part: Path, ext: str) -> tuple[bool, str, bool]:
+    """
+    把 url 下载（或续传）到 part 文件。
+
+    Returns:
+        (是否完整, 失败原因, 是否值得重试)
+    """
+    validator_path = part.with_name(part.name + ".validator")
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity"}
+    if offset >= DOWNLOAD_RESUME_MIN_BYTES:
+        headers["Range"] = f"bytes={offset}-"
+        if validator_path.exists():
+            # 资源已变化时服务器会返回完整的 200，而不是拼接到旧数据上
+            headers["If-Range"] = validator_path.read_text(encoding="utf-8").strip()
+    else:
+        offset = 0
+
+    # 共享连接池：keep-alive 复用连接，5xx/超时按退避策略自动重试
+    with http_pool.get_session().get(url, headers=headers, stream=True,
+                                     timeout=DOWNLOAD_TIMEOUT, allow_redirects=True) as r:
+        if r.status_code == 206 and offset:
+            start, total = _parse_content_range(r.headers.get("Content-Range"))
+            if start != offset:
+                part.unlink(missing_ok=True)
+                return False, f"Content-Range 不匹配 ({r.headers.get('Content-Range')})", True
+            mode = "ab"
+        elif r.status_code == 200:
+            offset, mode = 0, "wb"
+            length = r.headers.get("Content-Length", "")
+            total = int(length) if length.isdigit() else -1
+        elif r.status_code == 416:
+            part.unlink(missing_ok=True)
+            return False, "HTTP 416", True
+        else:
+            return False, f"HTTP {r.status_code}", False
+
+        if not _content_type_ok(r.headers.get("Content-Type"), ext):
+            return False, f"Content-Type 不符: {r.headers.get('Content-Type')}", False
+
+        if mode == "wb":
+            validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            if validator:
+                validator_path.write_text(validator, encoding="utf-8")
+            else:
+                validator_path.unlink(missing_ok=True)
+        written = 0
+        with open(part, mode) as f:
+            try:
+                for chunk in r.iter_content(64 * 1024):
+                    f.write(chunk)
+                    written += len(chunk)
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                # 传输中途断开：收到了数据才值得续传，一个字节都没收到时照常上报
+                if not written:
+                    raise
+                _incr("bytes_downloaded", written)
+                return False, f"传输中断 ({written} 字节): {e}", True
+
+    size = part.stat().st_size
+    _incr("bytes_downloaded", max(0, size - offset))
+    if size <= 0:
+        part.unlink(missing_ok=True)
+        return False, "空文件", False
+    if total >= 0 and size != total:
+        if size > total:
+            part.unlink(missing_ok=True)
+        return False, f"长度不符 ({size}/{total} 字节)", True
+    return True, "", False
+
+
+def _file_sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _download_to_cache(url: str, cache_path: Path) -> tuple[bool, str]:
+    """
+    下载到 {cache_path}.part，校验通过后原子改名为 cache_path。
+    中途断开时保留 .part，在本次调用内或下次运行时用 Range 续传。
+    连接被拒、连接超时等没有收到数据的失败不再重复（每次请求已含 urllib3 的重试），直接返回失败，
+    由调用方登记负缓存（熔断器在连接池中已计数）。
+    """
+    part = cache_path.with_name(cache_path.name + ".part")
+    reason = ""
+    for _ in range(DOWNLOAD_RESUME_ATTEMPTS + 1):
+        try:
+            ok, reason, retry = _stream_to_part(url, part, cache_path.suffix)
+        except http_pool.CircuitOpenError:
+            raise
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            return False, str(e)
+        if ok:
+            os.replace(part, cache_path)
+            part.with_name(part.name + ".validator").unlink(missing_ok=True)
+            return True, ""
+        if not retry:
+            break
+    return False, reason
+
+
+def _admit(url: str, cache_path: Path, sha256: str = None):
+    """登记新进入本地缓存的文件（内容去重），超出容量预算时淘汰；sha256 已知时不再重新计算"""
+    if _record_download(cache_path, url, sha256 or _file_sha256(cache_path)):
+        _incr("dedup")
+    if CACHE_MAX_BYTES and index_total_bytes() > CACHE_MAX_BYTES:
+        evict(CACHE_MAX_BYTES, grace=CACHE_EVICTION_GRACE)
+
+
+def _fill_from_shared(url: str, cache_path: Path) -> bool:
+    """
+    从共享缓存取到 cache_path（先写 .shared.part 再原子改名）。
+
+    Returns:
+        是否命中；共享缓存不可用时只计数，返回 False（继续回源）
+    """
+    part = cache_path.with_name(cache_path.name + ".shared.part")
+    try:
+        sha = shared_cache.fetch(_blob_name(cache_path), part)
+    except Exception:
+        _incr("shared_errors")
+        return False
+    if not sha:
+        _incr("shared_misses")
+        return False
+    # 校验和只说明数据与写入时一致；再按文件头确认不是被写进共享缓存的错误页
+    if not _magic_ok(part, cache_path.suffix):
+        part.unlink(missing_ok=True)
+        _incr("shared_errors")
+        return False
+    os.replace(part, cache_path)
+    _incr("shared_hits")
+    _incr("bytes_shared", cache_path.stat().st_size)
+    _admit(url, cache_path, sha)
+    return True
+
+
+def _write_back(cache_path: Path, sha256: str):
+    """把刚下载的文件及其 sha256 写回共享缓存（同步写入，局域网写入远快于回源）。失败只计数，不影响本次构建"""
+    try:
+        shared_cache.store(_blob_name(cache_path), cache_path, sha256)
+        _incr("shared_stores")
+    except Exception:
+        _incr("shared_errors")
+
+
+def _fill_cache(url: str, cache_path: Path) -> str:
+    """
+    保证 cache_path 中有 url 的数据（命中或下载）。调用方需持有该缓存文件的线程锁与文件锁。
+
+    Returns:
+        "cached"（本地或共享缓存命中）/ "downloaded"，失败时为 "expired" / "negative_cached" / "circuit_open" / "download_failed"
+    """
+    # 旧版本平铺布局的缓存文件：就地迁移到分片目录
+    flat_path = CACHE_DIR / cache_path.name
+    if not cache_path.exists() and flat_path.exists():
+        with _index_lock:
+            _migrate_flat(_index(), flat_path)
+
+    # 步骤 1: 检查缓存是否存在
+    if cache_path.exists() and cache_path.stat().st_size > 0:
+        _incr("hits")
+        _record_hit(cache_path)
+        return "cached"
+    _incr("local_misses")
+
+    # 步骤 2: 查共享二级缓存（签名已过期、近期失败过的 URL 也先查：其它机器可能早已下载过）
+    if shared_cache.enabled() and _fill_from_shared(url, cache_path):
+        return "cached"
+
+    # 步骤 3: 签名已过期、或近期失败过的 URL 不发请求
+    if url_expired(url):
+        _incr("expired")
+        return "expired"
+    if lookup_failure(url) is not None:
+        _incr("negative_hits")
+        return "negative_cached"
+
+    # 步骤 4: 下载到缓存（.part → 校验 → 原子改名），并写回共享缓存
+    _incr("misses")
+    try:
+        ok, reason = _download_to_cache(url, cache_path)
+        if not ok:
+            print(f"  下载失败: {reason}")
+            _record_failure(url, reason)
+            return "download_failed"
+        _clear_failure(url)
+
+        sha = _file_sha256(cache_path)
+        if shared_cache.enabled() and shared_cache.SHARED_CACHE_WRITE_BACK:
+            _write_back(cache_path, sha)
+        _admit(url, cache_path, sha)
+        return "downloaded"
+    except http_pool.CircuitOpenError as e:
+        print(f"  跳过下载: {e}")
+        return "circuit_open"
+    except Exception as e:
+        print(f"  下载失败: {e}")
+        return "download_failed"
+
+
+def _cache_path_for(url: str, ext: str) -> Path:
+    """缓存文件路径（确保分片目录存在）"""
+    cache_path = blob_path(url_to_cache_key(url), ext)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    return cache_path
+
+
+def prefetch(url: str, file_type: str) -> tuple[bool, str]:
+    """
+    预取：只把 URL 下载到全局缓存，不落地到草稿（之后构建草稿时直接命中缓存）。
+
+    Args:
+        url: 资源 URL
+        file_type: 文件类型（必须与构建草稿时一致，如图片 "png"、音频 "mp3"，否则缓存文件名不同）
+
+    Returns:
+        (是否成功, 状态信息)，状态与 get_cached_or_download 相同（没有 "exists" / "copy_failed"）
+    """
+    if not url:
+        return False, "empty_url"
+    cache_path = _cache_path_for(url, f".{file_type.lstrip('.')}")
+    with _cache_lock(cache_path.name), _file_lock(cache_path):
+        status = _fill_cache(url, cache_path)
+    return status in ("cached", "downloaded"), status
+
+
+def get_cached_or_download(url: str, target_path: Path, file_type: str = "media") -> tuple[bool, str]:
+    """
+    智能下载：先检查全局缓存，存在则复制，不存在则下载并缓存。
+
+    Args:
+        url: 资源 URL
+        target_path: 目标保存路径（草稿 materials/ 目录下）
+        file_type: 文件类型（用于确定扩展名，如 "png", "mp3"）
+
+    Returns:
+        (是否成功, 状态信息): 成功为 "exists" / "cached" / "downloaded"；
+        失败为 "empty_url" / "expired"（签名已过期）/ "negative_cached"（近期失败过）/
+        "circuit_open"（主机熔断中）/ "download_failed" / "copy_failed"
+    """
+    target_path = Path(target_path)
+
+    # 如果目标已存在且有效，直接返回
+    if target_path.exists() and target_path.stat().st_size > 0:
+        return True, "exists"
+
+    if not url:
+        return False, "empty_url"
+
+    # 推断扩展名
+    if not file_type or file_type == "media":
+        # 从 URL 或目标路径推断
+        if target_path.suffix:
+            ext = target_path.suffix
+        else:
+            ext = ".dat"
+    else:
+        ext = f".{file_type.lstrip('.')}"
+
+    cache_path = _cache_path_for(url, ext)
+
+    # 进程内线程锁 + 跨进程文件锁：同一文件只有一个下载者，其余等待后命中缓存
+    with _cache_lock(cache_path.name), _file_lock(cache_path):
+        status = _fill_cache(url, cache_path)
+        if status not in ("cached", "downloaded"):
+            return False, status
+
+        # 步骤 4: 从缓存落地到目标（reflink / 硬链接 / 复制）
+        try:
+            materialize(cache_path, target_path)
+            if target_path.exists() and target_path.stat().st_size > 0:
+                return True, status
+            return False, "copy_failed"
+        except Exception as e:
+            print(f"  缓存复制失败: {e}")
+            return False, "copy_failed"
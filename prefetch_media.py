@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+素材预取：Coze 工作流一结束就把素材下载进全局缓存，之后生成草稿时全部命中缓存
+
+- 输入：stdin（单份 JSON 或 JSONL）、JSONL 文件、单个 JSON 文件、或包含 *.json / *.jsonl 的目录
+- 用 safe_parse 提取每份数据中的 image_url / audio_url / bg_image，跨数据去重（按规范化 URL）
+- 按 x-expires 从近到远排序：最先过期的 URL 最先下载；没有过期时间的排在最后
+- 只写入缓存（不创建草稿）；失效的链接在预取时就被发现并登记负缓存
+- --background：在后台进程中预取，命令立即返回，输出写入 logs/prefetch/
+
+用法: python prefetch_media.py [JSONL文件|JSON文件|目录] [--workers N] [--report report.json] [--background] < data.json
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import http_pool
+import media_cache
+import shared_cache
+from batch_draft import iter_payloads
+from coze_draft import SCRIPT_DIR, safe_parse
+
+# ================= 配置 =================
+
+# 并发下载数（可通过环境变量 COZE_PREFETCH_WORKERS 覆盖）
+PREFETCH_WORKERS = int(os.environ.get("COZE_PREFETCH_WORKERS", "8"))
+# 后台预取的日志目录
+PREFETCH_LOG_DIR = SCRIPT_DIR / "logs" / "prefetch"
+
+
+def read_stdin_payloads(text: str):
+    """
+    解析 stdin 输入：单份 JSON 对象、JSON 数组，或每行一份数据的 JSONL。
+
+    Yields:
+        (来源标签, 数据 dict 或 None, 解析错误信息或 None)，与 batch_draft.iter_payloads 相同
+    """
+    text = text.strip()
+    if not text:
+        return
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = None
+    if isinstance(data, dict):
+        yield "stdin", data, None
+        return
+    if isinstance(data, list):
+        for i, item in enumerate(data, 1):
+            yield f"stdin[{i}]", item, None if isinstance(item, dict) else "数据不是 JSON 对象"
+        return
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        label = f"stdin:{lineno}"
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield label, None, f"JSON 解析失败: {e}"
+            continue
+        yield label, item, None if isinstance(item, dict) else "数据不是 JSON 对象"
+
+
+def extract_urls(data: dict) -> list[tuple[str, str]]:
+    """
+    提取一份数据中的全部素材 URL。
+
+    Returns:
+        [(url, 文件类型), ...]；文件类型与 build_draft 一致（图片 / bg_image 为 "png"，音频为 "mp3"），
+        保证预取的缓存文件名与构建草稿时相同
+    """
+    urls = []
+    for field, key, file_type in (("image_list", "image_url", "png"),
+                                  ("bg_image", "image_url", "png"),
+                                  ("audio_list", "audio_url", "mp3")):
+        items = safe_parse(data.get(field, []))
+        if isinstance(items, dict):
+            items = [items]
+        for item in items if isinstance(items, list) else []:
+            url = item.get(key, "") if isinstance(item, dict) else ""
+            if url:
+                urls.append((url, file_type))
+    return urls
+
+
+def plan_prefetch(payloads) -> tuple[list[tuple[str, str]], list[dict]]:
+    """
+    汇总多份数据的 URL：去重，并按 x-expires 从近到远排序。
+
+    Returns:
+        (待预取的 [(url, 文件类型), ...], 无法解析的数据 [{"source", "error"}, ...])
+    """
+    unique = {}
+    errors = []
+    for label, data, error in payloads:
+        if data is None:
+            errors.append({"source": label, "error": error})
+            continue
+        for url, file_type in extract_urls(data):
+            # 同一资源被重新签发时规范化 URL 相同，只保留过期时间最晚的那个
+            key = (media_cache.url_to_cache_key(url), file_type)
+            kept = unique.get(key)
+            if kept is None or (media_cache.url_expires_at(url) or 0) > (media_cache.url_expires_at(kept) or 0):
+                unique[key] = url
+    jobs = [(url, file_type) for (_, file_type), url in unique.items()]
+    jobs.sort(key=lambda job: media_cache.url_expires_at(job[0]) or float("inf"))
+    return jobs, errors
+
+
+def run_prefetch(jobs: list[tuple[str, str]], workers: int = None) -> dict:
+    """
+    并发预取（按 jobs 顺序提交，先到期的先下载）。
+
+    Returns:
+        {"total", "cached", "downloaded", "failed", "seconds", "bytes_downloaded", "failures": [{"url", "status"}],
+         "shared": 共享缓存的命中 / 写回 / 出错数（未启用时为 None）}
+    """
+    workers = max(1, min(workers or PREFETCH_WORKERS, len(jobs) or 1))
+    cache_before = media_cache.cache_stats()
+    start = time.perf_counter()
+
+    def fetch(job):
+        return media_cache.prefetch(*job)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") as pool:
+        results = list(pool.map(fetch, jobs))
+
+    report = {"total": len(jobs), "cached": 0, "downloaded": 0, "failed": 0, "failures": []}
+    for (url, _), (ok, status) in zip(jobs, results):
+        if ok:
+            report[status] += 1
+        else:
+            report["failed"] += 1
+            report["failures"].append({"url": url, "status": status})
+    cache = media_cache.diff_stats(cache_before, media_cache.cache_stats())
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    report["bytes_downloaded"] = cache["bytes_downloaded"]
+    report["shared"] = None if not shared_cache.enabled() else {
+        "hits": cache["shared_hits"], "stores": cache["shared_stores"], "errors": cache["shared_errors"]}
+    return report
+
+
+def print_report(report: dict, errors: list[dict]):
+    print(f"\n预取完成: {report['total']} 个 URL, 耗时 {report['seconds']:.2f}s")
+    print(f"  {report['cached']} 已缓存 / {report['downloaded']} 下载 "
+          f"({report['bytes_downloaded'] / 1024 / 1024:.2f} MB) / {report['failed']} 失败")
+    if report["shared"]:
+        shared = report["shared"]
+        print(f"  共享缓存: {shared['hits']} 命中 / {shared['stores']} 写回"
+              + (f" / {shared['errors']} 出错" if shared["errors"] else ""))
+    for item in report["failures"]:
+        print(f"  ✗ [{item['status']}] {item['url']}")
+    for item in errors:
+        print(f"  ✗ {item['source']}: {item['error']}")
+    for host, failures in http_pool.circuit_state().items():
+        print(f"  熔断: {host} 连续失败 {failures} 次")
+
+
+def start_background(payloads: list, args: list[str]) -> Path:
+    """
+    在脱离当前终端的子进程中预取：数据以 JSONL 经 stdin 传给子进程，输出写入日志文件。
+
+    Returns:
+        日志文件路径
+    """
+    PREFETCH_LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log_path = PREFETCH_LOG_DIR / f"prefetch_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.log"
+    lines = "".join(json.dumps(data, ensure_ascii=False) + "\n" for _, data, _ in payloads if data is not None)
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), *args],
+                                stdin=subprocess.PIPE, stdout=log, stderr=subprocess.STDOUT,
+                                cwd=str(SCRIPT_DIR), start_new_session=True)
+    proc.stdin.write(lines.encode("utf-8"))
+    proc.stdin.close()
+    return log_path
+
+
+if __name__ == "__main__":
+    usage = (f"用法: {sys.argv[0]} [JSONL文件|JSON文件|目录] [--workers N] [--report report.json] [--background]"
+             f" < data.json")
+    source = None
+    workers = None
+    report_path = None
+
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--workers":
+                workers = int(args[i + 1])
+            elif arg == "--report":
+                report_path = Path(args[i + 1])
+            elif not arg.startswith("--") and (i == 0 or args[i - 1] not in ("--workers", "--report")):
+                source = Path(arg)
+    except (ValueError, IndexError):
+        print(usage)
+        sys.exit(1)
+
+    if source is not None and not source.exists():
+        print(f"错误: 输入不存在: {source}")
+        sys.exit(1)
+    payloads = list(iter_payloads(source) if source is not None else read_stdin_payloads(sys.stdin.read()))
+    if not payloads:
+        print("错误: 没有输入数据")
+        sys.exit(1)
+
+    if "--background" in args:
+        # 子进程从 stdin 读取数据
+        child_args = []
+        if workers:
+            child_args += ["--workers", str(workers)]
+        if report_path:
+            child_args += ["--report", str(report_path.resolve())]
+        log_path = start_background(payloads, child_args)
+        print(f"已在后台预取 {len(payloads)} 份数据的素材，日志: {log_path}")
+        sys.exit(0)
+
+    jobs, errors = plan_prefetch(payloads)
+    now = time.time()
+    expiring = [e for e in (media_cache.url_expires_at(url) for url, _ in jobs) if e is not None and e > now]
+    print(f"{len(payloads)} 份数据, {len(jobs)} 个不重复的 URL (workers={workers or PREFETCH_WORKERS})")
+    if expiring:
+        print(f"  最早过期: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(min(expiring)))}"
+              f"（{(min(expiring) - now) / 60:.0f} 分钟后）")
+
+    report = run_prefetch(jobs, workers)
+    print_report(report, errors)
+
+    if report_path:
+        report_path.write_text(json.dumps({**report, "errors": errors}, ensure_ascii=False, indent=2),
+                               encoding="utf-8")
+        print(f"\n报告已写入: {report_path}")
+    sys.exit(1 if report["failed"] or errors else 0)
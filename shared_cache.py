@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+共享二级缓存（可选）：多台构建机共用的素材 blob 存储，位于本地缓存与源站之间
+
+- 查找顺序：本地缓存 → 共享缓存 → 源站；从源站下载的素材写回共享缓存，其它机器直接命中
+- blob 名与本地缓存相同：{key[:2]}/{key}.{ext}，key 为 media_cache.url_to_cache_key（规范化 URL 的 MD5），
+  同一资源被重新签发、甚至签名已过期，只要共享缓存中有就能命中
+- 后端由 COZE_SHARED_CACHE 指定：
+    http(s)://host:port/prefix   GET / PUT {prefix}/{blob 名}（可用下面的 serve、WebDAV 或任意支持 PUT 的静态服务）
+    /mnt/coze_shared             文件系统目录（NFS / SMB 挂载），布局相同
+- 共享缓存不可用时不影响构建：读写失败只计数，继续回源（HTTP 后端走 http_pool，同样受主机熔断保护）
+- 每个 blob 旁边存一份 {blob 名}.sha256，取回时校验，不一致（损坏、被改写）按出错处理；没有校验文件的 blob 视为未命中
+- serve 默认只监听 127.0.0.1，供其它机器访问需显式指定 --host（服务不做鉴权，只应暴露在可信网络中）
+
+用法: python shared_cache.py serve 目录 [--host 127.0.0.1] [--port 8767]
+"""
+import hashlib
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import http_pool
+
+# ================= 配置 =================
+
+# 共享缓存位置：http(s):// 地址或目录；为空表示不启用（可通过环境变量 COZE_SHARED_CACHE 设置）
+SHARED_CACHE = os.environ.get("COZE_SHARED_CACHE", "")
+# 从源站下载后是否写回共享缓存（可通过环境变量 COZE_SHARED_CACHE_WRITE_BACK=0 关闭，只读使用）
+SHARED_CACHE_WRITE_BACK = os.environ.get("COZE_SHARED_CACHE_WRITE_BACK", "1") not in ("", "0")
+# 共享缓存请求超时（秒）：局域网服务，比源站下载超时短
+SHARED_CACHE_TIMEOUT = 10
+# serve 的默认监听地址与端口（8765 是 draft_server、8766 是 stub_media_server，同机运行时互不冲突）
+# 默认只监听本机；服务没有鉴权，局域网共享时用 --host 显式指定
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8767
+# blob 的 sha256 校验文件后缀
+SHA_SUFFIX = ".sha256"
+
+# 合法的 blob 名（serve 只接受这种路径，防止目录穿越）：blob 本身与它的校验文件
+_BLOB_NAME = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{32}\.[A-Za-z0-9]{1,8}(\.sha256)?$")
+_SHA = re.compile(r"^[0-9a-f]{64}$")
+
+
+def enabled() -> bool:
+    return bool(SHARED_CACHE)
+
+
+def _is_http() -> bool:
+    return SHARED_CACHE.startswith(("http://", "https://"))
+
+
+def _fs_root() -> Path:
+    return Path(SHARED_CACHE[len("file://"):] if SHARED_CACHE.startswith("file://") else SHARED_CACHE)
+
+
+def _blob_url(name: str) -> str:
+    return f"{SHARED_CACHE.rstrip('/')}/{name}"
+
+
+def _read_sha(name: str) -> str:
+    """读取 blob 的校验文件，不存在时返回 ""（视为未命中）"""
+    if not _is_http():
+        try:
+            text = (_fs_root() / f"{name}{SHA_SUFFIX}").read_text(encoding="ascii")
+        except FileNotFoundError:
+            return ""
+    else:
+        r = http_pool.get_session().get(_blob_url(f"{name}{SHA_SUFFIX}"), timeout=SHARED_CACHE_TIMEOUT)
+        if r.status_code == 404:
+            return ""
+        r.raise_for_status()
+        text = r.text
+    sha = text.strip().lower()
+    if not _SHA.match(sha):
+        raise OSError(f"共享缓存校验文件格式错误: {name}{SHA_SUFFIX}")
+    return sha
+
+
+def fetch(name: str, dest: Path) -> str:
+    """
+    从共享缓存取 blob 写入 dest，并按校验文件核对 sha256（调用方负责把 dest 原子改名为缓存文件）。
+
+    Args:
+        name: blob 名（{key[:2]}/{key}.{ext}）
+        dest: 写入位置（已存在时覆盖）
+
+    Returns:
+        命中时为数据的 sha256；未命中（blob 或校验文件不存在）返回 ""。出错时抛出异常，都不留下 dest
+
+    Raises:
+        OSError / requests.RequestException: 共享缓存不可用、数据不完整或校验不一致（调用方计数后回源）
+    """
+    dest = Path(dest)
+    try:
+        expected = _read_sha(name)
+        if not expected:
+            return ""
+        sha = hashlib.sha256()
+        if not _is_http():
+            try:
+                src = open(_fs_root() / name, "rb")
+            except FileNotFoundError:
+                return ""
+            with src, open(dest, "wb") as f:
+                for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                    sha.update(chunk)
+                    f.write(chunk)
+            length = ""
+        else:
+            with http_pool.get_session().get(_blob_url(name), stream=True, timeout=SHARED_CACHE_TIMEOUT,
+                                             headers={"Accept-Encoding": "identity"}) as r:
+                if r.status_code == 404:
+                    return ""
+                r.raise_for_status()
+                length = r.headers.get("Content-Length", "")
+                with open(dest, "wb") as f:
+                    for chunk in r.iter_content(64 * 1024):
+                        sha.update(chunk)
+                        f.write(chunk)
+        size = dest.stat().st_size
+        if size <= 0 or (length.isdigit() and size != int(length)):
+            raise OSError(f"共享缓存返回的数据不完整 ({size}/{length or '?'} 字节)")
+        if sha.hexdigest() != expected:
+            raise OSError(f"共享缓存数据校验失败: {name}")
+        return expected
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+
+
+def _write_fs(name: str, write):
+    """目录后端：write(临时文件) 写入同目录的临时文件后原子改名为 name"""
+    dst = _fs_root() / name
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def store(name: str, src: Path, sha256: str):
+    """
+    把本地缓存文件写入共享缓存，随后写入校验文件（目录后端先写临时文件再原子改名，读者不会看到写了一半的 blob；
+    校验文件最后写入，读者看到它时 blob 已完整）。
+
+    Args:
+        name: blob 名
+        src: 本地缓存文件
+        sha256: src 的 sha256
+
+    Raises:
+        OSError / requests.RequestException: 写入失败（调用方计数后忽略）
+    """
+    src = Path(src)
+    if not _is_http():
+        _write_fs(name, lambda tmp: shutil.copyfile(src, tmp))
+        _write_fs(f"{name}{SHA_SUFFIX}", lambda tmp: tmp.write_text(sha256, encoding="ascii"))
+        return
+
+    session = http_pool.get_session()
+    with open(src, "rb") as f:
+        r = session.put(_blob_url(name), data=f, timeout=SHARED_CACHE_TIMEOUT,
+                        headers={"Content-Length": str(src.stat().st_size),
+                                 "Content-Type": "application/octet-stream"})
+    r.close()
+    r.raise_for_status()
+    r = session.put(_blob_url(f"{name}{SHA_SUFFIX}"), data=sha256.encode("ascii"), timeout=SHARED_CACHE_TIMEOUT,
+                    headers={"Content-Type": "text/plain"})
+    r.close()
+    r.raise_for_status()
+
+
+# ================= 简易 HTTP blob 服务 =================
+
+class BlobRequestHandler(BaseHTTPRequestHandler):
+    """GET / HEAD / PUT /{blob 名}，数据存放在 root 目录中（与目录后端布局相同）"""
+    root: Path = None
+
+    def log_message(self, fmt, *args):
+        sys.stderr.write(f"[shared-cache] {self.address_string()} {fmt % args}\n")
+
+    def _blob(self):
+        name = self.path.split("?", 1)[0].lstrip("/")
+        if not _BLOB_NAME.match(name):
+            self.send_error(400, "invalid blob name")
+            return None
+        return self.root / name
+
+    def do_GET(self):
+        self._send_blob(body=True)
+
+    def do_HEAD(self):
+        self._send_blob(body=False)
+
+    def _send_blob(self, body: bool):
+        path = self._blob()
+        if path is None:
+            return
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            self.send_error(404)
+            return
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            if body:
+                shutil.copyfileobj(f, self.wfile, 64 * 1024)
+
+    def do_PUT(self):
+        path = self._blob()
+        if path is None:
+            return
+        length = self.headers.get("Content-Length", "")
+        if not length.isdigit() or int(length) <= 0:
+            self.send_error(411)
+            return
+        remaining = int(length)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, 64 * 1024))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            if remaining:
+                self.send_error(400, "incomplete body")
+                return
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def serve(root: Path, host: str = SERVE_HOST, port: int = SERVE_PORT) -> ThreadingHTTPServer:
+    """
+    在后台线程启动 blob 服务（局域网共享与测试使用）。
+
+    Returns:
+        server，结束时调用 server.shutdown()；实际端口为 server.server_address[1]（port=0 时随机分配）
+    """
+    root = Path(root).resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    handler = type("Handler", (BlobRequestHandler,), {"root": root})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    usage = f"用法: {sys.argv[0]} serve 目录 [--host {SERVE_HOST}] [--port {SERVE_PORT}]"
+    host = SERVE_HOST
+    port = SERVE_PORT
+
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] != "serve" or args[1].startswith("--"):
+        print(usage)
+        sys.exit(1)
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--host":
+                host = args[i + 1]
+            elif arg == "--port":
+                port = int(args[i + 1])
+    except (ValueError, IndexError):
+        print(usage)
+        sys.exit(1)
+
+    try:
+        server = serve(Path(args[1]), host, port)
+    except OSError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print(f"共享缓存服务已启动: http://{host}:{port} → {Path(args[1]).resolve()}, Ctrl+C 退出")
+    if host in ("127.0.0.1", "localhost", "::1"):
+        print("只监听本机；供其它构建机访问请加 --host 0.0.0.0（或局域网地址），服务没有鉴权，只在可信网络中使用")
+    else:
+        print(f"构建机上设置: export COZE_SHARED_CACHE=http://<本机地址>:{port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("正在停止...")
+        server.shutdown()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+本地素材桩服务器：模拟 Coze 的图片 / 音频 URL，用于在没有 Coze、没有网络的环境下测试草稿生成
+
+- GET /img/{n}.png            生成一张纯色 PNG（颜色随 n 变化，内容互不相同）
+- GET /aud/{n}.mp3?sec=3      生成一段静音音频（WAV 编码，pymediainfo 可解析时长）
+- 路径中包含 "fail" 时返回 500；包含 "html" 时返回 200 的 HTML 错误页（如签名过期页）；
+  包含 "short" 时声明完整的 Content-Length 但只发送一半就断开连接；--fail-rate 让一定比例的 URL 固定返回 500（按路径哈希，结果可复现）
+- --latency 为每个请求附加延迟
+- --payload N 打印一份指向本服务器的 Coze JSON 样例（N 张图 + N 段音频 + N 条字幕）
+
+用法: python stub_media_server.py [--port 8766] [--latency 0.05] [--fail-rate 0.1] [--payload 8]
+"""
+import io
+import json
+import struct
+import sys
+import threading
+import time
+import wave
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# ================= 配置 =================
+
+STUB_HOST = "127.0.0.1"
+STUB_PORT = 8766
+STUB_IMAGE_SIZE = (108, 192)
+STUB_AUDIO_RATE = 8000
+
+
+def make_png(n: int, size: tuple = STUB_IMAGE_SIZE) -> bytes:
+    """生成一张纯色 RGB PNG（不依赖 Pillow）"""
+    w, h = size
+    color = bytes(((n * 37) % 256, (n * 91 + 64) % 256, (n * 53 + 128) % 256))
+    raw = (b"\x00" + color * w) * h
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+def make_audio(seconds: float) -> bytes:
+    """生成一段单声道静音 WAV"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(STUB_AUDIO_RATE)
+        w.writeframes(b"\x00\x00" * int(STUB_AUDIO_RATE * seconds))
+    return buf.getvalue()
+
+
+def make_payload(base_url: str, count: int, seconds: float = 3.0, topic: str = "stub") -> dict:
+    """
+    生成一份指向桩服务器的 Coze JSON 数据。
+    字段格式与 dataSource/ 中的真实数据一致：image_list / audio_list / bg_image 为 JSON 字符串，
+    text_cap / text_timelines 为列表，时间单位为微秒。
+    """
+    step = int(seconds * 1_000_000)
+    timelines = [{"start": i * step, "end": (i + 1) * step} for i in range(count)]
+    images = [{"image_url": f"{base_url}/img/{i}.png", "transition": "叠化", "width": 1920, "height": 1080,
+               "start": i * step, "end": (i + 1) * step, "in_animation": "渐显"}
+              for i in range(count)]
+    audios = [{"audio_url": f"{base_url}/aud/{i}.mp3?sec={seconds}", "duration": step,
+               "start": i * step, "end": (i + 1) * step}
+              for i in range(count)]
+    return {
+        "audio_list": json.dumps(audios, ensure_ascii=False),
+        "bg_image": json.dumps([{"image_url": f"{base_url}/img/{count}.png", "width": 1920, "height": 1080,
+                                 "start": 0, "end": count * step}]),
+        "image_list": json.dumps(images, ensure_ascii=False),
+        "max_time": count * step,
+        "text_cap": [f"第 {i + 1} 条字幕" for i in range(count)],
+        "text_timelines": timelines,
+        "timelines": timelines,
+        "topic": topic,
+        "hook_type": "test",
+        "output_language": "zh",
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlsplit(self.path)
+        name = parts.path.rsplit("/", 1)[-1].split(".")[0]
+        if "fail" in parts.path or zlib.crc32(parts.path.encode()) % 1000 < self.fail_rate * 1000:
+            self.send_response(500)
+            self.end_headers()
+            return
+        try:
+            if parts.path.startswith("/img/"):
+                body, ctype = make_png(int(name)), "image/png"
+            elif parts.path.startswith("/aud/"):
+                seconds = float(parse_qs(parts.query).get("sec", ["3"])[0])
+                body, ctype = make_audio(seconds), "audio/wav"
+            else:
+                raise ValueError(parts.path)
+        except ValueError:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if "html" in parts.path:
+            body, ctype = b"<html><body>link expired</body></html>", "text/html; charset=utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if "short" in parts.path:
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def start_stub_server(port: int = 0, latency: float = 0.0, fail_rate: float = 0.0) -> tuple:
+    """
+    在后台线程启动桩服务器。
+
+    Args:
+        port: 端口（0 表示随机空闲端口）
+        latency: 每个请求的附加延迟（秒）
+        fail_rate: 固定返回 500 的 URL 比例（0~1）
+
+    Returns:
+        (server, base_url)，测试结束后调用 server.shutdown()
+    """
+    handler = type("Handler", (StubHandler,), {"latency": latency, "fail_rate": fail_rate})
+    server = ThreadingHTTPServer((STUB_HOST, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{STUB_HOST}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    usage = f"用法: {sys.argv[0]} [--port 8766] [--latency 0.05] [--fail-rate 0.1] [--payload 8]"
+    port = STUB_PORT
+    latency = 0.0
+    fail_rate = 0.0
+    payload_count = None
+
+    args = sys.argv[1:]
+    try:
+        for i, arg in enumerate(args):
+            if arg == "--port":
+                port = int(args[i + 1])
+            elif arg == "--latency":
+                latency = float(args[i + 1])
+            elif arg == "--fail-rate":
+                fail_rate = float(args[i + 1])
+            elif arg == "--payload":
+                payload_count = int(args[i + 1])
+    except (ValueError, IndexError):
+        print(usage)
+        sys.exit(1)
+
+    if payload_count is not None:
+        print(json.dumps(make_payload(f"http://{STUB_HOST}:{port}", payload_count), ensure_ascii=False))
+        sys.exit(0)
+
+    server, base_url = start_stub_server(port, latency, fail_rate)
+    print(f"桩服务器已启动: {base_url} (延迟 {latency}s, 失败率 {fail_rate:.0%}), Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
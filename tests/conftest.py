@@ -0,0 +1,35 @@
+"""
+测试公共夹具：仓库根目录加入 sys.path；桩素材服务器；每个测试独立的缓存目录
+
+运行: python -m pytest -q
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import http_pool  # noqa: E402
+import media_cache  # noqa: E402
+import shared_cache  # noqa: E402
+from stub_media_server import start_stub_server  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stub_server():
+    """本地桩素材服务器，返回 base_url"""
+    server, base_url = start_stub_server()
+    yield base_url
+    server.shutdown()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """媒体缓存指向临时目录；不使用共享缓存，熔断状态清零"""
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(media_cache, "CACHE_DIR", cache)
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE", "")
+    http_pool.reset_circuits()
+    yield cache
+    http_pool.reset_circuits()
@@ -0,0 +1,142 @@
+"""coze_draft：草稿构建流程（桩服务器 + 临时的剪映草稿目录）"""
+import contextlib
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import coze_draft
+import draft_update
+import draft_writer
+import image_normalize
+import media_cache
+from stub_media_server import make_payload
+
+
+@pytest.fixture
+def draft_root(cache_dir, tmp_path, monkeypatch):
+    """剪映草稿目录与 temp/ 都指向临时目录，返回草稿目录"""
+    root = tmp_path / "drafts"
+    root.mkdir()
+    monkeypatch.setattr(coze_draft, "JIANYING_DRAFT_ROOT", root)
+    monkeypatch.setattr(coze_draft, "SCRIPT_DIR", tmp_path)
+    monkeypatch.setattr(coze_draft, "TEMPLATE_BUNDLE_DIR", tmp_path / "temp" / "template_bundle")
+    monkeypatch.setattr(draft_update, "UPDATE_LOCK_DIR", tmp_path / "temp" / "locks")
+    return root
+
+
+def _staging_dirs(draft_root):
+    return sorted(p.name for p in (draft_root.parent / "temp").iterdir() if p.name not in ("template_bundle", "locks"))
+
+
+def test_failed_build_removes_staging_dirs(draft_root, stub_server, monkeypatch):
+    write_draft = draft_writer.write_draft
+    calls = []
+
+    def fail_second(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        return write_draft(*args, **kwargs)
+
+    monkeypatch.setattr(draft_writer, "write_draft", fail_second)
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(OSError, match="disk full"):
+        coze_draft.build_drafts(make_payload(stub_server, 3, topic="stg"), ["9x16", "16x9", "1x1"],
+                                project_name="stg")
+    assert _staging_dirs(draft_root) == []
+    assert sorted(p.name for p in draft_root.iterdir()) == ["stg_9x16"]
+
+    monkeypatch.setattr(draft_writer, "write_draft", write_draft)
+    with contextlib.redirect_stdout(io.StringIO()):
+        coze_draft.build_drafts(make_payload(stub_server, 3, topic="stg"), ["16x9"], project_name="ok")
+    assert _staging_dirs(draft_root) == []
+
+
+def test_repeated_url_counts_as_cache_hit(draft_root, stub_server):
+    payload = make_payload(stub_server, 3, topic="dup")
+    images = json.loads(payload["image_list"])
+    audios = json.loads(payload["audio_list"])
+    images[2]["image_url"] = images[0]["image_url"]
+    audios[1]["audio_url"] = audios[0]["audio_url"]
+    payload.update(image_list=json.dumps(images), audio_list=json.dumps(audios))
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = coze_draft.build_draft(payload, project_name="dup")["metrics"]
+    # 与逐个下载时相同：首次出现时下载，重复出现的位置命中缓存
+    assert metrics["images"] == {"total": 3, "cached": 1, "downloaded": 2, "reused": 0, "fallback": 0}
+    assert metrics["audios"] == {"total": 3, "cached": 1, "downloaded": 2, "reused": 0, "skipped": 0}
+
+
+def test_concurrent_builds_keep_their_own_metrics(draft_root, stub_server):
+    # draft_server 在同一进程的线程中并发构建：各自的指标只含自己的请求
+    payloads = []
+    for i, n in enumerate((2, 5)):
+        # 两次构建的 URL 互不相同，不会命中对方刚下载的缓存
+        payload = make_payload(stub_server, n, topic=f"m{i}")
+        for field in ("image_list", "bg_image", "audio_list"):
+            payload[field] = payload[field].replace('.png"', f'.png?b={i}"').replace("?sec=", f"?b={i}&sec=")
+        payloads.append(payload)
+    results = [None, None]
+    barrier = threading.Barrier(2)
+
+    def build(i):
+        barrier.wait()
+        results[i] = coze_draft.build_draft(payloads[i], project_name=f"m{i}")["metrics"]
+
+    threads = [threading.Thread(target=build, args=(i,)) for i in range(2)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    for metrics, n in zip(results, (2, 5)):
+        downloaded = [e for e in metrics["urls"] if e["status"] == "downloaded"]
+        assert len(downloaded) >= 2 * n  # 图片 + 音频（+ 背景图）
+        assert metrics["cache"]["misses"] == len(downloaded)
+        assert metrics["connections"]["requests"] == len(downloaded)
+
+
+@pytest.mark.skipif(image_normalize.Image is None, reason="需要 Pillow")
+def test_update_keeps_normalized_images(draft_root, stub_server, monkeypatch):
+    monkeypatch.setattr(image_normalize, "NORMALIZE_IMAGES", True)
+    monkeypatch.setattr(image_normalize, "NORMALIZE_WORKERS", 1)
+    payload = make_payload(stub_server, 3, topic="norm")
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = coze_draft.build_draft(payload, project_name="norm", update=True)
+    materials = draft_root / "norm" / "materials"
+    files = {p.name: p.stat().st_ino for p in materials.iterdir()}
+    assert first["metrics"]["normalize"]["transcoded"] == 3
+    assert not any(name.startswith("image_") and name.endswith(".png") for name in files)
+
+    # 第二次更新：派生图按状态文件沿用，不重新落地、规范化
+    with contextlib.redirect_stdout(io.StringIO()):
+        second = coze_draft.build_draft(payload, project_name="norm", update=True)["metrics"]
+    assert second["images"]["reused"] == 3
+    assert second["normalize"] is None or sum(second["normalize"][k] for k in
+                                              ("resized", "transcoded", "cached", "unchanged")) == 0
+    assert {p.name: p.stat().st_ino for p in materials.iterdir()} == files
+
+
+def test_streaming_registers_shared_material_in_timeline_order(draft_root, stub_server, monkeypatch):
+    # 三段音频内容相同（去重后硬链接到同一份数据）：第一段最后下载完，素材仍记录第一段的文件
+    fetch = media_cache.get_cached_or_download
+
+    def slow_first(url, *args):
+        if "/aud/0." in url:
+            time.sleep(0.3)
+        return fetch(url, *args)
+
+    monkeypatch.setattr(media_cache, "get_cached_or_download", slow_first)
+    monkeypatch.setattr(coze_draft, "STREAM_PREPARE", True)
+    payload = make_payload(stub_server, 3, topic="ord")
+    first_audio = json.loads(payload["audio_list"])[0]["audio_url"]
+    for run in range(2):
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = coze_draft.build_draft(payload, project_name="ord", update=True)["metrics"]
+        content = json.loads((draft_root / "ord" / "draft_content.json").read_text(encoding="utf-8"))
+        assert [a["name"] for a in content["materials"]["audios"]] == \
+            [draft_update.keyed_name("audio", first_audio, "mp3")]
+    # 第二次更新时所有素材都沿用上次的探测结果
+    assert metrics["update"]["materials_probed"] == 0
+    assert metrics["update"]["materials_reused"] == metrics["materials"]["videos"] + metrics["materials"]["audios"]
@@ -0,0 +1,68 @@
+"""draft_package：导出 → 导入后素材路径改写到新的草稿目录"""
+import contextlib
+import io
+import json
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import coze_draft
+import draft_package
+from stub_media_server import make_payload
+
+
+@pytest.fixture
+def built_draft(cache_dir, stub_server, tmp_path, monkeypatch):
+    """用桩服务器的素材在临时的剪映草稿目录中生成一个草稿"""
+    build_root = tmp_path / "build" / "drafts"
+    build_root.mkdir(parents=True)
+    monkeypatch.setattr(coze_draft, "JIANYING_DRAFT_ROOT", build_root)
+    monkeypatch.setattr(coze_draft, "SCRIPT_DIR", tmp_path / "build")
+    monkeypatch.setattr(coze_draft, "TEMPLATE_BUNDLE_DIR", tmp_path / "build" / "temp" / "template_bundle")
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = coze_draft.build_draft(make_payload(stub_server, 3, topic="pkg"), project_name="pkg")
+    return Path(result["path"])
+
+
+def _material_paths(draft_path: Path) -> list[str]:
+    content = json.loads((draft_path / "draft_content.json").read_text(encoding="utf-8"))
+    return [m["path"] for m in content["materials"]["videos"] + content["materials"]["audios"]]
+
+
+def test_export_import_rewrites_material_paths(built_draft, tmp_path):
+    archive = tmp_path / "pkg.zip"
+    exported = draft_package.export_draft(built_draft, archive)
+    assert exported["paths"] > 0
+
+    with zipfile.ZipFile(archive) as zf:
+        packed = zf.read("pkg/draft_content.json").decode("utf-8")
+    assert str(built_draft) not in packed
+    assert f"{draft_package.PATH_TOKEN}/materials/" in packed
+
+    editor_root = tmp_path / "editor" / "drafts"
+    editor_root.mkdir(parents=True)
+    imported = draft_package.import_draft(archive, editor_root, name="renamed")
+    final = editor_root / "renamed"
+    assert imported["path"] == str(final)
+    assert imported["paths"] == exported["paths"]
+
+    paths = _material_paths(final)
+    assert paths and all(p.startswith(f"{final}/materials/") and Path(p).is_file() for p in paths)
+    assert [Path(p).name for p in paths] == [Path(p).name for p in _material_paths(built_draft)]
+    info = json.loads((final / "draft_info.json").read_text(encoding="utf-8"))
+    assert draft_package.PATH_TOKEN not in json.dumps(info, ensure_ascii=False)
+    assert sorted(p.name for p in editor_root.iterdir()) == ["renamed"]
+
+
+def test_import_rejects_package_without_draft_content(tmp_path):
+    archive = tmp_path / "broken.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr(draft_package.MANIFEST_NAME, json.dumps(
+            {"version": draft_package.PACKAGE_VERSION, "token": draft_package.PATH_TOKEN, "name": "d"}))
+        zf.writestr("d/materials/a.png", b"x")
+    root = tmp_path / "drafts"
+    root.mkdir()
+    with pytest.raises(ValueError, match="draft_content.json"):
+        draft_package.import_draft(archive, root)
+    assert list(root.iterdir()) == []
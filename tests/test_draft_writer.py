@@ -0,0 +1,45 @@
+"""draft_writer：与 pyJianYingDraft 的 ScriptFile.dumps() 输出一致"""
+import contextlib
+import copy
+import io
+import json
+
+import pytest
+
+import coze_draft
+import draft_writer
+from stub_media_server import make_payload
+
+
+@pytest.fixture
+def script(cache_dir, tmp_path, monkeypatch):
+    """用桩服务器构建一个草稿，截获写入前的 ScriptFile"""
+    monkeypatch.setattr(coze_draft, "JIANYING_DRAFT_ROOT", tmp_path / "drafts")
+    monkeypatch.setattr(coze_draft, "SCRIPT_DIR", tmp_path)
+    monkeypatch.setattr(coze_draft, "TEMPLATE_BUNDLE_DIR", tmp_path / "temp" / "template_bundle")
+    (tmp_path / "drafts").mkdir()
+    scripts = []
+    write_draft = draft_writer.write_draft
+    monkeypatch.setattr(draft_writer, "write_draft", lambda s, *a, **kw: scripts.append(s) or write_draft(s, *a, **kw))
+    return scripts
+
+
+def test_pinned_version_is_installed():
+    # 升级 pyJianYingDraft 时先对照新版 ScriptFile.dumps() 更新 fill_content 与 PYJIANYINGDRAFT_VERSION
+    assert draft_writer._INSTALLED_VERSION == draft_writer.PYJIANYINGDRAFT_VERSION
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_serialize_matches_script_dumps(script, stub_server, backend):
+    if backend == "orjson" and draft_writer.orjson is None:
+        pytest.skip("未安装 orjson")
+    with contextlib.redirect_stdout(io.StringIO()):
+        coze_draft.build_draft(make_payload(stub_server, 3, topic="wr"), project_name="wr")
+    reference = copy.deepcopy(script[0])
+    expected = reference.dumps()
+
+    content = draft_writer.fill_content(script[0])
+    assert content == json.loads(expected)
+    assert draft_writer.serialize_content(content, compact=False, backend=backend) == expected.encode("utf-8")
+    compact = draft_writer.serialize_content(content, compact=True, backend=backend)
+    assert json.loads(compact) == json.loads(expected)
@@ -0,0 +1,311 @@
+"""media_cache 的单元测试（桩服务器 + 临时缓存目录）"""
+import errno
+import hashlib
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import media_cache
+import shared_cache
+from stub_media_server import make_audio, make_png
+
+
+SIGNED = ("https://lf3-appstore-sign.oceancloudapi.com/ocean-cloud-tos/a.png"
+          "?lk3s=abc&x-expires=1700000000&x-signature=sig%3D&format=png")
+
+
+# ================= URL 规范化 =================
+
+def test_canonicalize_strips_signature_and_cdn_node():
+    same = SIGNED.replace("lf3-", "lf26-").replace("sig%3D", "other").replace("1700000000", "1800000000")
+    assert media_cache.canonicalize_url(SIGNED) == \
+        "https://appstore-sign.oceancloudapi.com/ocean-cloud-tos/a.png?format=png"
+    assert media_cache.url_to_cache_key(SIGNED) == media_cache.url_to_cache_key(same)
+
+
+def test_canonicalize_params_case_insensitive_and_port_kept():
+    url = "https://p26-bot-workflow-sign.byteimg.com:8443/x.mp3?X-Expires=1&RK3S=a&X-Signature=b&id=7"
+    assert media_cache.canonicalize_url(url) == "https://bot-workflow-sign.byteimg.com:8443/x.mp3?id=7"
+
+
+def test_canonicalize_leaves_other_hosts_alone():
+    url = "https://example.com/a.png?x-expires=1&x-signature=2"
+    assert media_cache.canonicalize_url(url) == url
+    assert media_cache.url_to_cache_key(url) != media_cache.url_to_cache_key("https://example.com/a.png")
+
+
+def test_registered_rule_takes_precedence(monkeypatch):
+    monkeypatch.setattr(media_cache, "URL_CANON_RULES", list(media_cache.URL_CANON_RULES))
+    media_cache.register_url_rule(r"^cdn\d\.example\.com$", strip_params=("token",), canonical_host="cdn.example.com")
+    assert media_cache.canonicalize_url("https://CDN2.example.com/a.png?token=1&w=2") == \
+        "https://cdn.example.com/a.png?w=2"
+
+
+# ================= 落地方式 =================
+
+def _failing_link(err, times):
+    link, left = os.link, [times]
+
+    def fake(src, dst):
+        if left[0] > 0:
+            left[0] -= 1
+            raise OSError(err, os.strerror(err))
+        return link(src, dst)
+    return fake
+
+
+def test_transient_link_error_falls_back_for_this_call_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_cache, "_unsupported", set())
+    monkeypatch.setattr(os, "link", _failing_link(errno.EMLINK, 1))
+    src = tmp_path / "src.png"
+    src.write_bytes(make_png(1))
+    assert media_cache.materialize(src, tmp_path / "a.png", mode="hardlink") == "copy"
+    assert media_cache.materialize(src, tmp_path / "b.png", mode="hardlink") == "hardlink"
+    assert media_cache._unsupported == set()
+
+
+def test_unsupported_link_error_is_remembered(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_cache, "_unsupported", set())
+    monkeypatch.setattr(os, "link", _failing_link(errno.EPERM, 1))
+    src = tmp_path / "src.png"
+    src.write_bytes(make_png(1))
+    assert media_cache.materialize(src, tmp_path / "a.png", mode="hardlink") == "copy"
+    assert media_cache.materialize(src, tmp_path / "b.png", mode="hardlink") == "copy"
+    dev = src.stat().st_dev
+    assert media_cache._unsupported == {("hardlink", dev, dev)}
+
+
+# ================= 索引容量 =================
+
+def _insert(conn, name, size, sha=None, shared=0):
+    conn.execute("INSERT OR REPLACE INTO blobs (name, size, sha256, shared, created, last_access)"
+                 " VALUES (?, ?, ?, ?, 0, 0)", (name, size, sha, shared))
+
+
+def test_total_bytes_triggers(cache_dir):
+    with media_cache._index_lock:
+        conn = media_cache._index()
+        _insert(conn, "aa/a.png", 100)
+        _insert(conn, "bb/b.png", 100, sha="x", shared=1)
+        assert media_cache.index_total_bytes() == 100  # 共享数据不计入
+        conn.execute("UPDATE blobs SET shared = 0 WHERE name = 'bb/b.png'")
+        assert media_cache.index_total_bytes() == 200
+        conn.execute("UPDATE blobs SET size = 50 WHERE name = 'aa/a.png'")
+        assert media_cache.index_total_bytes() == 150
+        _insert(conn, "aa/a.png", 70)  # REPLACE 触发 blobs_del + blobs_ins
+        assert media_cache.index_total_bytes() == 170
+        conn.execute("DELETE FROM blobs WHERE name = 'bb/b.png'")
+        assert media_cache.index_total_bytes() == 70
+
+
+def test_delete_row_hands_ownership_to_alias(cache_dir):
+    with media_cache._index_lock:
+        conn = media_cache._index()
+        _insert(conn, "cc/c.png", 10, sha="y")
+        _insert(conn, "dd/d.png", 10, sha="y", shared=1)
+        media_cache._delete_row(conn, "cc/c.png")
+        assert conn.execute("SELECT shared FROM blobs WHERE name = 'dd/d.png'").fetchone() == (0,)
+    assert media_cache.index_total_bytes() == 10
+
+
+# ================= 去重组淘汰 =================
+
+def _age(name, when):
+    with media_cache._index_lock:
+        media_cache._index().execute("UPDATE blobs SET last_access = ? WHERE name = ?", (when, name))
+
+
+def test_evict_frees_dedup_group_only_with_last_reference(cache_dir, stub_server, tmp_path):
+    urls = [f"{stub_server}/img/1.png", f"{stub_server}/img/1.png?v=2", f"{stub_server}/img/1.png?v=3"]
+    for i, url in enumerate(urls):
+        assert media_cache.get_cached_or_download(url, tmp_path / f"{i}.png", "png") == (True, "downloaded")
+    paths = [media_cache.blob_path(media_cache.url_to_cache_key(url), ".png") for url in urls]
+    names = [media_cache._blob_name(p) for p in paths]
+    size = len(make_png(1))
+    assert paths[0].stat().st_nlink >= 3
+    assert media_cache.index_total_bytes() == size
+
+    # 持有者与一个别名被淘汰：数据仍被第三条记录引用，不释放空间
+    _age(names[0], 1)
+    _age(names[1], 2)
+    victims = media_cache.evict(older_than=100)
+    assert [name for name, _ in victims] == names[:2]
+    assert sum(freed for _, freed in victims) == 0
+    assert not paths[0].exists() and not paths[1].exists()
+    assert paths[2].read_bytes() == make_png(1)
+    assert media_cache.index_total_bytes() == size
+
+    # 最后一条引用被淘汰时才真正释放
+    _age(names[2], 3)
+    assert media_cache.evict(older_than=100) == [(names[2], size)]
+    assert media_cache.index_total_bytes() == 0
+
+
+# ================= 文件锁 =================
+
+def test_lock_file_per_key_removed_on_evict(cache_dir, stub_server, tmp_path):
+    urls = [f"{stub_server}/img/4.png", f"{stub_server}/img/5.png"]
+    for i, url in enumerate(urls):
+        assert media_cache.get_cached_or_download(url, tmp_path / f"{i}.png", "png")[0]
+    paths = [media_cache.blob_path(media_cache.url_to_cache_key(url), ".png") for url in urls]
+    locks = [media_cache._lock_path(p) for p in paths]
+    assert locks[0] != locks[1] and all(p.exists() for p in locks)
+    assert media_cache._cache_locks == {}
+    media_cache.evict(max_bytes=0)
+    assert not any(p.exists() for p in locks)
+
+
+def _unlock(f):
+    media_cache.fcntl.flock(f.fileno(), media_cache.fcntl.LOCK_UN)
+    f.close()
+
+
+@pytest.mark.skipif(media_cache.fcntl is None, reason="需要 fcntl.flock")
+def test_waiter_relocks_after_lock_file_is_replaced(cache_dir):
+    # 等锁期间锁文件被删除、又被新来者重建并锁住：等待者不能锁在旧 inode 上与新来者同时进入
+    path = media_cache.blob_path("ab" * 32, ".png")
+    lock_path = media_cache._lock_path(path)
+    old = media_cache._flock(lock_path)
+    entered = threading.Event()
+
+    def waiter():
+        with media_cache._file_lock(path):
+            entered.set()
+
+    t = threading.Thread(target=waiter)
+    t.start()
+    time.sleep(0.2)
+    lock_path.unlink()
+    new = media_cache._flock(lock_path, blocking=False)
+    assert new is not None
+    _unlock(old)
+    assert not entered.wait(0.3)
+    _unlock(new)
+    assert entered.wait(5)
+    t.join()
+
+
+# ================= .part 下载与校验 =================
+
+def _parts(cache_dir):
+    return sorted(p.name for p in cache_dir.rglob("*.part"))
+
+
+def test_download_renames_part_into_place(cache_dir, stub_server, tmp_path):
+    url = f"{stub_server}/aud/1.mp3?sec=1"
+    assert media_cache.get_cached_or_download(url, tmp_path / "a.mp3", "mp3") == (True, "downloaded")
+    cache_path = media_cache.blob_path(media_cache.url_to_cache_key(url), ".mp3")
+    assert cache_path.read_bytes() == make_audio(1.0) == (tmp_path / "a.mp3").read_bytes()
+    assert _parts(cache_dir) == []
+    assert media_cache.get_cached_or_download(url, tmp_path / "b.mp3", "mp3") == (True, "cached")
+
+
+def test_short_body_keeps_part_and_no_cache_file(cache_dir, stub_server, tmp_path, monkeypatch):
+    # 声明的 Content-Length 只收到一半：不落地、不登记缓存，.part 留给续传；每次都收到了数据，按次数重试
+    calls = []
+    stream = media_cache._stream_to_part
+    monkeypatch.setattr(media_cache, "_stream_to_part", lambda *a: calls.append(a) or stream(*a))
+    url = f"{stub_server}/aud/short/2.mp3?sec=10"
+    assert media_cache.get_cached_or_download(url, tmp_path / "2.mp3", "mp3") == (False, "download_failed")
+    assert len(calls) == media_cache.DOWNLOAD_RESUME_ATTEMPTS + 1
+    cache_path = media_cache.blob_path(media_cache.url_to_cache_key(url), ".mp3")
+    assert not cache_path.exists() and not (tmp_path / "2.mp3").exists()
+    part = cache_path.with_name(cache_path.name + ".part")
+    assert 0 < part.stat().st_size < len(make_audio(10.0))
+    assert media_cache.lookup_failure(url)["reason"].startswith("传输中断")
+    with media_cache._index_lock:
+        assert media_cache._index().execute("SELECT COUNT(*) FROM blobs").fetchone() == (0,)
+
+
+def test_content_type_mismatch_is_rejected_and_negative_cached(cache_dir, stub_server, tmp_path):
+    url = f"{stub_server}/img/html/3.png"
+    assert media_cache.get_cached_or_download(url, tmp_path / "3.png", "png") == (False, "download_failed")
+    assert not media_cache.blob_path(media_cache.url_to_cache_key(url), ".png").exists()
+    assert _parts(cache_dir) == []
+    failure = media_cache.lookup_failure(url)
+    assert failure["reason"].startswith("Content-Type")
+    assert failure["retry_after"] - failure["failed_at"] == pytest.approx(media_cache.NEGATIVE_TTL)
+    assert media_cache.get_cached_or_download(url, tmp_path / "3.png", "png") == (False, "negative_cached")
+
+
+def test_connect_error_is_not_resumed(cache_dir, tmp_path, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    calls = []
+    stream = media_cache._stream_to_part
+    monkeypatch.setattr(media_cache, "_stream_to_part", lambda *a: calls.append(a) or stream(*a))
+    url = f"http://127.0.0.1:{port}/img/5.png"
+    start = time.monotonic()
+    assert media_cache.get_cached_or_download(url, tmp_path / "5.png", "png") == (False, "download_failed")
+    assert len(calls) == 1
+    assert media_cache.lookup_failure(url) is not None
+    assert time.monotonic() - start < media_cache.DOWNLOAD_TIMEOUT
+
+
+# ================= 共享缓存 =================
+
+def _drop_local(url, ext):
+    path = media_cache.blob_path(media_cache.url_to_cache_key(url), ext)
+    with media_cache._index_lock:
+        media_cache._delete_row(media_cache._index(), media_cache._blob_name(path))
+    path.unlink()
+    return path
+
+
+@pytest.mark.parametrize("backend", ["fs", "http"])
+def test_shared_blob_round_trip_with_sha(cache_dir, stub_server, tmp_path, monkeypatch, backend):
+    root = tmp_path / "shared"
+    server = None
+    if backend == "http":
+        server = shared_cache.serve(root, port=0)
+        assert server.server_address[0] == "127.0.0.1"
+        monkeypatch.setattr(shared_cache, "SHARED_CACHE", f"http://127.0.0.1:{server.server_address[1]}")
+    else:
+        monkeypatch.setattr(shared_cache, "SHARED_CACHE", str(root))
+    try:
+        url = f"{stub_server}/img/6.png"
+        assert media_cache.get_cached_or_download(url, tmp_path / "a.png", "png") == (True, "downloaded")
+        name = media_cache._blob_name(media_cache.blob_path(media_cache.url_to_cache_key(url), ".png"))
+        assert (root / f"{name}.sha256").read_text() == media_cache._file_sha256(root / name)
+
+        _drop_local(url, ".png")
+        before = media_cache.cache_stats()
+        assert media_cache.get_cached_or_download(url, tmp_path / "b.png", "png") == (True, "cached")
+        assert media_cache.diff_stats(before, media_cache.cache_stats())["shared_hits"] == 1
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+def test_shared_blob_is_verified_before_use(cache_dir, stub_server, tmp_path, monkeypatch):
+    root = tmp_path / "shared"
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE", str(root))
+    url = f"{stub_server}/img/7.png"
+    assert media_cache.get_cached_or_download(url, tmp_path / "a.png", "png")[0]
+    name = media_cache._blob_name(media_cache.blob_path(media_cache.url_to_cache_key(url), ".png"))
+    blob, sidecar = root / name, root / f"{name}.sha256"
+
+    def fetch_again():
+        path = _drop_local(url, ".png")
+        (tmp_path / "b.png").unlink(missing_ok=True)
+        before = media_cache.cache_stats()
+        assert media_cache.get_cached_or_download(url, tmp_path / "b.png", "png") == (True, "downloaded")
+        assert path.read_bytes() == make_png(7)
+        return media_cache.diff_stats(before, media_cache.cache_stats())
+
+    # 数据被改写：校验和不一致，回源
+    blob.write_bytes(make_png(8))
+    assert fetch_again()["shared_errors"] == 1
+    # 校验和一致但内容是错误页：文件头检查不通过，回源
+    page = b"<html>expired</html>"
+    blob.write_bytes(page)
+    sidecar.write_text(hashlib.sha256(page).hexdigest())
+    assert fetch_again()["shared_errors"] == 1
+    # 没有校验文件：视为未命中
+    sidecar.unlink()
+    stats = fetch_again()
+    assert stats["shared_misses"] == 1 and stats["shared_errors"] == 0
@@ -0,0 +1,91 @@
+"""timeline：排序扫描的重叠 / 空隙报告与修正、超出音频结尾的截断"""
+import timeline
+
+
+def _kinds(issues):
+    return [(i["stream"], i["kind"], i["index"], i.get("other"), i["us"]) for i in issues]
+
+
+def test_scan_reports_overlap_and_gap_in_start_order():
+    issues = []
+    segments = [[2, 5_000, 1_000], [0, 0, 2_000], [1, 1_500, 1_000]]
+    out = timeline._scan("images", segments, issues, fix=False, fill_gaps=True)
+    assert [seg[0] for seg in out] == [0, 1, 2]
+    assert _kinds(issues) == [("images", "overlap", 1, 0, 500), ("images", "gap", 2, 1, 2_500)]
+    assert out == [[0, 0, 2_000], [1, 1_500, 1_000], [2, 5_000, 1_000]]  # 只报告，不修改
+
+
+def test_scan_fix_trims_previous_and_fills_gaps():
+    issues = []
+    segments = [[0, 0, 2_000], [1, 1_500, 1_000], [2, 5_000, 1_000]]
+    out = timeline._scan("images", segments, issues, fix=True, fill_gaps=True)
+    assert out == [[0, 0, 1_500], [1, 1_500, 3_500], [2, 5_000, 1_000]]
+
+
+def test_scan_fix_drops_segment_with_same_start():
+    issues = []
+    out = timeline._scan("captions", [[0, 0, 1_000], [1, 0, 2_000], [2, 1_000, 500]], issues,
+                         fix=True, fill_gaps=False)
+    assert out == [[0, 0, 1_000], [2, 1_000, 500]]
+    assert _kinds(issues) == [("captions", "overlap", 1, 0, 1_000)]
+
+
+def test_scan_ignores_gaps_within_tolerance_and_when_not_filling():
+    issues = []
+    timeline._scan("images", [[0, 0, 1_000], [1, 1_000 + timeline.TOLERANCE_US, 1_000]], issues,
+                   fix=False, fill_gaps=True)
+    timeline._scan("audios", [[0, 0, 1_000], [1, 900_000, 1_000]], issues, fix=False, fill_gaps=False)
+    assert issues == []
+
+
+def test_clip_reports_and_fixes_drift_past_audio_end():
+    issues = []
+    segments = [[0, 0, 1_000_000], [1, 1_000_000, 2_000_000], [2, 3_000_000, 1_000_000]]
+    out = timeline._clip("captions", [list(s) for s in segments], 2_000_000, issues, fix=True)
+    assert out == [[0, 0, 1_000_000], [1, 1_000_000, 1_000_000]]
+    assert _kinds(issues) == [("captions", "drift", 1, None, 1_000_000), ("captions", "drift", 2, None, 2_000_000)]
+
+
+def test_build_timeline_normalizes_mixed_times():
+    images = [{"start": "0", "end": 2_000_000.0}, {"start": 2_000_000, "end": "bad"}]
+    audios = [{"start": 0, "duration": "4000000"}]
+    captions = ["a", "b", "c"]
+    texts = [{"start": 0, "end": "1500000.4"},
+             {"start": 3_000_000, "end": 3_000_000},
+             {"start": 1_500_000, "end": 4_500_000}]
+    tl = timeline.build_timeline(images, audios, captions, texts, fix=False)
+    assert tl["images"] == [(0, 0, 2_000_000), (1, 2_000_000, timeline.DEFAULT_DURATION_US)]
+    assert tl["audios"] == [(0, 0, 4_000_000)]
+    assert tl["captions"] == [(0, 0, 1_500_000), (2, 1_500_000, 3_000_000)]
+    assert tl["counts"] == {"invalid": 2, "overlap": 0, "gap": 0, "drift": 2}
+    assert tl["duration"] == 5_000_000
+    assert not tl["fixed"]
+
+    fixed = timeline.build_timeline(images, audios, captions, texts, fix=True)
+    assert fixed["images"] == [(0, 0, 2_000_000), (1, 2_000_000, 2_000_000)]
+    assert fixed["captions"] == [(0, 0, 1_500_000), (2, 1_500_000, 2_500_000)]
+    assert fixed["duration"] == 4_000_000
+
+
+def test_skipped_audios_do_not_take_part_in_validation():
+    # 两段 audio_url 为空的音频互相重叠：构建时都会跳过，不应拒绝构建，也不计入音频结尾
+    audios = [{"audio_url": "a", "start": 0, "duration": 1_000_000},
+              {"audio_url": "", "start": 500_000, "duration": 9_000_000},
+              {"start": 600_000, "duration": 9_000_000}]
+    skipped = timeline.audios_to_skip(audios)
+    assert skipped == {1, 2}
+    tl = timeline.build_timeline([], audios, ["a"], [{"start": 0, "end": 900_000}], fix=False,
+                                 skipped_audios=skipped)
+    assert tl["audios"] == [(0, 0, 1_000_000)]
+    assert not any(tl["counts"].values())
+    assert tl["duration"] == 1_000_000
+
+
+def test_out_of_range_times_do_not_crash():
+    # 超出 64 位的时间（原来逐字段转换时可以处理）：退回 list，照常报告
+    huge = 2 ** 70
+    tl = timeline.build_timeline([{"start": 0, "end": str(huge)}, {"start": 1.5, "end": 2_000_000}], [], [], [],
+                                 fix=False)
+    assert tl["images"][0] == (0, 0, huge)
+    assert tl["counts"]["overlap"] == 1
+    assert tl["duration"] == huge
@@ -0,0 +1,279 @@
+"""
+时间轴规范化与校验：图片、音频、字幕三条时间轴在构建片段之前一次性整理好
+
+- 每条时间轴的 start / end / duration 按列批量转为整数微秒（全是整数时由 array 在 C 中一次转换，
+  否则逐个 to_int_us），不再在构建片段时逐字段转换
+- 无效区间（end <= start）：图片、音频按 DEFAULT_DURATION_US（3 秒）补齐，字幕跳过，与原来一致
+- 每条时间轴按 start 排序后线性扫描（O(n log n)），发现：
+    overlap  同一轨道上的片段重叠（剪映轨道不允许重叠，pyJianYingDraft 会抛出 SegmentOverlap）
+    gap      图片之间的空隙（成片中出现黑屏）
+    drift    字幕 / 图片超出音频结尾
+- TIMELINE_FIX 开启时自动修正：重叠处截短前一段（同时开始时丢弃后一段）、图片空隙由前一张延长补齐、
+  超出音频结尾的字幕与图片截到音频结尾
+- 总时长在下载素材之前就能算出；轨道按时间顺序加入片段，只需与上一段比较（见 sorted_track）
+
+用法: python timeline.py [--fix] < data.json
+"""
+import os
+import sys
+from array import array
+from operator import itemgetter
+
+from pyJianYingDraft.exceptions import SegmentOverlap
+
+# ================= 配置 =================
+
+# 自动修正重叠 / 空隙 / 超出音频结尾（可通过环境变量 COZE_TIMELINE_FIX=1 开启；默认只报告，有重叠时拒绝构建）
+TIMELINE_FIX = os.environ.get("COZE_TIMELINE_FIX", "0") not in ("", "0")
+# 图片 / 音频区间无效时的时长（微秒）
+DEFAULT_DURATION_US = 3_000_000
+# 小于等于这个值（微秒）的空隙与超出不报告、不修正（浮点秒换算成微秒时的舍入误差）
+TOLERANCE_US = 1_000
+# 打印报告时每类问题最多列出的条数
+REPORT_LIMIT = 5
+
+ISSUE_LABELS = {"invalid": "无效区间", "overlap": "重叠", "gap": "空隙", "drift": "超出音频结尾"}
+STREAM_LABELS = {"images": "图片", "audios": "音频", "captions": "字幕"}
+
+
+def to_int_us(value, default: int = 0) -> int:
+    """将可能为 int/float/数字字符串(含小数) 的时间统一转为微秒整数。"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(round(value))
+    if isinstance(value, str):
+        s = value.strip()
+        if not s:
+            return default
+        try:
+            return int(s)
+        except ValueError:
+            try:
+                return int(round(float(s)))
+            except ValueError:
+                return default
+    try:
+        return int(round(float(value)))
+    except Exception:
+        return default
+
+
+def _pack(values: list):
+    """整数列尽量打包为 array('q')；有超出 64 位的值时保留 list（与逐个转换时一样接受任意大小的整数）"""
+    try:
+        return array("q", values)
+    except OverflowError:
+        return values
+
+
+def to_us_column(values: list):
+    """一列时间值批量转为整数微秒（array('q')，有超出 64 位的值时为 list）"""
+    try:
+        return array("q", values)
+    except (TypeError, OverflowError):
+        return _pack(list(map(to_int_us, values)))
+
+
+def _column(items: list, key: str) -> list:
+    return [item.get(key) if isinstance(item, dict) else None for item in items]
+
+
+def _stream(items: list, use_duration: bool) -> tuple:
+    """一条时间轴的 (starts, durations)；use_duration 时优先取 duration 字段（音频），否则 end - start"""
+    starts = to_us_column(_column(items, "start"))
+    ends = to_us_column(_column(items, "end"))
+    if use_duration:
+        given = to_us_column(_column(items, "duration"))
+        durations = _pack([d if d > 0 else e - s for s, e, d in zip(starts, ends, given)])
+    else:
+        durations = _pack([e - s for s, e in zip(starts, ends)])
+    return starts, durations
+
+
+def _scan(stream: str, segments: list, issues: list, fix: bool, fill_gaps: bool) -> list:
+    """
+    按 start 排序后线性扫描一条轨道，记录重叠（fill_gaps 时也记录空隙），fix 时就地修正。
+
+    Args:
+        segments: [[下标, start, duration], ...]
+
+    Returns:
+        按 start 排序（修正后）的片段
+    """
+    segments.sort(key=itemgetter(1))
+    out = []
+    for seg in segments:
+        if out:
+            prev = out[-1]
+            prev_end = prev[1] + prev[2]
+            if seg[1] < prev_end:
+                issues.append({"stream": stream, "kind": "overlap", "index": seg[0], "other": prev[0],
+                               "us": prev_end - seg[1]})
+                if fix:
+                    if seg[1] == prev[1]:
+                        continue
+                    prev[2] = seg[1] - prev[1]
+            elif fill_gaps and seg[1] - prev_end > TOLERANCE_US:
+                issues.append({"stream": stream, "kind": "gap", "index": seg[0], "other": prev[0],
+                               "us": seg[1] - prev_end})
+                if fix:
+                    prev[2] = seg[1] - prev[1]
+        out.append(seg)
+    return out
+
+
+def _clip(stream: str, segments: list, limit: int, issues: list, fix: bool) -> list:
+    """记录超出 limit（音频结尾）的片段，fix 时截短或丢弃"""
+    out = []
+    for seg in segments:
+        end = seg[1] + seg[2]
+        if end - limit > TOLERANCE_US:
+            issues.append({"stream": stream, "kind": "drift", "index": seg[0], "us": end - limit})
+            if fix:
+                if seg[1] >= limit:
+                    continue
+                seg[2] = limit - seg[1]
+        out.append(seg)
+    return out
+
+
+def build_timeline(images: list, audios: list, captions: list, text_timelines: list, fix: bool = None,
+                   skipped_audios=()) -> dict:
+    """
+    规范化并校验三条时间轴。
+
+    Args:
+        images: image_list（每项含 start / end）
+        audios: audio_list（每项含 start / duration 或 end）
+        captions: text_cap（只用到条数：第 i 条字幕对应 text_timelines[i]）
+        text_timelines: 字幕时间（每项含 start / end）
+        fix: 是否自动修正，None 表示 TIMELINE_FIX
+        skipped_audios: 构建时会跳过的音频下标（如 audio_url 为空），不参与校验与音频结尾的计算
+
+    Returns:
+        {"images" / "audios" / "captions": 按 start 排序的 [(下标, start, duration), ...]，
+         "duration": 总时长（微秒）, "issues": [{"stream", "kind", "index", "other", "us"}, ...],
+         "counts": {问题类型: 数量}, "fixed": 是否已修正}
+        图片包含全部项、音频包含 skipped_audios 以外的项（调用方跳过获取失败的项）；无效的字幕不在结果中
+    """
+    fix = TIMELINE_FIX if fix is None else fix
+    issues = []
+    streams = {}
+    skipped = {"images": (), "audios": set(skipped_audios)}
+    for stream, items, use_duration in (("images", images, False), ("audios", audios, True)):
+        starts, durations = _stream(items, use_duration)
+        segments = []
+        for i, (s, d) in enumerate(zip(starts, durations)):
+            if i in skipped[stream]:
+                continue
+            if d <= 0:
+                issues.append({"stream": stream, "kind": "invalid", "index": i, "us": d})
+                d = DEFAULT_DURATION_US
+            segments.append([i, s, d])
+        streams[stream] = segments
+
+    count = min(len(captions), len(text_timelines))
+    starts, durations = _stream(text_timelines[:count], False)
+    streams["captions"] = []
+    for i, (s, d) in enumerate(zip(starts, durations)):
+        if d <= 0:
+            issues.append({"stream": "captions", "kind": "invalid", "index": i, "us": d})
+            continue
+        streams["captions"].append([i, s, d])
+
+    streams["audios"] = _scan("audios", streams["audios"], issues, fix, fill_gaps=False)
+    streams["images"] = _scan("images", streams["images"], issues, fix, fill_gaps=True)
+    streams["captions"] = _scan("captions", streams["captions"], issues, fix, fill_gaps=False)
+    if streams["audios"]:
+        audio_end = max(s + d for _, s, d in streams["audios"])
+        streams["captions"] = _clip("captions", streams["captions"], audio_end, issues, fix)
+        streams["images"] = _clip("images", streams["images"], audio_end, issues, fix)
+
+    counts = {kind: 0 for kind in ISSUE_LABELS}
+    for issue in issues:
+        counts[issue["kind"]] += 1
+    result = {name: [tuple(seg) for seg in segments] for name, segments in streams.items()}
+    result["duration"] = max((s + d for segments in result.values() for _, s, d in segments), default=0)
+    result.update(issues=issues, counts=counts, fixed=fix)
+    return result
+
+
+def audios_to_skip(audios: list) -> set:
+    """构建时会跳过的音频（audio_url 为空）的下标"""
+    return {i for i, aud in enumerate(audios) if not (isinstance(aud, dict) and aud.get("audio_url"))}
+
+
+def format_issue(issue: dict) -> str:
+    stream = STREAM_LABELS[issue["stream"]]
+    n = issue["index"] + 1
+    if issue["kind"] == "invalid":
+        return f"{stream} [{n}] 时间无效（时长 {issue['us']}us）"
+    if issue["kind"] == "drift":
+        return f"{stream} [{n}] 超出音频结尾 {issue['us'] / 1e6:.3f}s"
+    return f"{stream} [{n}] 与 [{issue['other'] + 1}] {ISSUE_LABELS[issue['kind']]} {issue['us'] / 1e6:.3f}s"
+
+
+def report_lines(timeline: dict, limit: int = REPORT_LIMIT) -> list[str]:
+    """时间轴问题的摘要（每类最多列出 limit 条）"""
+    counts = timeline["counts"]
+    if not any(counts.values()):
+        return []
+    lines = ["时间轴: " + " / ".join(f"{counts[k]} {label}" for k, label in ISSUE_LABELS.items() if counts[k])
+             + ("（已修正）" if timeline["fixed"] else "")]
+    shown = dict.fromkeys(ISSUE_LABELS, 0)
+    for issue in timeline["issues"]:
+        if shown[issue["kind"]] < limit:
+            shown[issue["kind"]] += 1
+            lines.append("  " + format_issue(issue))
+    return lines
+
+
+def sorted_track(track):
+    """
+    让轨道按时间顺序加入片段时只与上一段比较。
+
+    pyJianYingDraft 的 Track.add_segment 每加一段都与整条轨道逐段比较是否重叠（O(n²)，
+    一小时的草稿数千段时要数秒）；片段来自 build_timeline 的排序结果时，与上一段不重叠即与全部不重叠。
+    不按时间顺序加入的片段仍走原来的逐段比较。
+    """
+    full_check = track.add_segment
+
+    def add_segment(segment):
+        segments = track.segments
+        if not segments or segment.target_timerange.start < segments[-1].target_timerange.start \
+                or not isinstance(segment, track.accept_segment_type):
+            return full_check(segment)
+        if segments[-1].overlaps(segment):
+            raise SegmentOverlap("New segment overlaps with existing segment [start: {}, end: {}]"
+                                 .format(segment.target_timerange.start, segment.target_timerange.end))
+        segments.append(segment)
+        return track
+
+    track.add_segment = add_segment
+    return track
+
+
+if __name__ == "__main__":
+    import json
+
+    # coze_draft 依赖本模块，在这里导入避免循环导入
+    from coze_draft import safe_parse
+
+    if any(arg not in ("--fix",) for arg in sys.argv[1:]):
+        print(f"用法: {sys.argv[0]} [--fix] < data.json")
+        sys.exit(1)
+    data = json.loads(sys.stdin.read())
+    audios = safe_parse(data.get("audio_list", []))
+    timeline = build_timeline(safe_parse(data.get("image_list", [])), audios,
+                              data.get("text_cap", []) or [], data.get("text_timelines", []) or [],
+                              fix="--fix" in sys.argv[1:], skipped_audios=audios_to_skip(audios))
+    print(f"图片 {len(timeline['images'])} 段 / 音频 {len(timeline['audios'])} 段 / 字幕 {len(timeline['captions'])} 条, "
+          f"总时长 {timeline['duration'] / 1e6:.3f}s")
+    for line in report_lines(timeline, limit=sys.maxsize) or ["时间轴: 无问题"]:
+        print(line)
+    sys.exit(1 if timeline["counts"]["overlap"] and not timeline["fixed"] else 0)